@@ -8,6 +8,10 @@ from routes.auth_routes import auth_bp
 from routes.checkpoint_routes import checkpoint_bp
 from routes.token_routes import token_bp
 from routes.admin_routes import admin_bp
+from routes.api_routes import api_bp
+from services import metrics, slow_queries, assets, events, partitions, archive, columnar, mailer, report_cache, ingest, anomalies, replica
+from commands import register_commands
+import json
 import os
 
 # ---- Flask App Setup ----
@@ -17,12 +21,106 @@ app = Flask(__name__)
 
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# Optional streaming replica for the read-only analytics views. Reads fall back to the primary when it is
+# more than REPLICA_MAX_LAG_SECONDS behind, and for REPLICA_STICKY_SECONDS after a user's own write
+app.config['REPLICA_DATABASE_URI'] = os.getenv('REPLICA_DATABASE_URI')
+if app.config['REPLICA_DATABASE_URI']:
+    app.config['SQLALCHEMY_BINDS'] = {'replica': app.config['REPLICA_DATABASE_URI']}
+app.config['REPLICA_MAX_LAG_SECONDS'] = float(os.getenv('REPLICA_MAX_LAG_SECONDS', '5'))
+app.config['REPLICA_LAG_CHECK_SECONDS'] = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', '2'))
+app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', '10'))
 app.secret_key = os.getenv('SECRET_KEY')
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 
+# Fraction of requests timed for /admin/metrics (0 disables instrumentation)
+app.config['METRICS_SAMPLE_RATE'] = float(os.getenv('METRICS_SAMPLE_RATE', '0'))
+
+# Statements slower than this are kept at /admin/slow_queries (0 disables the log);
+# a sampled fraction of slow SELECTs also gets an EXPLAIN plan on Postgres. ANALYZE re-runs the statement,
+# doubling the cost of the slowest requests, so it is opt-in; prefer auto_explain in production
+app.config['SLOW_QUERY_THRESHOLD_MS'] = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '500'))
+app.config['SLOW_QUERY_EXPLAIN_SAMPLE'] = float(os.getenv('SLOW_QUERY_EXPLAIN_SAMPLE', '0'))
+app.config['SLOW_QUERY_EXPLAIN_ANALYZE'] = os.getenv('SLOW_QUERY_EXPLAIN_ANALYZE', '0') == '1'
+
+# Logs can commit out of id order: ETags count the rows among this many newest ids, and the analytics
+# cache re-fetches ids missing from that window until they appear
+app.config['WATERMARK_TAIL_IDS'] = int(os.getenv('WATERMARK_TAIL_IDS', '10000'))
+
+# Content-hashed, precompressed static assets (built by `flask build-assets`); HTML/JSON above COMPRESS_MIN_SIZE bytes is compressed per request
+app.config['ASSETS_FINGERPRINT'] = os.getenv('ASSETS_FINGERPRINT', '1') == '1'
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+
+# Live dashboard feed: 'postgres' (LISTEN/NOTIFY), 'local' (single process) or 'auto'
+app.config['EVENTS_BACKEND'] = os.getenv('EVENTS_BACKEND', 'auto')
+app.config['SSE_MAX_SECONDS'] = int(os.getenv('SSE_MAX_SECONDS', '300'))
+# Each open stream holds a gthread thread: keep SSE_MAX_STREAMS below gunicorn's --threads (see render.yaml).
+# Dashboards over the cap poll the JSON API every SSE_POLL_SECONDS instead
+app.config['SSE_MAX_STREAMS'] = int(os.getenv('SSE_MAX_STREAMS', '24'))
+app.config['SSE_POLL_SECONDS'] = int(os.getenv('SSE_POLL_SECONDS', '30'))
+
+# Months of vehicle_logs partitions created ahead at startup on Postgres (-1 disables)
+app.config['PARTITION_PREMAKE_MONTHS'] = int(os.getenv('PARTITION_PREMAKE_MONTHS', '3'))
+
+# Closed months older than ARCHIVE_AFTER_MONTHS move to compressed files under ARCHIVE_DIR
+app.config['ARCHIVE_DIR'] = os.getenv('ARCHIVE_DIR', os.path.join(app.instance_path, 'archive'))
+app.config['ARCHIVE_AFTER_MONTHS'] = int(os.getenv('ARCHIVE_AFTER_MONTHS', '12'))
+
+# Per-worker NumPy copy of vehicle_logs for dashboard slicing, capped at this many MB (0 disables)
+app.config['ANALYTICS_CACHE_MB'] = int(os.getenv('ANALYTICS_CACHE_MB', '0'))
+
+# Month-end statement batches: render processes (0 = one per core) and where ZIPs are kept; the admin
+# download serves the ZIP in STATEMENTS_DIR until the month's logs or reference data change
+app.config['STATEMENT_WORKERS'] = int(os.getenv('STATEMENT_WORKERS', '0'))
+app.config['STATEMENTS_DIR'] = os.getenv('STATEMENTS_DIR', os.path.join(app.instance_path, 'statements'))
+
+# Rendered reports are kept on disk, keyed by their content address, up to REPORT_CACHE_MB (0 disables)
+app.config['REPORT_CACHE_DIR'] = os.getenv('REPORT_CACHE_DIR', os.path.join(app.instance_path, 'report_cache'))
+app.config['REPORT_CACHE_MB'] = int(os.getenv('REPORT_CACHE_MB', '256'))
+
+# Vehicle entries: 'sync' commits each POST on its own; 'group' acknowledges each one only after a
+# shared commit of up to INGEST_GROUP_SIZE entries collected within INGEST_GROUP_WINDOW_MS
+app.config['INGEST_MODE'] = os.getenv('INGEST_MODE', 'sync')
+app.config['INGEST_GROUP_SIZE'] = int(os.getenv('INGEST_GROUP_SIZE', '64'))
+app.config['INGEST_GROUP_WINDOW_MS'] = float(os.getenv('INGEST_GROUP_WINDOW_MS', '5'))
+app.config['INGEST_QUEUE_SIZE'] = int(os.getenv('INGEST_QUEUE_SIZE', '1000'))
+app.config['INGEST_ACK_TIMEOUT'] = float(os.getenv('INGEST_ACK_TIMEOUT', '10'))
+
+# Cloned-plate / token-reuse detection. ANOMALY_TRAVEL_MINUTES is JSON such as {"North|South": 90};
+# other checkpoint pairs use ANOMALY_DEFAULT_TRAVEL_MINUTES (0 = only flag listed pairs)
+app.config['ANOMALY_DETECTION'] = os.getenv('ANOMALY_DETECTION', '1') == '1'
+app.config['ANOMALY_TRAVEL_MINUTES'] = json.loads(os.getenv('ANOMALY_TRAVEL_MINUTES', '{}'))
+app.config['ANOMALY_DEFAULT_TRAVEL_MINUTES'] = float(os.getenv('ANOMALY_DEFAULT_TRAVEL_MINUTES', '30'))
+app.config['ANOMALY_TOKEN_WINDOW_HOURS'] = float(os.getenv('ANOMALY_TOKEN_WINDOW_HOURS', '72'))
+app.config['ANOMALY_MAX_ALERTS'] = int(os.getenv('ANOMALY_MAX_ALERTS', '1000'))
+
+# Report emails go through the email_outbox table; MAIL_BACKEND is smtp, console or memory
+app.config['MAIL_BACKEND'] = os.getenv('MAIL_BACKEND', '')
+app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', '')
+app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', '587'))
+app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
+app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', '1') == '1'
+app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@localhost')
+app.config['MAIL_MAX_ATTEMPTS'] = int(os.getenv('MAIL_MAX_ATTEMPTS', '5'))
+app.config['MAIL_POLL_SECONDS'] = float(os.getenv('MAIL_POLL_SECONDS', '30'))
+app.config['MAIL_SENDER_THREAD'] = os.getenv('MAIL_SENDER_THREAD', '1') == '1'
+
 # ---- Extensions Initialization ----
 db.init_app(app)
+replica.init_app(app)
 migrate = Migrate(app, db)
+metrics.init_app(app)
+slow_queries.init_app(app)
+assets.init_app(app)
+events.init_app(app, db)
+partitions.init_app(app, db)
+archive.init_app(app)
+columnar.init_app(app)
+mailer.init_app(app)
+report_cache.init_app(app)
+ingest.init_app(app)
+anomalies.init_app(app)
 
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
@@ -38,6 +136,10 @@ app.register_blueprint(auth_bp)
 app.register_blueprint(checkpoint_bp)
 app.register_blueprint(token_bp, url_prefix='/token')
 app.register_blueprint(admin_bp, url_prefix='/admin')
+app.register_blueprint(api_bp, url_prefix='/api/v1')
+
+# ---- CLI Commands ----
+register_commands(app)
 
 # ---- Create Tables and Default Admin ----
 with app.app_context():
@@ -0,0 +1,101 @@
+"""Benchmarks for the hot endpoints.
+
+Run from the repository root::
+
+    pip install -r benchmarks/requirements.txt
+    BENCH_SCALE=10k python -m pytest benchmarks
+
+Results are saved as JSON under ``.benchmarks/``; compare two runs with
+``--benchmark-compare`` or write a specific file with ``--benchmark-json``.
+"""
+import pytest
+
+
+def _ok(response):
+    assert response.status_code == 200, response.status_code
+    return response
+
+
+# ---------------------
+# Admin dashboard
+# ---------------------
+def bench_dashboard(benchmark, admin_client):
+    benchmark(lambda: _ok(admin_client.get('/')))
+
+
+def bench_dashboard_company_month(benchmark, admin_client, company_user):
+    url = f'/?company_id={company_user.id}&month=6'
+    benchmark(lambda: _ok(admin_client.get(url)))
+
+
+def bench_dashboard_calendar_filters(benchmark, admin_client, is_postgres):
+    if not is_postgres:
+        pytest.skip("week/day filters use Postgres-only functions")
+    benchmark(lambda: _ok(admin_client.get('/?week=23&day=Monday&hour=9')))
+
+
+@pytest.mark.parametrize('path', [
+    '/api/v1/totals',
+    '/api/v1/series/company',
+    '/api/v1/series/checkpoint',
+    '/api/v1/logs?page=1',
+    '/api/v1/logs?page=50&month=6',
+])
+def bench_dashboard_api(benchmark, admin_client, path):
+    benchmark(lambda: _ok(admin_client.get(path)))
+
+
+# ---------------------
+# Reports
+# ---------------------
+@pytest.mark.parametrize('query', [
+    'format=excel',
+    'format=pdf',
+    'format=pdf&include_chart=1',
+    'format=excel&month=6',
+    'format=pdf&include_chart=1&month=6',
+])
+def bench_generate_report(benchmark, admin_client, query):
+    benchmark(lambda: _ok(admin_client.get(f'/generate_report?{query}')))
+
+
+# ---------------------
+# Tokens
+# ---------------------
+def bench_verify_token(benchmark, officer_client, fresh_tokens):
+    tokens = iter(fresh_tokens(200))
+
+    def setup():
+        serial, plate = next(tokens)
+        return (), {'data': {'serial': serial, 'vehicle_plate': plate}}
+
+    def verify(data):
+        response = _ok(officer_client.post('/token/verify_token', data=data))
+        assert b'valid and marked as used' in response.data
+
+    benchmark.pedantic(verify, setup=setup, rounds=200)
+
+
+def bench_purchase_token(benchmark, app, company_client):
+    with app.app_context():
+        from models import CargoType
+        cargo_id = CargoType.query.first().id
+
+    def purchase():
+        response = company_client.post('/token/purchase_token',
+                                       data={'vehicle_plate': 'BENCH 0001', 'cargo_type': cargo_id, 'valid_days': 3})
+        assert response.status_code == 302
+
+    benchmark(purchase)
+
+
+# ---------------------
+# Officer performance
+# ---------------------
+def bench_officer_performance(benchmark, admin_client):
+    benchmark(lambda: _ok(admin_client.get('/admin/officer_performance')))
+
+
+def bench_officer_performance_range(benchmark, admin_client):
+    data = {'start_date': '2000-01-01', 'end_date': '2100-01-01'}
+    benchmark(lambda: _ok(admin_client.post('/admin/officer_performance', data=data)))
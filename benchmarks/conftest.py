@@ -0,0 +1,94 @@
+"""Benchmark fixtures: one seeded database shared by the whole session.
+
+Set BENCH_DATABASE_URI to benchmark against Postgres (the calendar filters
+use Postgres-only functions and are skipped on SQLite) and BENCH_SCALE to
+10k, 1m or 10m. A database that already holds synthetic data is reused.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if os.getenv('BENCH_DATABASE_URI'):
+    os.environ['SQLALCHEMY_DATABASE_URI'] = os.environ['BENCH_DATABASE_URI']
+else:
+    os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ.setdefault('SECRET_KEY', 'benchmark')
+os.environ.setdefault('SLOW_QUERY_THRESHOLD_MS', '0')
+
+from app import app as flask_app  # noqa: E402
+from models import db, User, Token, CargoType  # noqa: E402
+from services import synthetic_data  # noqa: E402
+
+ADMIN_PHONE, ADMIN_PASSWORD = '0973939888', 'admin123'
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        if not User.query.filter(User.email.like('%@synthetic.test')).first():
+            synthetic_data.generate(os.getenv('BENCH_SCALE', '10k'))
+    return flask_app
+
+
+@pytest.fixture(scope='session')
+def is_postgres(app):
+    with app.app_context():
+        return db.engine.dialect.name == 'postgresql'
+
+
+def _login(app, phone, password):
+    client = app.test_client()
+    response = client.post('/login', data={'phone': phone, 'password': password})
+    assert response.status_code == 302, "benchmark login failed"
+    return client
+
+
+def _synthetic_user(app, role):
+    with app.app_context():
+        return User.query.filter(User.role == role, User.email.like('%@synthetic.test')).order_by(User.id).first()
+
+
+@pytest.fixture(scope='session')
+def admin_client(app):
+    return _login(app, ADMIN_PHONE, ADMIN_PASSWORD)
+
+
+@pytest.fixture(scope='session')
+def officer_client(app):
+    return _login(app, _synthetic_user(app, 'officer').phone, synthetic_data.SYNTHETIC_PASSWORD)
+
+
+@pytest.fixture(scope='session')
+def company_user(app):
+    return _synthetic_user(app, 'company')
+
+
+@pytest.fixture(scope='session')
+def company_client(app, company_user):
+    return _login(app, company_user.phone, synthetic_data.SYNTHETIC_PASSWORD)
+
+
+@pytest.fixture
+def fresh_tokens(app, company_user):
+    """Factory for active tokens, one per verify_token round."""
+    def make(count):
+        with app.app_context():
+            cargo = CargoType.query.first()
+            stamp = datetime.utcnow().strftime('%H%M%S%f')
+            tokens = [
+                Token(serial=f'B{stamp}{i:05d}'[:20], vehicle_plate=f'BENCH {i:05d}', cargo_type_id=cargo.id,
+                      price=cargo.price, expiration_date=datetime.utcnow() + timedelta(days=1),
+                      company_id=company_user.id)
+                for i in range(count)
+            ]
+            db.session.add_all(tokens)
+            db.session.commit()
+            return [(t.serial, t.vehicle_plate) for t in tokens]
+    return make
@@ -0,0 +1,380 @@
+"""Concurrent checkpoint load test.
+
+Simulates officers who log in, verify tokens and post vehicle entries while
+admins refresh the dashboard and download reports. Each virtual user is a
+thread with its own cookie session. By default requests go through the Flask
+test client inside this process, so the connection pool can be sampled
+directly. With ``--base-url`` they go over HTTP to a running deployment,
+and pool figures are scraped from ``/admin/metrics``.
+
+The database named by SQLALCHEMY_DATABASE_URI is seeded with synthetic data
+(see ``flask seed-synthetic``) and a pool of fresh tokens before the run::
+
+    SQLALCHEMY_DATABASE_URI=postgresql://... SECRET_KEY=... \\
+        python benchmarks/load_test.py --officers 50 --admins 3 --duration 60 \\
+        --officer-mix verify=1,entry=1 --admin-mix dashboard=6,report_pdf=1,report_excel=1
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ADMIN_PHONE, ADMIN_PASSWORD = '0973939888', 'admin123'
+CSRF_FIELD = re.compile(rb'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+# ---------------------
+# Clients
+# ---------------------
+class TestClientSession:
+    """Virtual user driving the app in-process through Flask's test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        body = response.get_data()
+        return response.status_code, body
+
+
+class HttpSession:
+    """Virtual user driving a running deployment over HTTP."""
+
+    def __init__(self, base_url, timeout=60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None):
+        if method == 'POST' and path == '/login':
+            status, body = self.request('GET', '/login')
+            token = CSRF_FIELD.search(body)
+            data = dict(data, csrf_token=token.group(1).decode()) if token else data
+        encoded = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=encoded, method=method)
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+# ---------------------
+# Results
+# ---------------------
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def record(self, operation, elapsed, ok):
+        with self.lock:
+            self.latencies[operation].append(elapsed)
+            if not ok:
+                self.errors[operation] += 1
+
+    def summary(self, duration):
+        rows = {}
+        for operation, samples in sorted(self.latencies.items()):
+            samples = sorted(samples)
+            rows[operation] = {
+                'requests': len(samples),
+                'errors': self.errors[operation],
+                'error_rate': self.errors[operation] / len(samples),
+                'throughput_rps': len(samples) / duration,
+                'p50_ms': _percentile(samples, 50) * 1000,
+                'p95_ms': _percentile(samples, 95) * 1000,
+                'p99_ms': _percentile(samples, 99) * 1000,
+            }
+        total = sum(len(s) for s in self.latencies.values())
+        errors = sum(self.errors.values())
+        rows['TOTAL'] = {
+            'requests': total,
+            'errors': errors,
+            'error_rate': errors / total if total else 0.0,
+            'throughput_rps': total / duration,
+        }
+        return rows
+
+
+def _percentile(samples, percentile):
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, round(percentile / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+class PoolMonitor(threading.Thread):
+    """Samples connection-pool usage every ``interval`` seconds."""
+
+    def __init__(self, sampler, interval=0.1):
+        super().__init__(daemon=True)
+        self.sampler = sampler
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                sample = self.sampler()
+            except Exception:
+                continue
+            if sample:
+                self.samples.append(sample)
+
+    def summary(self):
+        if not self.samples:
+            return {'samples': 0}
+        checked_out = [s['checked_out'] for s in self.samples]
+        capacity = self.samples[-1]['capacity']
+        saturated = sum(1 for c in checked_out if capacity and c >= capacity)
+        return {
+            'samples': len(self.samples),
+            'capacity': capacity,
+            'max_checked_out': max(checked_out),
+            'mean_checked_out': sum(checked_out) / len(checked_out),
+            'saturated_fraction': saturated / len(self.samples),
+        }
+
+
+def local_pool_sampler(app):
+    from models import db
+
+    with app.app_context():
+        engine = db.engine
+    pool = engine.pool
+    if not hasattr(pool, 'checkedout'):
+        return lambda: None
+    capacity = pool.size() + max(getattr(pool, '_max_overflow', 0), 0)
+    return lambda: {'checked_out': pool.checkedout(), 'capacity': capacity}
+
+
+def remote_pool_sampler(session):
+    pattern = re.compile(rb'^(checkpoint_db_pool_\w+)\{bind="default"\} (\S+)$', re.M)
+
+    def sample():
+        status, body = session.request('GET', '/admin/metrics')
+        if status != 200:
+            return None
+        values = {name.decode(): float(value) for name, value in pattern.findall(body)}
+        if 'checkpoint_db_pool_checked_out' not in values:
+            return None
+        return {'checked_out': values['checkpoint_db_pool_checked_out'],
+                'capacity': values.get('checkpoint_db_pool_capacity', 0)}
+    return sample
+
+
+# ---------------------
+# Virtual users
+# ---------------------
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, session, credentials, mix, stats, deadline, think_time):
+        super().__init__(daemon=True)
+        self.session = session
+        self.credentials = credentials
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.stats = stats
+        self.deadline = deadline
+        self.think_time = think_time
+        self.rng = random.Random()
+
+    def timed(self, operation, method, path, data=None, expect=(200, 302)):
+        start = time.perf_counter()
+        try:
+            status, body = self.session.request(method, path, data)
+            ok = status in expect
+        except Exception:
+            status, body, ok = None, b'', False
+        self.stats.record(operation, time.perf_counter() - start, ok)
+        return status, body
+
+    def run(self):
+        phone, password = self.credentials
+        status, _ = self.timed('login', 'POST', '/login', {'phone': phone, 'password': password}, expect=(302,))
+        if status != 302:
+            return
+        while time.monotonic() < self.deadline:
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            getattr(self, 'do_' + operation)()
+            if self.think_time:
+                time.sleep(self.rng.uniform(0, 2 * self.think_time))
+
+
+class Officer(VirtualUser):
+    def __init__(self, *args, tokens, companies, checkpoint, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tokens = tokens
+        self.companies = companies
+        self.checkpoint = checkpoint
+
+    def do_verify(self):
+        if not self.tokens:
+            return
+        serial, plate = self.tokens.pop()
+        status, body = self.timed('verify_token', 'POST', '/token/verify_token',
+                                  {'serial': serial, 'vehicle_plate': plate})
+        if status == 200 and b'valid and marked as used' not in body:
+            self.stats.record('verify_token_rejected', 0.0, False)
+
+    def do_entry(self):
+        company = self.rng.choice(self.companies)
+        self.timed('entry', 'POST', '/entry', {
+            'number_plate': f'LOAD {self.rng.randint(1000, 9999)}',
+            'company_id': company,
+            'phone': '+260950000000',
+            'email': 'load@synthetic.test',
+            'location': 'Kapiri Mposhi',
+            'checkpoint': self.checkpoint,
+            'amount_paid': '150.00',
+        })
+
+
+class Admin(VirtualUser):
+    def do_dashboard(self):
+        # The page shell plus the API calls its script makes on load
+        self.timed('dashboard', 'GET', '/')
+        for name, path in (('api_totals', '/api/v1/totals'), ('api_series', '/api/v1/series/company'),
+                           ('api_series', '/api/v1/series/checkpoint'), ('api_logs', '/api/v1/logs?page=1')):
+            self.timed(name, 'GET', path)
+
+    def do_report_pdf(self):
+        self.timed('report_pdf', 'GET', '/generate_report?format=pdf&include_chart=1&month=%d' % self.rng.randint(1, 12))
+
+    def do_report_excel(self):
+        self.timed('report_excel', 'GET', '/generate_report?format=excel&month=%d' % self.rng.randint(1, 12))
+
+
+# ---------------------
+# Setup
+# ---------------------
+def prepare(app, officers, tokens_per_officer, scale):
+    """Ensure synthetic accounts exist and mint a private token pool per officer."""
+    from models import db, User, Token, CargoType
+    from services import synthetic_data
+
+    with app.app_context():
+        synthetic = User.query.filter(User.email.like('%@synthetic.test'))
+        if not synthetic.first():
+            synthetic_data.generate(scale)
+        officer_users = synthetic.filter(User.role == 'officer').order_by(User.id).all()
+        if len(officer_users) < officers:
+            raise SystemExit(f"only {len(officer_users)} synthetic officers exist; seed a larger scale")
+        companies = [u.id for u in synthetic.filter(User.role == 'company').all()]
+        cargo = CargoType.query.first()
+
+        run_id = datetime.utcnow().strftime('%d%H%M%S')
+        pools = []
+        for i, officer in enumerate(officer_users[:officers]):
+            pool = []
+            for j in range(tokens_per_officer):
+                serial = f'L{run_id}{i:04d}{j:05d}'[:20]
+                plate = f'LOAD {i:04d}-{j:05d}'[:20]
+                pool.append(Token(serial=serial, vehicle_plate=plate, cargo_type_id=cargo.id, price=cargo.price,
+                                  expiration_date=datetime.utcnow() + timedelta(days=1),
+                                  company_id=random.choice(companies)))
+            db.session.add_all(pool)
+            pools.append((officer.phone, officer.officer_profile.checkpoint or 'Load Test',
+                          [(t.serial, t.vehicle_plate) for t in pool]))
+        db.session.commit()
+        return pools, companies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--officers', type=int, default=20)
+    parser.add_argument('--admins', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds")
+    parser.add_argument('--think-time', type=float, default=0.2, help="mean pause between actions, seconds")
+    parser.add_argument('--officer-mix', default='verify=1,entry=1')
+    parser.add_argument('--admin-mix', default='dashboard=6,report_pdf=1,report_excel=1')
+    parser.add_argument('--tokens-per-officer', type=int, default=500)
+    parser.add_argument('--scale', default='10k', help="synthetic data scale when the database is empty")
+    parser.add_argument('--base-url', help="drive a running server instead of the in-process app")
+    parser.add_argument('--json', help="write the summary to this file")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('SLOW_QUERY_THRESHOLD_MS', '0')
+    from app import app
+    if not args.base_url:
+        app.config['WTF_CSRF_ENABLED'] = False
+
+    pools, companies = prepare(app, args.officers, args.tokens_per_officer, args.scale)
+    new_session = (lambda: HttpSession(args.base_url)) if args.base_url else (lambda: TestClientSession(app))
+
+    if args.base_url:
+        monitor_session = new_session()
+        monitor_session.request('POST', '/login', {'phone': ADMIN_PHONE, 'password': ADMIN_PASSWORD})
+        monitor = PoolMonitor(remote_pool_sampler(monitor_session), interval=1.0)
+    else:
+        monitor = PoolMonitor(local_pool_sampler(app))
+
+    stats = Stats()
+    deadline = time.monotonic() + args.duration
+    officer_mix, admin_mix = parse_mix(args.officer_mix), parse_mix(args.admin_mix)
+    users = [
+        Officer(new_session(), (phone, 'synthetic123'), officer_mix, stats, deadline, args.think_time,
+                tokens=tokens, companies=companies, checkpoint=checkpoint)
+        for phone, checkpoint, tokens in pools
+    ] + [
+        Admin(new_session(), (ADMIN_PHONE, ADMIN_PASSWORD), admin_mix, stats, deadline, args.think_time)
+        for _ in range(args.admins)
+    ]
+
+    started = time.monotonic()
+    monitor.start()
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    monitor.stopped.set()
+    elapsed = time.monotonic() - started
+
+    summary = {'config': vars(args), 'duration_s': elapsed,
+               'operations': stats.summary(elapsed), 'pool': monitor.summary()}
+    print(f"{'operation':<22}{'reqs':>8}{'err%':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in summary['operations'].items():
+        print(f"{name:<22}{row['requests']:>8}{row['error_rate'] * 100:>7.1f}%{row['throughput_rps']:>9.1f}"
+              f"{row.get('p50_ms', 0):>10.1f}{row.get('p95_ms', 0):>10.1f}{row.get('p99_ms', 0):>10.1f}")
+    pool = summary['pool']
+    if pool.get('samples'):
+        print(f"pool: max {pool['max_checked_out']:.0f}/{pool['capacity']:.0f} checked out, "
+              f"mean {pool['mean_checked_out']:.1f}, saturated {pool['saturated_fraction'] * 100:.1f}% of samples")
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(summary, fh, indent=2)
+    return summary
+
+
+if __name__ == '__main__':
+    main()
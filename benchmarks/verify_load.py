@@ -0,0 +1,207 @@
+"""Token verification benchmark: the async API against the sync Flask view.
+
+Verifies a pool of fresh tokens through both paths and compares throughput
+and latency. Each verification consumes one token, so every request is the
+full success path (UPDATE ... RETURNING plus the response).
+
+- sync: ``POST /token/verify_token`` through the Flask app. ``--threads``
+  workers stand in for the gunicorn threads.
+- async: ``POST /verify`` on ``VerifyAPI`` (services/async_verify.py).
+  ``--concurrency`` verifications are kept in flight from one event loop.
+
+By default both run in this process: the Flask test client and direct ASGI
+calls, so no server or network is measured. Use ``--sync-url`` and
+``--async-url`` to drive running deployments instead. Tokens are minted in
+the database named by SQLALCHEMY_DATABASE_URI, as in ``load_test.py``::
+
+    SQLALCHEMY_DATABASE_URI=postgresql://... SECRET_KEY=... \\
+        python benchmarks/verify_load.py --requests 5000 --threads 8 --concurrency 1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import HttpSession, TestClientSession, Stats, prepare  # noqa: E402
+
+
+# ---------------------
+# Sync path
+# ---------------------
+def run_sync(new_session, credentials, tokens, threads, stats):
+    local = threading.local()
+
+    def verify(token):
+        if not hasattr(local, 'session'):
+            local.session = new_session()
+            local.session.request('POST', '/login', {'phone': credentials[0], 'password': credentials[1]})
+        serial, plate = token
+        start = time.perf_counter()
+        try:
+            status, body = local.session.request('POST', '/token/verify_token',
+                                                 {'serial': serial, 'vehicle_plate': plate})
+            ok = status == 200 and b'valid and marked as used' in body
+        except Exception:
+            ok = False
+        stats.record('sync_verify', time.perf_counter() - start, ok)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(verify, tokens))
+    return time.monotonic() - started
+
+
+# ---------------------
+# Async path
+# ---------------------
+class ASGIClient:
+    """Calls the ASGI app directly, without a server."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def post(self, path, cookie, body):
+        scope = {'type': 'http', 'method': 'POST', 'path': path,
+                 'headers': [(b'content-type', b'application/json'), (b'cookie', cookie.encode())]}
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app(scope, receive, send)
+        return sent[0]['status'], sent[1]['body']
+
+
+class AsyncHttpClient:
+    """Minimal HTTP/1.1 client on asyncio streams, one connection per request."""
+
+    def __init__(self, base_url):
+        url = urllib.parse.urlsplit(base_url)
+        self.host, self.ssl = url.hostname, url.scheme == 'https'
+        self.port = url.port or (443 if self.ssl else 80)
+        self.prefix = url.path.rstrip('/')
+
+    async def post(self, path, cookie, body):
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        try:
+            writer.write((f"POST {self.prefix}{path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                          f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                          f"Cookie: {cookie}\r\nConnection: close\r\n\r\n").encode('latin-1') + body)
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        head, _, payload = response.partition(b'\r\n\r\n')
+        return int(head.split(b' ', 2)[1]), payload
+
+
+async def run_async(client, cookie, tokens, concurrency, stats):
+    slots = asyncio.Semaphore(concurrency)
+    in_flight = peak = 0
+
+    async def verify(token):
+        nonlocal in_flight, peak
+        serial, plate = token
+        body = json.dumps({'serial': serial, 'vehicle_plate': plate}).encode()
+        async with slots:
+            in_flight += 1
+            peak = max(peak, in_flight)
+            start = time.perf_counter()
+            try:
+                status, payload = await client.post('/verify', cookie, body)
+                ok = status == 200 and json.loads(payload).get('status') == 'valid'
+            except Exception:
+                ok = False
+            stats.record('async_verify', time.perf_counter() - start, ok)
+            in_flight -= 1
+
+    started = time.monotonic()
+    await asyncio.gather(*(verify(token) for token in tokens))
+    return time.monotonic() - started, peak
+
+
+def session_cookie(session, credentials, cookie_name):
+    """Log in and return the ``name=value`` login cookie to present to the async API."""
+    session.request('POST', '/login', {'phone': credentials[0], 'password': credentials[1]})
+    if isinstance(session, TestClientSession):
+        cookie = session.client.get_cookie(cookie_name)
+    else:
+        jar = next(h.cookiejar for h in session.opener.handlers if hasattr(h, 'cookiejar'))
+        cookie = next((c for c in jar if c.name == cookie_name), None)
+    if cookie is None:
+        raise SystemExit("login failed; no session cookie was issued")
+    return f'{cookie_name}={cookie.value}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=2000, help="verifications per path")
+    parser.add_argument('--threads', type=int, default=8, help="sync workers (gunicorn threads)")
+    parser.add_argument('--concurrency', type=int, default=1000, help="async verifications in flight")
+    parser.add_argument('--pool-size', type=int, default=20, help="in-process async API connection pool")
+    parser.add_argument('--scale', default='10k', help="synthetic data scale when the database is empty")
+    parser.add_argument('--sync-url', help="Flask deployment to drive instead of the in-process app")
+    parser.add_argument('--async-url', help="verify API deployment to drive instead of the in-process app")
+    parser.add_argument('--json', help="write the summary to this file")
+    args = parser.parse_args(argv)
+
+    from app import app
+    from models import db
+    from services.async_verify import VerifyAPI
+
+    if not args.sync_url:
+        app.config['WTF_CSRF_ENABLED'] = False
+    pools, _ = prepare(app, 1, 2 * args.requests, args.scale)
+    phone, _, tokens = pools[0]
+    credentials = (phone, 'synthetic123')
+    sync_tokens, async_tokens = tokens[:args.requests], tokens[args.requests:]
+    new_session = (lambda: HttpSession(args.sync_url)) if args.sync_url else (lambda: TestClientSession(app))
+    cookie_name = app.config.get('SESSION_COOKIE_NAME', 'session')
+
+    stats = Stats()
+    sync_elapsed = run_sync(new_session, credentials, sync_tokens, args.threads, stats)
+
+    if args.async_url:
+        client = AsyncHttpClient(args.async_url)
+        cookie = session_cookie(HttpSession(args.sync_url or args.async_url), credentials, cookie_name)
+    else:
+        with app.app_context():
+            database_uri = db.engine.url.render_as_string(hide_password=False)
+        client = ASGIClient(VerifyAPI(database_uri, app.secret_key, pool_size=args.pool_size, cookie_name=cookie_name))
+        cookie = session_cookie(TestClientSession(app), credentials, cookie_name)
+
+    async def drive():
+        try:
+            return await run_async(client, cookie, async_tokens, args.concurrency, stats)
+        finally:
+            if isinstance(client, ASGIClient):
+                await client.app.engine.dispose()
+    async_elapsed, peak = asyncio.run(drive())
+
+    sync_row = stats.summary(sync_elapsed)['sync_verify']
+    async_row = stats.summary(async_elapsed)['async_verify']
+    summary = {'config': vars(args), 'sync': dict(sync_row, duration_s=sync_elapsed, concurrency=args.threads),
+               'async': dict(async_row, duration_s=async_elapsed, concurrency=peak)}
+    print(f"{'path':<8}{'in flight':>10}{'reqs':>8}{'err%':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name in ('sync', 'async'):
+        row = summary[name]
+        print(f"{name:<8}{row['concurrency']:>10}{row['requests']:>8}{row['error_rate'] * 100:>7.1f}%"
+              f"{row['throughput_rps']:>9.1f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(summary, fh, indent=2)
+    return summary
+
+
+if __name__ == '__main__':
+    main()
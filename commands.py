@@ -0,0 +1,234 @@
+# commands.py
+from datetime import date, datetime
+
+import click
+
+from models import db, EmailOutbox, User
+from services import synthetic_data, assets, partitions, archive, statements, log_import
+
+
+def register_commands(app):
+
+    # ------------------------
+    # flask seed-synthetic
+    # ------------------------
+    @app.cli.command('seed-synthetic')
+    @click.option('--scale', default='10k', show_default=True,
+                  help="Number of vehicle logs: 10k, 1m, 10m or an explicit row count.")
+    @click.option('--days', default=365, show_default=True, help="Days of history to spread logs over.")
+    @click.option('--seed', default=42, show_default=True, help="Random seed for reproducible data.")
+    def seed_synthetic(scale, days, seed):
+        """Fill every table with synthetic checkpoint data."""
+        counts = synthetic_data.generate(scale, days=days, seed=seed)
+        for table, count in counts.items():
+            click.echo(f"{table}: {count:,} rows")
+        click.echo(f"Synthetic users log in with password '{synthetic_data.SYNTHETIC_PASSWORD}'.")
+
+    # ------------------------
+    # flask build-assets
+    # ------------------------
+    @app.cli.command('build-assets')
+    def build_assets():
+        """Fingerprint and precompress static assets into static/dist."""
+        manifest = assets.build(app.static_folder)
+        click.echo(f"{len(manifest)} assets written to static/{assets.DIST_DIR}")
+
+    # ------------------------
+    # flask partitions ...
+    # ------------------------
+    @app.cli.group('partitions')
+    def partitions_group():
+        """Manage the monthly partitions of vehicle_logs (Postgres)."""
+
+    @partitions_group.command('list')
+    def list_partitions():
+        """Show attached monthly partitions and their row counts."""
+        with db.engine.connect() as conn:
+            if not partitions.is_partitioned(conn):
+                click.echo("vehicle_logs is not partitioned on this database.")
+                return
+            for month, name in partitions.list_partitions(conn):
+                rows = conn.execute(db.text(f'SELECT count(*) FROM "{name}"')).scalar()
+                click.echo(f"{month:%Y-%m}  {name}  {rows:,} rows")
+            rows = conn.execute(db.text(f'SELECT count(*) FROM {partitions.DEFAULT_PARTITION}')).scalar()
+            click.echo(f"default  {partitions.DEFAULT_PARTITION}  {rows:,} rows")
+
+    @partitions_group.command('ensure')
+    @click.option('--ahead', default=3, show_default=True, help="Months to create beyond the current one.")
+    def ensure_partitions(ahead):
+        """Create missing partitions up to --ahead months out (run monthly from cron)."""
+        with db.engine.begin() as conn:
+            created = partitions.ensure_partitions(conn, months_ahead=ahead)
+        click.echo(f"Created: {', '.join(created)}" if created else "All partitions already exist.")
+
+    @partitions_group.command('expire')
+    @click.option('--retain-months', default=24, show_default=True, help="Months of history to keep attached.")
+    @click.option('--drop', is_flag=True, help="Drop expired partitions instead of only detaching them.")
+    def expire_partitions(retain_months, drop):
+        """Detach (or drop) partitions older than the retention window."""
+        with db.engine.begin() as conn:
+            expired = partitions.expire_partitions(conn, retain_months, drop=drop)
+        action = "Dropped" if drop else "Detached"
+        click.echo(f"{action}: {', '.join(expired)}" if expired else "Nothing to expire.")
+
+    # ------------------------
+    # flask archive ...
+    # ------------------------
+    @app.cli.group('archive')
+    def archive_group():
+        """Move closed months of vehicle logs to the cold archive."""
+
+    @archive_group.command('list')
+    def list_archive():
+        """Show archived months from the manifest."""
+        log_archive = app.extensions['archive']
+        months = log_archive.manifest['months']
+        if not months:
+            click.echo(f"Nothing archived in {log_archive.directory}.")
+        for key in sorted(months):
+            entry = months[key]
+            click.echo(f"{key}  {entry['rows']:,} rows  ZMW {entry['revenue']:,.2f}  {entry['file']}")
+
+    @archive_group.command('run')
+    @click.option('--after-months', type=int, default=None,
+                  help="Archive months that closed more than this many months ago [ARCHIVE_AFTER_MONTHS].")
+    @click.option('--dry-run', is_flag=True, help="Only list the months that would be archived.")
+    def run_archive(after_months, dry_run):
+        """Archive every closed month older than the cut-off, oldest first."""
+        log_archive = app.extensions['archive']
+        if after_months is None:
+            after_months = app.config['ARCHIVE_AFTER_MONTHS']
+        cutoff = partitions.add_months(partitions.month_start(date.today()), -after_months)
+        with db.engine.connect() as conn:
+            months = archive.closed_months(conn, cutoff)
+        archived = log_archive.manifest['months']
+        for month in months:
+            key = archive.month_key(month)
+            if key in archived:
+                click.echo(f"{key}: already archived but has hot rows; skipped (check for back-dated entries)")
+                continue
+            if dry_run:
+                click.echo(f"{key}: would be archived")
+                continue
+            # One transaction per month: a failure leaves every earlier month archived
+            try:
+                with db.engine.begin() as conn:
+                    _, entry = log_archive.archive_month(conn, month)
+            except Exception:
+                # Settles the pending entry against what the database actually kept
+                with db.engine.begin() as conn:
+                    log_archive.reconcile(conn)
+                raise
+            log_archive.commit_month(key, entry)
+            click.echo(f"{key}: {entry['rows']:,} rows archived")
+        if not months:
+            click.echo("No closed months to archive.")
+
+    # ------------------------
+    # flask statements
+    # ------------------------
+    @app.cli.command('statements')
+    @click.argument('month', required=False)
+    @click.option('--format', 'formats', default='pdf,excel', show_default=True,
+                  help="Comma-separated statement formats: pdf, excel.")
+    @click.option('--workers', type=int, default=None, help="Render processes [STATEMENT_WORKERS or one per core].")
+    @click.option('--output', type=click.Path(dir_okay=False), default=None,
+                  help="ZIP to write [STATEMENTS_DIR/statements_YYYY-MM.zip].")
+    def build_statements(month, formats, workers, output):
+        """Render every company's statement for MONTH (YYYY-MM, default last month) into one ZIP."""
+        if month:
+            try:
+                month = datetime.strptime(month, '%Y-%m').date()
+            except ValueError:
+                raise click.BadParameter("Use YYYY-MM.", param_hint='MONTH')
+        else:
+            month = partitions.add_months(partitions.month_start(date.today()), -1)
+        formats = formats.split(',')
+        output = output or statements.default_path(month, formats)
+        manifest = statements.build_statements(month, output, formats=formats, workers=workers)
+        click.echo(f"{manifest['month']}: {len(manifest['companies'])} companies, "
+                   f"{manifest['vehicles']:,} vehicles, ZMW {manifest['revenue']:,.2f} -> {output}")
+
+    # ------------------------
+    # flask outbox ...
+    # ------------------------
+    @app.cli.group('outbox')
+    def outbox_group():
+        """Inspect and drain the queued report emails."""
+
+    @outbox_group.command('status')
+    def outbox_status():
+        """Count queued emails by status."""
+        rows = db.session.execute(
+            db.select(EmailOutbox.status, db.func.count()).group_by(EmailOutbox.status)
+        ).all()
+        for status, count in sorted(rows):
+            click.echo(f"{status}: {count:,}")
+        if not rows:
+            click.echo("Outbox is empty.")
+
+    @outbox_group.command('send')
+    @click.option('--retry-failed', is_flag=True, help="Queue messages that used up their attempts once more.")
+    def outbox_send(retry_failed):
+        """Deliver every due email now (useful from cron when no web worker is running)."""
+        mailer = app.extensions['mailer']
+        if retry_failed:
+            db.session.execute(
+                db.update(EmailOutbox).where(EmailOutbox.status == 'failed')
+                .values(status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+            )
+            db.session.commit()
+        sent = 0
+        while True:
+            handled = mailer.send_due()
+            if not handled:
+                break
+            sent += handled
+        mailer.transport.close()
+        click.echo(f"Processed {sent:,} emails.")
+
+    # ------------------------
+    # flask import-logs
+    # ------------------------
+    @app.cli.command('import-logs')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--officer', 'officer_phone', default=None, help="Phone of the officer to record the logs under.")
+    @click.option('--dry-run', is_flag=True, help="Validate every row without loading anything.")
+    @click.option('--errors', 'errors_path', type=click.Path(dir_okay=False), default=None,
+                  help="Write the per-row error report to this CSV.")
+    def import_logs(path, officer_phone, dry_run, errors_path):
+        """Stream historical vehicle logs from an .xlsx or .csv file into vehicle_logs."""
+        officer_id = None
+        if officer_phone:
+            officer = User.query.filter_by(phone=officer_phone, role='officer').first()
+            if officer is None:
+                raise click.BadParameter(f"No officer with phone {officer_phone}.", param_hint='--officer')
+            officer_id = officer.id
+        with open(path, 'rb') as fh:
+            try:
+                result = log_import.import_logs(fh, path, officer_id=officer_id, dry_run=dry_run)
+            except log_import.ImportFileError as exc:
+                raise click.ClickException(str(exc))
+        verb = "validated" if dry_run else "imported"
+        click.echo(f"{result.imported:,} of {result.rows:,} rows {verb}; {result.skipped:,} skipped.")
+        if errors_path and result.skipped:
+            with open(errors_path, 'w', newline='') as out:
+                result.error_report(out)
+            click.echo(f"Error report written to {errors_path}")
+        else:
+            for error in result.errors[:20]:
+                click.echo(f"  row {error.row}: {error.message}")
+            if result.skipped > 20:
+                click.echo(f"  ... {result.skipped - 20:,} more (use --errors to write them all)")
+
+    # ------------------------
+    # flask anomalies
+    # ------------------------
+    @app.cli.command('anomalies')
+    @click.option('--hours', default=24 * 7, show_default=True, help="Hours of history to replay.")
+    def scan_anomalies(hours):
+        """Replay recent vehicle logs through the anomaly detector and list the alerts."""
+        raised = app.extensions['anomalies'].rebuild(hours)
+        for alert in raised:
+            click.echo(f"{alert.timestamp:%Y-%m-%d %H:%M}  {alert.kind:<17}  {alert.message}")
+        click.echo(f"{len(raised):,} alerts in the last {hours} hours.")
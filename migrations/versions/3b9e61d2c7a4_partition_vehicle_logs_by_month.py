@@ -0,0 +1,112 @@
+"""Partition vehicle_logs by month
+
+Revision ID: 3b9e61d2c7a4
+Revises: f5c05db86880
+Create Date: 2026-10-19 09:12:41.318204
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9e61d2c7a4'
+down_revision = 'f5c05db86880'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ('id, number_plate, company_id, phone, email, location, checkpoint, '
+           'amount_paid, officer_id, "timestamp", token_serial')
+
+
+# Frozen copies of the services/partitions.py helpers, so later changes there cannot alter this migration
+def _month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def _add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(month):
+    return f'vehicle_logs_y{month.year:04d}m{month.month:02d}'
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        # Declarative partitioning is Postgres-only; other databases keep the plain table
+        with op.batch_alter_table('vehicle_logs', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_vehicle_logs_timestamp'), ['timestamp'], unique=False)
+        return
+
+    # The partition key must be part of the primary key, so it cannot be NULL
+    op.execute("UPDATE vehicle_logs SET \"timestamp\" = now() AT TIME ZONE 'utc' WHERE \"timestamp\" IS NULL")
+    op.execute('ALTER TABLE vehicle_logs RENAME TO vehicle_logs_unpartitioned')
+    op.execute('ALTER TABLE vehicle_logs_unpartitioned RENAME CONSTRAINT vehicle_logs_pkey TO vehicle_logs_unpartitioned_pkey')
+
+    op.execute("""
+        CREATE TABLE vehicle_logs (
+            id INTEGER NOT NULL DEFAULT nextval('vehicle_logs_id_seq'),
+            number_plate VARCHAR(20) NOT NULL,
+            company_id INTEGER REFERENCES users (id),
+            phone VARCHAR(20),
+            email VARCHAR(100),
+            location VARCHAR(100),
+            checkpoint VARCHAR(50),
+            amount_paid DOUBLE PRECISION,
+            officer_id INTEGER REFERENCES users (id),
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            token_serial VARCHAR(20) REFERENCES tokens (serial),
+            CONSTRAINT vehicle_logs_pkey PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+    """)
+    op.execute('ALTER SEQUENCE vehicle_logs_id_seq OWNED BY vehicle_logs.id')
+    op.execute('CREATE TABLE vehicle_logs_default PARTITION OF vehicle_logs DEFAULT')
+
+    first = bind.execute(sa.text('SELECT min("timestamp") FROM vehicle_logs_unpartitioned')).scalar()
+    month = _month_start(first or date.today())
+    last = _add_months(_month_start(date.today()), 3)
+    while month <= last:
+        op.execute(f"CREATE TABLE {_partition_name(month)} PARTITION OF vehicle_logs "
+                   f"FOR VALUES FROM ('{month}') TO ('{_add_months(month, 1)}')")
+        month = _add_months(month, 1)
+
+    op.execute(f'INSERT INTO vehicle_logs ({COLUMNS}) SELECT {COLUMNS} FROM vehicle_logs_unpartitioned')
+    op.execute('DROP TABLE vehicle_logs_unpartitioned')
+    op.create_index(op.f('ix_vehicle_logs_timestamp'), 'vehicle_logs', ['timestamp'], unique=False)
+    op.execute('ANALYZE vehicle_logs')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        with op.batch_alter_table('vehicle_logs', schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f('ix_vehicle_logs_timestamp'))
+        return
+
+    op.execute('ALTER TABLE vehicle_logs RENAME TO vehicle_logs_partitioned')
+    op.execute('ALTER TABLE vehicle_logs_partitioned RENAME CONSTRAINT vehicle_logs_pkey TO vehicle_logs_partitioned_pkey')
+    op.execute("""
+        CREATE TABLE vehicle_logs (
+            id INTEGER NOT NULL DEFAULT nextval('vehicle_logs_id_seq'),
+            number_plate VARCHAR(20) NOT NULL,
+            company_id INTEGER REFERENCES users (id),
+            phone VARCHAR(20),
+            email VARCHAR(100),
+            location VARCHAR(100),
+            checkpoint VARCHAR(50),
+            amount_paid DOUBLE PRECISION,
+            officer_id INTEGER REFERENCES users (id),
+            "timestamp" TIMESTAMP WITHOUT TIME ZONE,
+            token_serial VARCHAR(20) REFERENCES tokens (serial),
+            CONSTRAINT vehicle_logs_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute('ALTER SEQUENCE vehicle_logs_id_seq OWNED BY vehicle_logs.id')
+    op.execute(f'INSERT INTO vehicle_logs ({COLUMNS}) SELECT {COLUMNS} FROM vehicle_logs_partitioned')
+    # Dropping the parent drops every attached partition; detached ones are left alone
+    op.execute('DROP TABLE vehicle_logs_partitioned')
@@ -0,0 +1,27 @@
+"""Add (officer_id, timestamp) index to vehicle_logs
+
+Revision ID: 7d2f4c8a91e3
+Revises: 3b9e61d2c7a4
+Create Date: 2026-10-19 11:04:27.512930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2f4c8a91e3'
+down_revision = '3b9e61d2c7a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Officer performance filters on a date range and groups by officer
+    with op.batch_alter_table('vehicle_logs', schema=None) as batch_op:
+        batch_op.create_index('ix_vehicle_logs_officer_id_timestamp', ['officer_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('vehicle_logs', schema=None) as batch_op:
+        batch_op.drop_index('ix_vehicle_logs_officer_id_timestamp')
@@ -0,0 +1,41 @@
+"""Add (officer_id, start_time, end_time) index to officer_shifts
+
+Also allows at most one open shift (end_time IS NULL) per officer.
+
+Revision ID: 9a5e3b7d20c4
+Revises: 7d2f4c8a91e3
+Create Date: 2026-10-19 12:31:08.774105
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a5e3b7d20c4'
+down_revision = '7d2f4c8a91e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Shift reconciliation joins each log to the shift whose range covers it
+    with op.batch_alter_table('officer_shifts', schema=None) as batch_op:
+        batch_op.create_index('ix_officer_shifts_officer_id_start_time_end_time',
+                              ['officer_id', 'start_time', 'end_time'], unique=False)
+
+    # Older duplicate open shifts end when the officer's latest one began
+    op.execute(
+        "UPDATE officer_shifts SET end_time = (SELECT max(s.start_time) FROM officer_shifts s "
+        "WHERE s.officer_id = officer_shifts.officer_id AND s.end_time IS NULL) "
+        "WHERE end_time IS NULL AND start_time < (SELECT max(s.start_time) FROM officer_shifts s "
+        "WHERE s.officer_id = officer_shifts.officer_id AND s.end_time IS NULL)"
+    )
+    op.create_index('uq_officer_shifts_open_officer_id', 'officer_shifts', ['officer_id'], unique=True,
+                    postgresql_where=sa.text('end_time IS NULL'), sqlite_where=sa.text('end_time IS NULL'))
+
+
+def downgrade():
+    op.drop_index('uq_officer_shifts_open_officer_id', table_name='officer_shifts')
+    with op.batch_alter_table('officer_shifts', schema=None) as batch_op:
+        batch_op.drop_index('ix_officer_shifts_officer_id_start_time_end_time')
@@ -1,9 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_login import UserMixin
 from datetime import datetime, timedelta
 import uuid
 
-db = SQLAlchemy()
+
+class RoutingSession(Session):
+    """``db.session``: lets services/replica.py send a request's reads to the replica engine."""
+    read_router = None
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.read_router is not None:
+            engine = self.read_router.route(self, clause)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # ---------------------
 # User model (extended)
@@ -90,6 +104,10 @@ class Token(db.Model):
 # ---------------------
 class VehicleLog(db.Model):
     __tablename__ = 'vehicle_logs'
+    # On partitioned Postgres the table's primary key is (id, "timestamp"), because a partition key must be
+    # part of it (migration 3b9e61d2c7a4). The model keeps id alone: the sequence keeps ids unique, identity
+    # lookups stay by id, and SQLite still autoincrements it. Alembic autogenerate does not compare primary
+    # keys, so `flask db migrate` reports no difference.
     id = db.Column(db.Integer, primary_key=True)
     number_plate = db.Column(db.String(20), nullable=False)
     company_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -101,10 +119,16 @@ class VehicleLog(db.Model):
     amount_paid = db.Column(db.Float)
     officer_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     officer = db.relationship('User', foreign_keys=[officer_id])
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Partition key of the monthly partitions on Postgres (see services/partitions.py)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     token_serial = db.Column(db.String(20), db.ForeignKey('tokens.serial'), nullable=True)
     token = db.relationship('Token', backref='vehicle_logs')
 
+    __table_args__ = (
+        # Officer performance: date range per officer
+        db.Index('ix_vehicle_logs_officer_id_timestamp', 'officer_id', 'timestamp'),
+    )
+
 # ---------------------
 # OfficerShift Model(store shift records per officers)
 # ---------------------
@@ -117,3 +141,36 @@ class OfficerShift(db.Model):
     checkpoint = db.Column(db.String(100), nullable=False)
 
     officer = db.relationship('User', backref='shifts')
+
+    __table_args__ = (
+        # Range join of vehicle logs onto the shift that covers them
+        db.Index('ix_officer_shifts_officer_id_start_time_end_time', 'officer_id', 'start_time', 'end_time'),
+        # At most one open shift per officer
+        db.Index('uq_officer_shifts_open_officer_id', 'officer_id', unique=True,
+                 postgresql_where=db.text('end_time IS NULL'), sqlite_where=db.text('end_time IS NULL')),
+    )
+
+# ---------------------
+# Email Outbox (queued report emails, delivered by services/mailer.py)
+# ---------------------
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    to_address = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False, default='')
+    attachment_name = db.Column(db.String(255))
+    attachment_type = db.Column(db.String(100))
+    attachment = db.Column(db.LargeBinary)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # The sender polls for due rows
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
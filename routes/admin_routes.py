@@ -1,13 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, Response, current_app, stream_with_context, abort
 from flask_login import login_required, current_user
 from models import db, CargoType, VehicleLog, User
-from sqlalchemy import func 
-import pandas as pd
-from io import BytesIO
+from sqlalchemy import and_, func, or_, select
+import io, csv, os, tempfile, uuid
+import xlsxwriter
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
-from collections import defaultdict
-from models import OfficerProfile
+from collections import namedtuple
+from datetime import datetime, timedelta
+from models import OfficerProfile, OfficerShift
+from services import metrics, statements, log_import, anomalies
+from services.log_filter import LogFilter
+from services.replica import read_replica, note_write
 
 
 admin_bp = Blueprint('admin', __name__)
@@ -76,128 +80,518 @@ def delete_cargo_type(type_id):
     return redirect(url_for('admin.list_cargo_types'))
 
 
-@admin_bp.route('/officer_performance', methods=['GET', 'POST'])
-@login_required
-def officer_performance():
-    if current_user.role != 'admin':
-        return render_template('access_denied.html', message="Admins only")
-
-    officers = (
-        db.session.query(User)
-        .join(OfficerProfile)
-        .filter(User.role == 'officer')
-        .all()
-    )
-
-    selected_officer = request.form.get('officer') if request.method == 'POST' else None
-    start_date = request.form.get('start_date')
-    end_date = request.form.get('end_date')
+# ---------------------
+# Officer performance (ROLLUP: day rows, officer subtotals, grand total)
+# ---------------------
+PerformanceRow = namedtuple('PerformanceRow', 'level officer_id officer log_date vehicles amount')
+OFFICERS_PER_PAGE = 25
 
-    query = (
-        db.session.query(
-            OfficerProfile.full_name,
-            func.date(VehicleLog.timestamp).label('log_date'),
-            func.sum(VehicleLog.amount_paid).label('total_collected')
-        )
-        .join(User, VehicleLog.officer_id == User.id)
-        .join(OfficerProfile, OfficerProfile.user_id == User.id)
-    )
 
-    if selected_officer:
-        query = query.filter(User.id == int(selected_officer))
+def _performance_criteria(officer_id, start_date, end_date):
+    """WHERE clauses as half-open timestamp ranges so the timestamp indexes apply."""
+    clauses = []
+    if officer_id:
+        clauses.append(VehicleLog.officer_id == officer_id)
     if start_date:
-        query = query.filter(VehicleLog.timestamp >= start_date)
+        clauses.append(VehicleLog.timestamp >= datetime.combine(start_date, datetime.min.time()))
     if end_date:
-        query = query.filter(VehicleLog.timestamp <= end_date)
-
-    query = query.group_by(OfficerProfile.full_name, func.date(VehicleLog.timestamp))
-    results = query.all()
-
-
-    # Group totals by officer
+        # The end date is inclusive: everything before the following midnight
+        clauses.append(VehicleLog.timestamp < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return clauses
+
+
+def performance_rows(criteria, officer_ids=None):
+    """Stream ``PerformanceRow``s: each officer's days, then their subtotal; the grand total last."""
+    log_date = func.date(VehicleLog.timestamp)
+    officer = func.min(OfficerProfile.full_name)
+    stmt = (
+        select(VehicleLog.officer_id, officer, log_date, func.count(VehicleLog.id),
+               func.coalesce(func.sum(VehicleLog.amount_paid), 0.0))
+        .join(OfficerProfile, OfficerProfile.user_id == VehicleLog.officer_id)
+        .where(*criteria)
+    )
+    if officer_ids is not None:
+        stmt = stmt.where(VehicleLog.officer_id.in_(officer_ids))
+
+    if db.engine.dialect.name == 'postgresql':
+        stmt = stmt.add_columns(func.grouping(VehicleLog.officer_id), func.grouping(log_date))\
+            .group_by(func.rollup(VehicleLog.officer_id, log_date))\
+            .order_by(func.grouping(VehicleLog.officer_id), officer, VehicleLog.officer_id,
+                      func.grouping(log_date), log_date)
+        for officer_id, name, day, vehicles, amount, officer_level, day_level in \
+                db.session.execute(stmt.execution_options(yield_per=1000)):
+            level = 'total' if officer_level else 'officer' if day_level else 'day'
+            yield PerformanceRow(level, officer_id, name, day, vehicles, float(amount))
+        return
+
+    # No ROLLUP here (SQLite): subtotal the ordered daily groups as they stream past
+    stmt = stmt.group_by(VehicleLog.officer_id, log_date).order_by(officer, VehicleLog.officer_id, log_date)
+    current, subtotal, total = None, [0, 0.0], [0, 0.0]
+    for officer_id, name, day, vehicles, amount in db.session.execute(stmt.execution_options(yield_per=1000)):
+        if current and current[0] != officer_id:
+            yield PerformanceRow('officer', current[0], current[1], None, *subtotal)
+            subtotal = [0, 0.0]
+        current = (officer_id, name)
+        subtotal = [subtotal[0] + vehicles, subtotal[1] + float(amount)]
+        total = [total[0] + vehicles, total[1] + float(amount)]
+        yield PerformanceRow('day', officer_id, name, day, vehicles, float(amount))
+    if current:
+        yield PerformanceRow('officer', current[0], current[1], None, *subtotal)
+    yield PerformanceRow('total', None, None, None, *total)
+
+
+def _parse_form_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _performance_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Officer", "Date", "Vehicles", "Amount Collected (ZMW)"])
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        label = {'day': row.officer, 'officer': f"{row.officer} (total)", 'total': "All officers"}[row.level]
+        writer.writerow([label, row.log_date or '', row.vehicles, f"{row.amount:.2f}"])
+        yield buffer.getvalue()
+
+
+def _performance_excel(rows):
+    output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    # constant_memory flushes each row to disk as it is written
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'in_memory': False})
+    sheet = workbook.add_worksheet('Performance')
+    bold = workbook.add_format({'bold': True})
+    money = workbook.add_format({'num_format': 'ZMW #,##0.00'})
+    bold_money = workbook.add_format({'bold': True, 'num_format': 'ZMW #,##0.00'})
+    sheet.set_column(0, 0, 28)
+    sheet.set_column(1, 3, 16)
+    sheet.write_row(0, 0, ["Officer", "Date", "Vehicles", "Amount Collected"], bold)
+    for r, row in enumerate(rows, start=1):
+        if row.level == 'day':
+            sheet.write_row(r, 0, [row.officer, str(row.log_date), row.vehicles])
+            sheet.write_number(r, 3, row.amount, money)
+        else:
+            label = f"{row.officer} (total)" if row.level == 'officer' else "All officers"
+            sheet.write_row(r, 0, [label, '', row.vehicles], bold)
+            sheet.write_number(r, 3, row.amount, bold_money)
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def _performance_pdf(rows, start_date, end_date):
+    output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    c = canvas.Canvas(output, pagesize=A4)
+    width, height = A4
+
+    def header(y):
+        c.setFont("Helvetica-Bold", 10)
+        for x, title in ((50, "Officer"), (250, "Date"), (350, "Vehicles"), (430, "Amount (ZMW)")):
+            c.drawString(x, y, title)
+        return y - 18
+
+    y = height - 50
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(50, y, "Officer Performance Report")
+    y -= 18
+    c.setFont("Helvetica", 9)
+    c.drawString(50, y, f"Period: {start_date or 'start'} to {end_date or 'today'}")
+    y = header(y - 24)
+    for row in rows:
+        if y < 60:
+            c.showPage()
+            y = header(height - 50)
+        if row.level == 'day':
+            c.setFont("Helvetica", 9)
+            cells = (row.officer[:32], str(row.log_date))
+        else:
+            c.setFont("Helvetica-Bold", 9)
+            cells = ((f"{row.officer[:24]} total" if row.level == 'officer' else "All officers"), "")
+            y -= 2
+        c.drawString(50, y, cells[0])
+        c.drawString(250, y, cells[1])
+        c.drawRightString(400, y, f"{row.vehicles:,}")
+        c.drawRightString(520, y, f"{row.amount:,.2f}")
+        y -= 16 if row.level == 'day' else 22
+    c.save()
+    output.seek(0)
+    return output
 
-    officer_totals = defaultdict(float)
-    for full_name, date, total in results:
-        officer_totals[full_name] += total
 
-    # Convert to list of tuples for display or export
+@admin_bp.route('/officer_performance', methods=['GET', 'POST'])
+@login_required
+@read_replica
+def officer_performance():
+    if current_user.role != 'admin':
+        return render_template('access_denied.html', message="Admins only")
 
-    grouped_results = [(name, amount) for name, amount in officer_totals.items()]
-    
-    # Export to Excel
-    if 'export_excel' in request.form:
-        import pandas as pd
-        from io import BytesIO
-        from flask import send_file
+    # Dropdown: ids and names only
+    officers = db.session.execute(
+        select(User.id, OfficerProfile.full_name)
+        .join(OfficerProfile, OfficerProfile.user_id == User.id)
+        .where(User.role == 'officer')
+        .order_by(OfficerProfile.full_name)
+    ).all()
+
+    # A malformed id is ignored like an empty one rather than failing the page
+    selected_officer = request.values.get('officer', type=int)
+    start_date = request.values.get('start_date') or ''
+    end_date = request.values.get('end_date') or ''
+    criteria = _performance_criteria(selected_officer, _parse_form_date(start_date), _parse_form_date(end_date))
+
+    if 'export_csv' in request.values:
+        response = Response(stream_with_context(_performance_csv(performance_rows(criteria))), mimetype='text/csv')
+        response.headers["Content-Disposition"] = "attachment; filename=officer_performance.csv"
+        return response
 
-        df = pd.DataFrame(results, columns=["Officer", "Date", "Amount Collected"])
-        output = BytesIO()
-        df.to_excel(output, index=False)
-        output.seek(0)
+    if 'export_excel' in request.values:
         return send_file(
-            output,
+            _performance_excel(performance_rows(criteria)),
             as_attachment=True,
             download_name='officer_performance.xlsx',
             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
 
-
-    # Export CSV
-    if 'export_csv' in request.form:
-        import csv
-        from io import StringIO
-        from flask import Response
-
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(["Officer", "Total Amount Collected (ZMW)"])
-        for officer, total in grouped_results:
-            writer.writerow([officer, f"{total:.2f}"])
-
-        response = Response(output.getvalue(), mimetype='text/csv')
-        response.headers["Content-Disposition"] = "attachment; filename=officer_performance.csv"
-        return response
-
-    # Export to PDF
-    if 'export_pdf' in request.form:
-        from io import BytesIO
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.pagesizes import A4
-
-        output = BytesIO()
-        c = canvas.Canvas(output, pagesize=A4)
-        width, height = A4
-        y = height - 50
-
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(50, y, "Officer Performance Report")
-        y -= 30
-        c.setFont("Helvetica", 10)
-
-        for full_name, date, total in results:
-            c.drawString(50, y, f"{date} - {full_name}: ZMW {total:.2f}")
-            y -= 20
-            if y < 50:
-                c.showPage()
-                y = height - 50
-                c.setFont("Helvetica", 10)
-
-        c.save()
-        output.seek(0)
+    if 'export_pdf' in request.values:
         return send_file(
-            output,
+            _performance_pdf(performance_rows(criteria), start_date, end_date),
             as_attachment=True,
             download_name='officer_performance.pdf',
             mimetype='application/pdf'
         )
-    
+
+    # One page of officers (by name), then the rollup for just those officers
+    page = max(request.values.get('page', 1, type=int), 1)
+    officer_name = func.min(OfficerProfile.full_name)
+    page_ids = db.session.execute(
+        select(VehicleLog.officer_id)
+        .join(OfficerProfile, OfficerProfile.user_id == VehicleLog.officer_id)
+        .where(*criteria)
+        .group_by(VehicleLog.officer_id)
+        .order_by(officer_name, VehicleLog.officer_id)
+        .offset((page - 1) * OFFICERS_PER_PAGE).limit(OFFICERS_PER_PAGE)
+    ).scalars().all()
+    officer_count = db.session.execute(
+        select(func.count(func.distinct(VehicleLog.officer_id)))
+        .join(OfficerProfile, OfficerProfile.user_id == VehicleLog.officer_id)
+        .where(*criteria)
+    ).scalar()
+
+    rows = list(performance_rows(criteria, page_ids)) if page_ids else []
+    daily_results = [row for row in rows if row.level != 'total']
+    grouped_results = [(row.officer, row.amount) for row in rows if row.level == 'officer']
+    grand_total = None
+    if officer_count:
+        # Grand total over every officer, not just this page
+        vehicles, amount = db.session.execute(
+            select(func.count(VehicleLog.id), func.coalesce(func.sum(VehicleLog.amount_paid), 0.0))
+            .join(OfficerProfile, OfficerProfile.user_id == VehicleLog.officer_id)
+            .where(*criteria)
+        ).one()
+        grand_total = PerformanceRow('total', None, None, None, vehicles, float(amount))
 
     return render_template(
         "officer_performance.html",
         officers=officers,
-        daily_results=results, # from query.group_by(date)
-        grouped_results=grouped_results, # from defaultdict summary
+        daily_results=daily_results,
+        grouped_results=grouped_results,
+        grand_total=grand_total,
         selected_officer=selected_officer,
         start_date=start_date,
-        end_date=end_date
+        end_date=end_date,
+        page=page,
+        pages=max((officer_count + OFFICERS_PER_PAGE - 1) // OFFICERS_PER_PAGE, 1),
+    )
+
+
+# ---------------------
+# Shift reconciliation
+# ---------------------
+def shift_attribution(start, end, checkpoint=None):
+    """Vehicles and revenue per (officer, shift) for logs in ``[start, end)``, in one range join.
+
+    Logs that fall in none of their officer's shifts come back with
+    ``shift_id`` None. An open shift (no end time yet) covers everything
+    after its start.
+    """
+    covering_shift = and_(
+        OfficerShift.officer_id == VehicleLog.officer_id,
+        VehicleLog.timestamp >= OfficerShift.start_time,
+        or_(OfficerShift.end_time.is_(None), VehicleLog.timestamp < OfficerShift.end_time),
+    )
+    stmt = (
+        select(VehicleLog.officer_id, OfficerShift.id.label('shift_id'), func.count(VehicleLog.id),
+               func.coalesce(func.sum(VehicleLog.amount_paid), 0.0))
+        .select_from(VehicleLog)
+        .outerjoin(OfficerShift, covering_shift)
+        .where(VehicleLog.timestamp >= start, VehicleLog.timestamp < end)
+        .group_by(VehicleLog.officer_id, OfficerShift.id)
+    )
+    if checkpoint:
+        stmt = stmt.where(VehicleLog.checkpoint == checkpoint)
+    return db.session.execute(stmt).all()
+
+
+def _outside_shift_logs(start, end, checkpoint=None, limit=100):
+    """The most recent logs that no shift of their officer covers."""
+    covered = select(OfficerShift.id).where(
+        OfficerShift.officer_id == VehicleLog.officer_id,
+        VehicleLog.timestamp >= OfficerShift.start_time,
+        or_(OfficerShift.end_time.is_(None), VehicleLog.timestamp < OfficerShift.end_time),
+    ).exists()
+    stmt = (
+        select(VehicleLog.id, VehicleLog.number_plate, VehicleLog.checkpoint, VehicleLog.amount_paid,
+               VehicleLog.timestamp, OfficerProfile.full_name)
+        .outerjoin(OfficerProfile, OfficerProfile.user_id == VehicleLog.officer_id)
+        .where(VehicleLog.timestamp >= start, VehicleLog.timestamp < end, ~covered)
+        .order_by(VehicleLog.timestamp.desc()).limit(limit)
+    )
+    if checkpoint:
+        stmt = stmt.where(VehicleLog.checkpoint == checkpoint)
+    return db.session.execute(stmt).all()
+
+
+def reconcile_shifts(start, end, checkpoint=None):
+    """``(shifts, outside)``: one row per shift overlapping the range, and per-officer logs outside any shift."""
+    attributed = shift_attribution(start, end, checkpoint)
+    totals = {shift_id: (vehicles, float(amount)) for _, shift_id, vehicles, amount in attributed if shift_id}
+
+    shift_stmt = (
+        select(OfficerShift.id, OfficerShift.officer_id, OfficerProfile.full_name, OfficerShift.checkpoint,
+               OfficerShift.start_time, OfficerShift.end_time)
+        .outerjoin(OfficerProfile, OfficerProfile.user_id == OfficerShift.officer_id)
+        .where(OfficerShift.start_time < end,
+               or_(OfficerShift.end_time.is_(None), OfficerShift.end_time > start))
+        .order_by(OfficerShift.start_time, OfficerProfile.full_name)
+    )
+    shifts = []
+    for shift_id, officer_id, name, shift_checkpoint, started, ended in db.session.execute(shift_stmt):
+        vehicles, amount = totals.pop(shift_id, (0, 0.0))
+        if checkpoint and shift_checkpoint != checkpoint and not vehicles:
+            continue
+        shifts.append({'id': shift_id, 'officer': name, 'checkpoint': shift_checkpoint, 'start': started,
+                       'end': ended, 'vehicles': vehicles, 'amount': amount})
+
+    names = dict(db.session.execute(
+        select(OfficerProfile.user_id, OfficerProfile.full_name)
+        .where(OfficerProfile.user_id.in_({officer_id for officer_id, shift_id, _, _ in attributed if not shift_id}))
+    ).all())
+    outside = sorted(
+        ({'officer_id': officer_id, 'officer': names.get(officer_id, 'Unknown'), 'vehicles': vehicles,
+          'amount': float(amount)} for officer_id, shift_id, vehicles, amount in attributed if not shift_id),
+        key=lambda row: -row['amount'])
+    return shifts, outside
+
+
+def _reconciliation_csv(shifts, outside):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["Officer", "Checkpoint", "Shift Start", "Shift End", "Vehicles", "Amount Collected (ZMW)"])
+    for shift in shifts:
+        writer.writerow([shift['officer'], shift['checkpoint'], shift['start'], shift['end'] or 'open',
+                         shift['vehicles'], f"{shift['amount']:.2f}"])
+    for row in outside:
+        writer.writerow([row['officer'], '', 'outside any shift', '', row['vehicles'], f"{row['amount']:.2f}"])
+    return buffer.getvalue()
+
+
+@admin_bp.route('/shift_reconciliation')
+@login_required
+@read_replica
+def shift_reconciliation():
+    if current_user.role != 'admin':
+        return render_template('access_denied.html'), 403
+
+    # Defaults to month-to-date
+    today = datetime.utcnow().date()
+    start_date = _parse_form_date(request.args.get('start_date')) or today.replace(day=1)
+    end_date = _parse_form_date(request.args.get('end_date')) or today
+    checkpoint = request.args.get('checkpoint') or None
+    start = datetime.combine(start_date, datetime.min.time())
+    end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+
+    shifts, outside = reconcile_shifts(start, end, checkpoint)
+
+    if 'export_csv' in request.args:
+        response = Response(_reconciliation_csv(shifts, outside), mimetype='text/csv')
+        response.headers["Content-Disposition"] = (
+            f"attachment; filename=shift_reconciliation_{start_date}_{end_date}.csv")
+        return response
+
+    checkpoints = db.session.execute(
+        select(OfficerShift.checkpoint).distinct().order_by(OfficerShift.checkpoint)
+    ).scalars().all()
+
+    return render_template(
+        'shift_reconciliation.html',
+        shifts=shifts,
+        outside=outside,
+        outside_logs=_outside_shift_logs(start, end, checkpoint) if outside else [],
+        shift_totals=(sum(s['vehicles'] for s in shifts), sum(s['amount'] for s in shifts)),
+        outside_totals=(sum(r['vehicles'] for r in outside), sum(r['amount'] for r in outside)),
+        checkpoints=checkpoints,
+        checkpoint=checkpoint,
+        start_date=start_date.isoformat(),
+        end_date=end_date.isoformat(),
     )
+
+
+# ---------------------
+# Month-end statements (every company, one ZIP)
+# ---------------------
+@admin_bp.route('/statements')
+@login_required
+def monthly_statements():
+    if current_user.role != 'admin':
+        return render_template('access_denied.html'), 403
+
+    try:
+        month = datetime.strptime(request.args.get('month', ''), '%Y-%m').date()
+    except ValueError:
+        flash("Choose a month (YYYY-MM) for the statements.", "danger")
+        return redirect(url_for('checkpoint.report_download'))
+    formats = request.args.getlist('format') or list(statements.FORMATS)
+
+    # Served from the ZIP `flask statements` (or an earlier download) wrote while the month's data is unchanged
+    path = statements.default_path(month, formats)
+    if not statements.is_current(path, month):
+        statements.build_statements(month, path, formats=formats)
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path), mimetype='application/zip')
+
+
+# ---------------------
+# Bulk import of historical logs
+# ---------------------
+IMPORT_ERRORS_SHOWN = 200
+
+
+def _import_reports_dir():
+    directory = os.path.join(current_app.instance_path, 'import_reports')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+@admin_bp.route('/import_logs', methods=['GET', 'POST'])
+@login_required
+def import_logs():
+    if current_user.role != 'admin':
+        return render_template('access_denied.html'), 403
+
+    result = report_name = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash("Choose an .xlsx or .csv file to import.", "danger")
+            return redirect(url_for('admin.import_logs'))
+        try:
+            result = log_import.import_logs(upload.stream, upload.filename, dry_run='dry_run' in request.form)
+            note_write()
+        except log_import.ImportFileError as exc:
+            flash(str(exc), "danger")
+            return redirect(url_for('admin.import_logs'))
+
+        if result.skipped:
+            report_name = f"import_errors_{uuid.uuid4().hex}.csv"
+            with open(os.path.join(_import_reports_dir(), report_name), 'w', newline='') as fh:
+                result.error_report(fh)
+        verb = "validated" if 'dry_run' in request.form else "imported"
+        flash(f"{result.imported:,} of {result.rows:,} rows {verb}; {result.skipped:,} skipped.",
+              "warning" if result.skipped else "success")
+
+    return render_template('import_logs.html', result=result, report_name=report_name,
+                           errors=result.errors[:IMPORT_ERRORS_SHOWN] if result else [])
+
+
+@admin_bp.route('/import_logs/errors/<name>')
+@login_required
+def import_error_report(name):
+    if current_user.role != 'admin':
+        return render_template('access_denied.html'), 403
+    # Only names this view generated: no path components
+    if os.path.basename(name) != name or not name.startswith('import_errors_'):
+        abort(404)
+    path = os.path.join(_import_reports_dir(), name)
+    if not os.path.exists(path):
+        flash("That error report is no longer available.", "warning")
+        return redirect(url_for('admin.import_logs'))
+    return send_file(path, as_attachment=True, download_name='import_errors.csv', mimetype='text/csv')
+
+
+# ---------------------
+# Metrics (Prometheus text format)
+# ---------------------
+@admin_bp.route('/metrics')
+@login_required
+def metrics_endpoint():
+    if current_user.role != 'admin':
+        return render_template('access_denied.html'), 403
+
+    registry = current_app.extensions.get('metrics', metrics.registry)
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ---------------------
+# Slow-query log
+# ---------------------
+@admin_bp.route('/slow_queries', methods=['GET', 'POST'])
+@login_required
+def slow_queries():
+    if current_user.role != 'admin':
+        return render_template('access_denied.html'), 403
+
+    slow_log = current_app.extensions['slow_queries']
+    if request.method == 'POST':
+        slow_log.clear()
+        flash('Slow-query log cleared.', 'info')
+        return redirect(url_for('admin.slow_queries'))
+
+    return render_template('slow_queries.html',
+                           entries=slow_log.entries(),
+                           threshold_ms=slow_log.threshold_ms,
+                           explain_sample_rate=slow_log.explain_sample_rate,
+                           explain_analyze=slow_log.explain_analyze)
+
+
+# ---------------------
+# Anomaly alerts (cloned plates, reused tokens)
+# ---------------------
+ANOMALY_KINDS = {'impossible_travel': 'Impossible travel', 'token_reuse': 'Token reuse'}
+ANOMALY_ALERTS_SHOWN = 200
+
+
+@admin_bp.route('/anomalies', methods=['GET', 'POST'])
+@login_required
+def anomaly_alerts():
+    if current_user.role != 'admin':
+        return render_template('access_denied.html'), 403
+
+    detector = anomalies.detector()
+    if request.method == 'POST':
+        hours = request.form.get('hours', type=int)
+        raised = detector.rebuild(hours)
+        replayed = f"the last {hours} hours" if hours else "the detection window"
+        flash(f"Replayed {replayed} of history: {len(raised)} new alerts.", "info")
+        return redirect(url_for('admin.anomaly_alerts'))
+
+    kind = request.args.get('kind') if request.args.get('kind') in ANOMALY_KINDS else None
+    return render_template('anomalies.html', alerts=detector.alerts(kind, limit=ANOMALY_ALERTS_SHOWN),
+                           kinds=ANOMALY_KINDS, kind=kind, stats=detector.stats(),
+                           enabled=current_app.config['ANOMALY_DETECTION'])
+
+
+# ---------------------
+# Traffic heatmap
+# ---------------------
+@admin_bp.route('/heatmap')
+@login_required
+def traffic_heatmap():
+    if current_user.role != 'admin':
+        return render_template('access_denied.html'), 403
+
+    # The grid itself comes from /api/v1/heatmap
+    return render_template('heatmap.html', filters=LogFilter.from_args(request.args))
@@ -0,0 +1,300 @@
+from flask import Blueprint, request, jsonify, Response, current_app
+from flask_login import login_required, current_user
+from sqlalchemy import extract, func, select
+from models import db, VehicleLog, User, CompanyProfile
+from services.http_cache import not_modified, add_validators
+from services.watermark import data_watermark
+from services.log_filter import LogFilter
+from services.archive import archive_for, company_names
+from services.columnar import cache_for, WEEKDAYS
+from services.replica import read_replica
+from datetime import datetime
+import json, queue, time
+import numpy as np
+
+api_bp = Blueprint('api', __name__)
+
+MAX_PER_PAGE = 200
+
+
+# ------------------------
+# Helpers
+# ------------------------
+@api_bp.before_request
+@login_required
+def require_admin():
+    if current_user.role != 'admin':
+        return jsonify(error="Admins only"), 403
+
+
+def cached_json(view_name, build, **extra):
+    """Answer with 304 or a JSON body built by ``build(filters)``, validated by the data watermark."""
+    filters = LogFilter.from_args(request.args)
+    watermark = data_watermark()
+    etag = watermark.etag('api', view_name, filters.cache_key(), tuple(sorted(extra.items())))
+    cached = not_modified(etag, watermark.log_time)
+    if cached:
+        return cached
+    payload = build(filters)
+    payload['watermark'] = watermark.log_id
+    return add_validators(jsonify(payload), etag, watermark.log_time)
+
+
+def _company_label():
+    return func.coalesce(CompanyProfile.company_name, 'Unknown')
+
+
+def _add_groups(series, groups, new_entry):
+    """Fold ``{key: (vehicles, revenue)}`` from the columnar cache or the archive into ``series``."""
+    for key, (count, revenue) in groups.items():
+        entry = series.setdefault(key, new_entry(key))
+        entry['vehicles'] += count
+        entry['revenue'] += revenue
+    return series
+
+
+# ------------------------
+# Filter options (dropdowns)
+# ------------------------
+@api_bp.route('/filters')
+@read_replica
+def filter_options():
+    def build(filters):
+        companies = db.session.query(User.id, CompanyProfile.company_name)\
+            .join(CompanyProfile, CompanyProfile.user_id == User.id)\
+            .order_by(CompanyProfile.company_name).all()
+        checkpoints = db.session.query(VehicleLog.checkpoint).distinct().order_by(VehicleLog.checkpoint).all()
+        years = db.session.query(extract('year', VehicleLog.timestamp)).distinct()\
+            .order_by(extract('year', VehicleLog.timestamp)).all()
+        checkpoints = {c[0] for c in checkpoints if c[0]}
+        years = {int(y[0]) for y in years if y[0] is not None}
+        # Archived months are still served by every other endpoint, so they stay selectable
+        log_archive = current_app.extensions.get('archive')
+        if log_archive is not None:
+            archived_years, archived_checkpoints = log_archive.filter_options()
+            years |= archived_years
+            checkpoints |= archived_checkpoints
+        return {
+            'companies': [{'id': id, 'name': name} for id, name in companies],
+            'checkpoints': sorted(checkpoints),
+            'years': sorted(years),
+        }
+    return cached_json('filters', build)
+
+
+# ------------------------
+# Totals
+# ------------------------
+@api_bp.route('/totals')
+@read_replica
+def totals():
+    def build(filters):
+        cache = cache_for(filters)
+        if cache:
+            vehicles, revenue = cache.totals(filters)
+        else:
+            stmt = filters.select(lambda: select(func.count(VehicleLog.id),
+                                                 func.coalesce(func.sum(VehicleLog.amount_paid), 0.0)))
+            vehicles, revenue = db.session.execute(stmt).one()
+        archived = archive_for(filters)
+        if archived:
+            count, amount = archived.totals(filters)
+            vehicles, revenue = vehicles + count, float(revenue) + amount
+        return {'vehicles': vehicles, 'revenue': float(revenue)}
+    return cached_json('totals', build)
+
+
+# ------------------------
+# Series
+# ------------------------
+@api_bp.route('/series/company')
+@read_replica
+def company_series():
+    def build(filters):
+        series, extra = {}, []
+        cache = cache_for(filters)
+        if cache:
+            extra.append(cache.group_totals(filters, 'company_id'))
+        else:
+            stmt = filters.select(lambda: select(VehicleLog.company_id, _company_label(),
+                                                 func.count(VehicleLog.id), func.sum(VehicleLog.amount_paid))
+                                  .outerjoin(CompanyProfile, CompanyProfile.user_id == VehicleLog.company_id))
+            # Grouping by the raw name keeps the coalesced label valid on Postgres
+            stmt += lambda s: s.group_by(VehicleLog.company_id, CompanyProfile.company_name)
+            series = {company_id: {'company_id': company_id, 'company': name, 'vehicles': count, 'revenue': float(revenue or 0)}
+                      for company_id, name, count, revenue in db.session.execute(stmt).all()}
+        archived = archive_for(filters)
+        if archived:
+            extra.append(archived.group_totals(filters, 'company_id'))
+        names = company_names({key for groups in extra for key in groups} - set(series))
+        for groups in extra:
+            _add_groups(series, groups, lambda company_id: {'company_id': company_id,
+                                                            'company': names.get(company_id, 'Unknown'),
+                                                            'vehicles': 0, 'revenue': 0.0})
+        return {'series': sorted(series.values(), key=lambda entry: entry['revenue'], reverse=True)}
+    return cached_json('series_company', build)
+
+
+@api_bp.route('/series/checkpoint')
+@read_replica
+def checkpoint_series():
+    def build(filters):
+        def new_entry(checkpoint):
+            return {'checkpoint': checkpoint, 'vehicles': 0, 'revenue': 0.0}
+
+        cache = cache_for(filters)
+        if cache:
+            series = _add_groups({}, cache.group_totals(filters, 'checkpoint'), new_entry)
+        else:
+            stmt = filters.select(lambda: select(VehicleLog.checkpoint, func.count(VehicleLog.id),
+                                                 func.sum(VehicleLog.amount_paid)))
+            stmt += lambda s: s.group_by(VehicleLog.checkpoint)
+            series = {checkpoint: {'checkpoint': checkpoint, 'vehicles': count, 'revenue': float(revenue or 0)}
+                      for checkpoint, count, revenue in db.session.execute(stmt).all()}
+        archived = archive_for(filters)
+        if archived:
+            _add_groups(series, archived.group_totals(filters, 'checkpoint'), new_entry)
+        return {'series': sorted(series.values(), key=lambda entry: entry['checkpoint'] or '')}
+    return cached_json('series_checkpoint', build)
+
+
+# ------------------------
+# Weekday x hour heatmap
+# ------------------------
+@api_bp.route('/heatmap')
+@read_replica
+def heatmap():
+    def build(filters):
+        cache = cache_for(filters)
+        if cache:
+            counts, revenue = cache.matrix(filters)
+        else:
+            counts, revenue = np.zeros((7, 24), dtype=np.int64), np.zeros((7, 24))
+            # One grouped scan; extract('dow') counts from Sunday = 0
+            stmt = filters.select(lambda: select(extract('dow', VehicleLog.timestamp), extract('hour', VehicleLog.timestamp),
+                                                 func.count(VehicleLog.id), func.sum(VehicleLog.amount_paid)))
+            stmt += lambda s: s.group_by(extract('dow', VehicleLog.timestamp), extract('hour', VehicleLog.timestamp))
+            for dow, hour, count, total in db.session.execute(stmt).all():
+                weekday = (int(dow) + 6) % 7
+                counts[weekday, int(hour)] += count
+                revenue[weekday, int(hour)] += total or 0.0
+        archived = archive_for(filters)
+        if archived:
+            archived_counts, archived_revenue = archived.matrix(filters)
+            counts, revenue = counts + archived_counts, revenue + archived_revenue
+        return {
+            'days': list(WEEKDAYS),
+            'hours': list(range(24)),
+            'vehicles': counts.astype(int).tolist(),
+            'revenue': np.round(revenue, 2).tolist(),
+        }
+    return cached_json('heatmap', build)
+
+
+# ------------------------
+# Paged logs
+# ------------------------
+@api_bp.route('/logs')
+@read_replica
+def logs():
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), MAX_PER_PAGE)
+
+    def build(filters):
+        total = db.session.execute(filters.select(lambda: select(func.count(VehicleLog.id)))).scalar()
+        offset = (page - 1) * per_page
+        stmt = filters.select(lambda: select(VehicleLog.id, VehicleLog.number_plate, _company_label(),
+                                             VehicleLog.checkpoint, VehicleLog.amount_paid, VehicleLog.timestamp)
+                              .outerjoin(CompanyProfile, CompanyProfile.user_id == VehicleLog.company_id))
+        stmt += lambda s: s.order_by(VehicleLog.timestamp.desc(), VehicleLog.id.desc())\
+            .offset(offset).limit(per_page)
+        items = [
+            {'id': id, 'number_plate': plate, 'company': company, 'checkpoint': checkpoint,
+             'amount_paid': amount, 'timestamp': timestamp.isoformat() if timestamp else None}
+            for id, plate, company, checkpoint, amount, timestamp in db.session.execute(stmt).all()
+        ]
+
+        # Archived rows are all older than hot ones, so they continue the newest-first listing
+        archived = archive_for(filters)
+        if archived:
+            hot_total = total
+            total += archived.totals(filters)[0]
+            if len(items) < per_page:
+                records = archived.page(filters, max(offset - hot_total, 0), per_page - len(items))
+                names = company_names({record['company_id'] for record in records})
+                items += [
+                    {'id': record['id'], 'number_plate': record['number_plate'],
+                     'company': names.get(record['company_id'], 'Unknown'), 'checkpoint': record['checkpoint'],
+                     'amount_paid': record['amount_paid'], 'timestamp': record['timestamp'].isoformat()}
+                    for record in records
+                ]
+        return {
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': (total + per_page - 1) // per_page,
+            'items': items,
+        }
+    return cached_json('logs', build, page=page, per_page=per_page)
+
+
+# ------------------------
+# Live updates (Server-Sent Events)
+# ------------------------
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _log_delta(payload, filters):
+    log = dict(payload, timestamp=datetime.fromisoformat(payload['timestamp']))
+    if not filters.matches(log):
+        return None
+    return {
+        'vehicles': 1,
+        'revenue': payload['amount_paid'] or 0.0,
+        'company_id': payload['company_id'],
+        'checkpoint': payload['checkpoint'],
+        'log': {key: payload[key] for key in ('id', 'number_plate', 'company_id', 'checkpoint', 'amount_paid', 'timestamp')},
+    }
+
+
+@api_bp.route('/stream')
+def stream():
+    filters = LogFilter.from_args(request.args)
+    bus = current_app.extensions['events']
+    max_seconds = current_app.config.get('SSE_MAX_SECONDS', 300)
+    slots = current_app.extensions['sse_slots']
+    if not slots.acquire(blocking=False):
+        # Each stream holds a worker thread; past the cap, 204 tells EventSource to stop and the page polls
+        db.session.remove()
+        return Response(status=204)
+    subscription = bus.subscribe()
+    # The stream never touches the database: hand the request's connection back now
+    db.session.remove()
+
+    def generate():
+        try:
+            # Clients reconnect after max_seconds so long-lived workers get recycled
+            yield "retry: 3000\n\n"
+            deadline = time.monotonic() + max_seconds
+            while time.monotonic() < deadline:
+                try:
+                    payload = subscription.get(timeout=min(15, max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if payload['type'] == 'vehicle_log':
+                    delta = _log_delta(payload, filters)
+                    if delta:
+                        yield _sse('log', delta)
+                elif payload['type'] == 'token_verified':
+                    if not filters.company_id or payload['company_id'] == filters.company_id:
+                        yield _sse('token', payload)
+        finally:
+            bus.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs even when the client leaves before the generator starts
+    response.call_on_close(slots.release)
+    return response
@@ -1,7 +1,8 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, abort
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, abort, make_response, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
-from sqlalchemy import extract, func
-from models import db, VehicleLog, User, CompanyProfile
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from models import db, VehicleLog, User, CompanyProfile, OfficerShift
 import io, os
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
@@ -12,6 +13,16 @@ import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import base64
+from services.http_cache import cacheable, not_modified, add_validators
+from services.watermark import data_watermark
+from services.log_filter import LogFilter
+from services.archive import archive_for, company_names
+from services.columnar import cache_for
+from services import report_cache as reports
+from services.report_cache import range_watermark, report_key
+from services.raw_export import stream_csv as raw_export_csv
+from services import ingest
+from services.replica import read_replica, note_write
 
 checkpoint_bp = Blueprint('checkpoint', __name__)
 
@@ -42,52 +53,14 @@ def generate_chart_base64(data_dict, title, chart_type='pie'):
 # ---------------------
 @checkpoint_bp.route('/')
 @login_required
+@read_replica
 def dashboard():
     if current_user.role != 'admin':
         return render_template('access_denied.html'), 403
 
-    company_id = request.args.get('company_id', type=int)
-    checkpoint = request.args.get('checkpoint')
-    month = request.args.get('month', type=int)
-    year = request.args.get('year', type=int)
-    week = request.args.get('week', type=int)
-    day = request.args.get('day')
-    hour = request.args.get('hour', type=int)
-    specific_date = request.args.get('date')
-
-    query = VehicleLog.query
-
-    if company_id:
-        query = query.filter(VehicleLog.company_id == company_id)
-    if checkpoint:
-        query = query.filter(VehicleLog.checkpoint == checkpoint)
-    if month:
-        query = query.filter(extract('month', VehicleLog.timestamp) == month)
-    if year:
-        query = query.filter(extract('year', VehicleLog.timestamp) == year)
-    if week:
-        query = query.filter(func.date_part('week', VehicleLog.timestamp) == week)
-    if day:
-        query = query.filter(func.to_char(VehicleLog.timestamp, 'Day').ilike(f'%{day.capitalize()}%'))
-    if hour is not None:
-        query = query.filter(extract('hour', VehicleLog.timestamp) == hour)
-    if specific_date:
-        try:
-            dt = datetime.strptime(specific_date, '%Y-%m-%d').date()
-            query = query.filter(func.date(VehicleLog.timestamp) == dt)
-        except ValueError:
-            flash("Invalid date format. Use YYYY-MM-DD.", "danger")
-
-    logs = query.order_by(VehicleLog.timestamp.desc()).all()
-    total_vehicles = len(logs)
-    total_amount = sum(log.amount_paid for log in logs)
-
-    companies = db.session.query(User.id, CompanyProfile.company_name)\
-        .join(CompanyProfile, CompanyProfile.user_id == User.id)\
-        .order_by(CompanyProfile.company_name).all()
-
-    checkpoints = db.session.query(VehicleLog.checkpoint).distinct().order_by(VehicleLog.checkpoint).all()
-    years = db.session.query(extract('year', VehicleLog.timestamp)).distinct().order_by(extract('year', VehicleLog.timestamp)).all()
+    filters = LogFilter.from_args(request.args)
+    if filters.invalid_date:
+        flash("Invalid date format. Use YYYY-MM-DD.", "danger")
 
     recent_threshold = datetime.utcnow() - timedelta(minutes=15)
     active_officers = User.query.filter(
@@ -96,30 +69,80 @@ def dashboard():
         User.last_login >= recent_threshold
     ).all()
 
-    company_chart = checkpoint_chart = None
-    if logs:
-        company_totals = {}
-        checkpoint_totals = {}
-
-        for log in logs:
-            company_name = log.company.company_profile.company_name if log.company and log.company.company_profile else "Unknown"
-            company_totals[company_name] = company_totals.get(company_name, 0) + log.amount_paid
-            checkpoint_totals[log.checkpoint] = checkpoint_totals.get(log.checkpoint, 0) + log.amount_paid
+    # Unchanged data, filters and officer list -> 304 without running the log queries
+    etag = None
+    if cacheable():
+        watermark = data_watermark()
+        etag = watermark.etag('dashboard', current_user.id, filters.cache_key(),
+                              tuple(o.id for o in active_officers))
+        cached = not_modified(etag, watermark.log_time)
+        if cached:
+            return cached
+
+    # Totals, charts and the log table are fetched from /api/v1 by the page itself
+    response = make_response(render_template('dashboard.html',
+                           filters=filters,
+                           active_officers=active_officers))
+    if etag:
+        add_validators(response, etag, data_watermark().log_time)
+    return response
 
-        company_chart = generate_chart_base64(company_totals, "Revenue Share by Company", chart_type='pie')
-        checkpoint_chart = generate_chart_base64(checkpoint_totals, "Revenue by Checkpoint", chart_type='bar')
 
-    return render_template('dashboard.html',
-                           logs=logs,
-                           total_vehicles=total_vehicles,
-                           total_amount=total_amount,
-                           filters={"company_id": company_id, "checkpoint": checkpoint, "month": month, "year": year, "week": week, "day": day, "hour": hour, "date": specific_date},
-                           companies=companies,
-                           checkpoints=[c[0] for c in checkpoints],
-                           years=[y[0] for y in years],
-                           company_chart=company_chart,
-                           checkpoint_chart=checkpoint_chart,
-                           active_officers=active_officers)
+# ---------------------
+# Dashboard chart images
+# ---------------------
+@checkpoint_bp.route('/dashboard/chart/<kind>.png')
+@login_required
+@read_replica
+def dashboard_chart(kind):
+    if current_user.role != 'admin':
+        abort(403)
+    if kind not in ('company', 'checkpoint'):
+        abort(404)
+
+    filters = LogFilter.from_args(request.args)
+    watermark = data_watermark()
+    etag = watermark.etag('chart', kind, filters.cache_key())
+    cached = not_modified(etag, watermark.log_time)
+    if cached:
+        return cached
+
+    column = 'company_id' if kind == 'company' else 'checkpoint'
+    if kind == 'company':
+        title, chart_type = "Revenue Share by Company", 'pie'
+    else:
+        title, chart_type = "Revenue by Checkpoint", 'bar'
+
+    totals, extra = {}, []
+    cache = cache_for(filters)
+    if cache:
+        extra.append(cache.group_totals(filters, column))
+    elif kind == 'company':
+        stmt = filters.select(lambda: select(func.coalesce(CompanyProfile.company_name, 'Unknown'),
+                                             func.sum(VehicleLog.amount_paid))
+                              .outerjoin(CompanyProfile, CompanyProfile.user_id == VehicleLog.company_id))
+        stmt += lambda s: s.group_by(CompanyProfile.company_name)
+        totals = {name: total for name, total in db.session.execute(stmt).all()}
+    else:
+        stmt = filters.select(lambda: select(VehicleLog.checkpoint, func.sum(VehicleLog.amount_paid)))
+        stmt += lambda s: s.group_by(VehicleLog.checkpoint)
+        totals = {name: total for name, total in db.session.execute(stmt).all()}
+    archived = archive_for(filters)
+    if archived:
+        extra.append(archived.group_totals(filters, column))
+
+    names = company_names({key for groups in extra for key in groups}) if kind == 'company' else {}
+    for groups in extra:
+        for key, (_, revenue) in groups.items():
+            label = names.get(key, 'Unknown') if kind == 'company' else key
+            totals[label] = (totals.get(label) or 0) + revenue
+    if not totals:
+        abort(404)
+
+    png = base64.b64decode(generate_chart_base64(totals, title, chart_type=chart_type))
+    response = make_response(png)
+    response.mimetype = 'image/png'
+    return add_validators(response, etag, watermark.log_time)
 
 
 # ---------------------
@@ -132,18 +155,34 @@ def entry():
         return render_template('access_denied.html', message="Only officers can access this page.")
 
     if request.method == 'POST':
-        log = VehicleLog(
+        company_id = request.form.get('company_id')  # must be valid user id
+        row = dict(
             number_plate=request.form['number_plate'],
-            company_id=request.form.get('company_id'),  # must be valid user id
+            company_id=int(company_id) if company_id else None,
             phone=request.form['phone'],
             email=request.form['email'],
             location=request.form['location'],
             checkpoint=request.form['checkpoint'],
             amount_paid=float(request.form['amount_paid']),
-            officer_id=current_user.id
+            officer_id=current_user.id,
+            timestamp=datetime.utcnow(),
         )
-        db.session.add(log)
-        db.session.commit()
+        writer = ingest.writer()
+        committed = False
+        if writer is not None:
+            try:
+                writer.submit(row)
+                committed = True
+                note_write()
+            except ingest.IngestUnavailable:
+                pass
+            except TimeoutError:
+                flash("The entry is taking longer than usual to save. Check the dashboard before entering it again.",
+                      "warning")
+                return redirect(url_for('checkpoint.entry'))
+        if not committed:
+            db.session.add(VehicleLog(**row))
+            db.session.commit()
         flash("Vehicle entry recorded successfully.", "success")
         return redirect(url_for('checkpoint.entry'))
 
@@ -151,10 +190,117 @@ def entry():
         .join(CompanyProfile, CompanyProfile.user_id == User.id)\
         .order_by(CompanyProfile.company_name).all()
 
-    return render_template('entry.html', companies=companies)
+    return render_template('entry.html', companies=companies, shift=_open_shift(current_user.id))
+
+
+# ---------------------
+# Officer Shifts
+# ---------------------
+def _open_shift(officer_id):
+    return OfficerShift.query.filter_by(officer_id=officer_id, end_time=None)\
+        .order_by(OfficerShift.start_time.desc()).first()
+
+
+@checkpoint_bp.route('/shift/start', methods=['POST'])
+@login_required
+def start_shift():
+    if current_user.role != 'officer':
+        return render_template('access_denied.html', message="Only officers can start shifts."), 403
+
+    if _open_shift(current_user.id):
+        flash("You already have a shift in progress.", "warning")
+        return redirect(url_for('checkpoint.entry'))
+
+    profile = current_user.officer_profile
+    checkpoint = request.form.get('checkpoint') or (profile.checkpoint if profile else None)
+    if not checkpoint:
+        flash("Enter the checkpoint for this shift.", "danger")
+        return redirect(url_for('checkpoint.entry'))
+
+    db.session.add(OfficerShift(officer_id=current_user.id, start_time=datetime.utcnow(), checkpoint=checkpoint))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A second start posted at the same moment lost to the one-open-shift index
+        db.session.rollback()
+        flash("You already have a shift in progress.", "warning")
+        return redirect(url_for('checkpoint.entry'))
+    flash(f"Shift started at {checkpoint}.", "success")
+    return redirect(url_for('checkpoint.entry'))
+
+
+@checkpoint_bp.route('/shift/end', methods=['POST'])
+@login_required
+def end_shift():
+    if current_user.role != 'officer':
+        return render_template('access_denied.html', message="Only officers can end shifts."), 403
+
+    shift = _open_shift(current_user.id)
+    if not shift:
+        flash("You have no shift in progress.", "warning")
+        return redirect(url_for('checkpoint.entry'))
+
+    shift.end_time = datetime.utcnow()
+    db.session.commit()
+    flash("Shift ended.", "success")
+    return redirect(url_for('checkpoint.entry'))
+
+
+# ---------------------
+# Raw CSV export (every column, with company and officer names)
+# ---------------------
+@checkpoint_bp.route('/export/raw.csv')
+@login_required
+@read_replica
+def raw_export():
+    if current_user.role != 'admin':
+        return render_template('access_denied.html'), 403
+
+    filters = LogFilter.from_args(request.args)
+    response = Response(stream_with_context(raw_export_csv(filters)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = 'attachment; filename=vehicle_logs_raw.csv'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 
 # generate_report and email functions below,
+REPORT_MIMETYPES = {
+    'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'pdf': 'application/pdf',
+}
+REPORT_FILENAMES = {'excel': 'checkpoint_report.xlsx', 'pdf': 'checkpoint_report.pdf'}
+
+
+def send_report_email(to_address, output, filename, format):
+    """Queue the rendered report for delivery and return to the report page without waiting on SMTP."""
+    outbox = current_app.extensions['mailer']
+    outbox.enqueue(
+        to_address,
+        subject="Checkpoint Report",
+        body=(f"Please find the attached checkpoint report ({filename}).\n\n"
+              "Generated by Vehicle Checkpoint Monitoring System"),
+        attachment=output.getvalue(),
+        attachment_name=filename,
+        attachment_type=REPORT_MIMETYPES[format],
+    )
+    db.session.commit()
+    outbox.wake()
+    flash(f"Report queued for delivery to {to_address}.", "success")
+    return redirect(url_for('checkpoint.report_download'))
+
+
+def _deliver_report(output, format, send_email, key, last_modified):
+    """Email or download a rendered report. ``output`` is a BytesIO or the path of a cached artifact."""
+    filename = REPORT_FILENAMES[format]
+    if send_email:
+        if isinstance(output, str):
+            with open(output, 'rb') as fh:
+                output = io.BytesIO(fh.read())
+        return send_report_email(send_email, output, filename, format)
+    response = send_file(output, download_name=filename, as_attachment=True, mimetype=REPORT_MIMETYPES[format])
+    return add_validators(response, key, last_modified) if cacheable() else response
+
+
 @checkpoint_bp.route('/report_download')
 @login_required
 def report_download():
@@ -163,6 +309,7 @@ def report_download():
 
 @checkpoint_bp.route('/generate_report')
 @login_required
+@read_replica
 def generate_report():
     if current_user.role != 'admin':
         flash("Only admins can generate reports.", "danger")
@@ -172,39 +319,28 @@ def generate_report():
     send_email = request.args.get('email')
     include_chart = request.args.get('include_chart') == '1'
 
-    company_id = request.args.get('company_id', type=int)
-    checkpoint = request.args.get('checkpoint')
-    month = request.args.get('month', type=int)
-    year = request.args.get('year', type=int)
-    week = request.args.get('week', type=int)
-    day = request.args.get('day')
-    hour = request.args.get('hour', type=int)
-    specific_date = request.args.get('date')
-
-    query = VehicleLog.query
-
-    if company_id:
-        query = query.filter(VehicleLog.company_id == company_id)
-    if checkpoint:
-        query = query.filter(VehicleLog.checkpoint == checkpoint)
-    if month:
-        query = query.filter(extract('month', VehicleLog.timestamp) == month)
-    if year:
-        query = query.filter(extract('year', VehicleLog.timestamp) == year)
-    if week:
-        query = query.filter(func.date_part('week', VehicleLog.timestamp) == week)
-    if day:
-        query = query.filter(func.to_char(VehicleLog.timestamp, 'Day').ilike(f'%{day.capitalize()}%'))
-    if hour is not None:
-        query = query.filter(extract('hour', VehicleLog.timestamp) == hour)
-    if specific_date:
-        try:
-            dt = datetime.strptime(specific_date, '%Y-%m-%d').date()
-            query = query.filter(func.date(VehicleLog.timestamp) == dt)
-        except ValueError:
-            flash("Invalid date format for 'date'. Use YYYY-MM-DD.", "danger")
-
-    logs = query.order_by(VehicleLog.timestamp.desc()).all()
+    filters = LogFilter.from_args(request.args)
+    if filters.invalid_date:
+        flash("Invalid date format for 'date'. Use YYYY-MM-DD.", "danger")
+
+    # The report's content address: only logs inside the filtered range can change it
+    key = scoped = None
+    report_cache = reports.cache()
+    if format in REPORT_FILENAMES:
+        scoped = range_watermark(filters)
+        key = report_key(format, filters, include_chart, scoped)
+        # Downloads of an unchanged report are answered from the client's copy
+        if not send_email and cacheable():
+            cached = not_modified(key, scoped.log_time)
+            if cached:
+                return cached
+        hit = report_cache.get(key, format) if report_cache else None
+        if hit:
+            return _deliver_report(hit, format, send_email, key, scoped.log_time)
+
+    stmt = filters.select(lambda: select(VehicleLog))
+    stmt += lambda s: s.order_by(VehicleLog.timestamp.desc())
+    logs = db.session.execute(stmt).scalars().all()
 
     data = []
     for l in logs:
@@ -217,6 +353,20 @@ def generate_report():
             "Timestamp": l.timestamp.strftime('%Y-%m-%d %H:%M')
         })
 
+    # Ranges reaching back past the hot table continue with archived months (older, so appended)
+    archived = archive_for(filters)
+    for frame in archived.frames(filters) if archived else ():
+        records = archived.records(frame)
+        names = company_names({record['company_id'] for record in records})
+        for record in records:
+            data.append({
+                "Number Plate": record['number_plate'],
+                "Company": names.get(record['company_id'], "Unknown"),
+                "Checkpoint": record['checkpoint'],
+                "Amount Paid": record['amount_paid'],
+                "Timestamp": record['timestamp'].strftime('%Y-%m-%d %H:%M')
+            })
+
     if format == 'excel':
         output = io.BytesIO()
         df = pd.DataFrame(data)
@@ -229,9 +379,9 @@ def generate_report():
             worksheet.write(len(df) + 1, 2, 'Total:')
             worksheet.write_formula(len(df) + 1, 3, f'=SUM(D2:D{len(df)+1})', fmt)
         output.seek(0)
-        if send_email:
-            return send_report_email(send_email, output, 'checkpoint_report.xlsx', 'excel')
-        return send_file(output, download_name='checkpoint_report.xlsx', as_attachment=True)
+        if report_cache:
+            report_cache.put(key, format, output.getvalue())
+        return _deliver_report(output, format, send_email, key, scoped.log_time)
 
     elif format == 'pdf':
         output = io.BytesIO()
@@ -247,10 +397,12 @@ def generate_report():
         p.drawString(140, y, "Checkpoint Report")
         y -= 20
         p.setFont("Helvetica", 9)
-        p.drawString(140, y, "Generated: " + datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        # Stamp the newest log rather than the wall clock, so a cached copy stays accurate
+        newest = scoped.log_time.strftime('%Y-%m-%d %H:%M') if scoped.log_time else (data[0]["Timestamp"] if data else None)
+        p.drawString(140, y, f"Data through: {newest}" if newest else "No logs in range")
         y -= 40
 
-        if include_chart and logs:
+        if include_chart and data:
             chart_io = io.BytesIO()
             df = pd.DataFrame(data)
             df_grouped = df.groupby("Company")["Amount Paid"].sum()
@@ -291,10 +443,9 @@ def generate_report():
         p.drawString(40, 30, "Generated by Vehicle Checkpoint Monitoring System")
         p.save()
         output.seek(0)
-
-        if send_email:
-            return send_report_email(send_email, output, 'checkpoint_report.pdf', 'pdf')
-        return send_file(output, download_name='checkpoint_report.pdf', as_attachment=True)
+        if report_cache:
+            report_cache.put(key, format, output.getvalue())
+        return _deliver_report(output, format, send_email, key, scoped.log_time)
 
     return render_template('report_download.html', user=current_user)
 
@@ -1,9 +1,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
-from models import db, Token, CargoType, User
+from models import db, Token, CargoType, User, VehicleLog, OfficerShift
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 import uuid
 from flask import abort
+from services import events, tokens
 
 token_bp = Blueprint('token', __name__)
 
@@ -87,6 +89,16 @@ def token_history():
 # ------------------------
 # Officer: Verify Token
 # ------------------------
+def _rejection(serial, plate):
+    """Why ``serial`` could not be consumed for ``plate``; marks a lapsed token expired."""
+    token = Token.query.filter_by(serial=serial).first()
+    reason = tokens.rejection(token, plate)
+    if reason == 'expired' and token.status != 'expired':
+        token.status = 'expired'
+        db.session.commit()
+    return reason
+
+
 @token_bp.route('/verify_token', methods=['GET', 'POST'])
 @login_required
 def verify_token():
@@ -98,28 +110,81 @@ def verify_token():
     token = None
 
     if request.method == 'POST':
-        serial = request.form['serial'].strip().upper()
-        plate = request.form['vehicle_plate'].strip().upper()
-
-        token = Token.query.filter_by(serial=serial).first()
-        if not token:
-            status = "invalid"
-        elif token.vehicle_plate != plate:
-            status = "mismatch"
-        elif token.status == 'used':
-            status = "used"
-        elif token.expiration_date < datetime.utcnow():
-            token.status = 'expired'
-            db.session.commit()
-            status = "expired"
+        serial, plate = tokens.normalise(request.form['serial'], request.form['vehicle_plate'])
+
+        # One conditional UPDATE, so two officers verifying the same token at once cannot both succeed
+        now = datetime.utcnow()
+        consumed = db.session.execute(
+            tokens.consume(serial, plate, now).returning(Token.id, Token.company_id, Token.price)
+        ).first()
+        if consumed is None:
+            db.session.rollback()
+            status = _rejection(serial, plate)
+            profile = current_user.officer_profile
+            events.emit(db.session, events.token_rejected_event(
+                serial, plate, status, profile.checkpoint if profile else None, current_user.id))
         else:
-            token.status = 'used'
-            token.used_at = datetime.utcnow()
+            events.record(db.session, events.token_verified_event(SimpleNamespace(
+                serial=serial, vehicle_plate=plate, company_id=consumed.company_id, price=consumed.price,
+                used_at=now)))
             db.session.commit()
+            token = db.session.get(Token, consumed.id)
             status = "valid"
 
     return render_template('verify_token.html', status=status, token=token)
 
+# ------------------------
+# Officer: Scan Token and Log Entry (one request, one transaction)
+# ------------------------
+@token_bp.route('/scan', methods=['POST'])
+@login_required
+def scan_token():
+    if current_user.role != 'officer':
+        flash("Only checkpoint officers can verify tokens.", "danger")
+        return redirect(url_for('checkpoint.entry'))
+
+    serial, plate = tokens.normalise(request.form['serial'], request.form['vehicle_plate'])
+    shift = OfficerShift.query.filter_by(officer_id=current_user.id, end_time=None)\
+        .order_by(OfficerShift.start_time.desc()).first()
+    profile = current_user.officer_profile
+    checkpoint = request.form.get('checkpoint') or (shift.checkpoint if shift else None) \
+        or (profile.checkpoint if profile else None)
+    if not checkpoint:
+        flash("Start a shift or enter the checkpoint before scanning tokens.", "danger")
+        return redirect(url_for('checkpoint.entry'))
+
+    # Consuming the token is a single conditional UPDATE, so two officers scanning the same
+    # token at once cannot both succeed; the log below commits in the same transaction
+    now = datetime.utcnow()
+    consumed = db.session.execute(
+        tokens.consume(serial, plate, now).returning(Token.company_id, Token.price)
+    ).first()
+    if consumed is None:
+        db.session.rollback()
+        reason = _rejection(serial, plate)
+        events.emit(db.session, events.token_rejected_event(serial, plate, reason, checkpoint, current_user.id))
+        flash(tokens.REJECTIONS[reason], "danger")
+        return redirect(url_for('checkpoint.entry'))
+
+    log = VehicleLog(
+        number_plate=plate,
+        company_id=consumed.company_id,
+        phone=request.form.get('phone') or None,
+        email=request.form.get('email') or None,
+        location=request.form.get('location') or None,
+        checkpoint=checkpoint,
+        amount_paid=consumed.price,
+        officer_id=current_user.id,
+        token_serial=serial,
+        timestamp=now,
+    )
+    db.session.add(log)
+    events.record(db.session, events.token_verified_event(SimpleNamespace(
+        serial=serial, vehicle_plate=plate, company_id=consumed.company_id, price=consumed.price, used_at=now)))
+    db.session.commit()
+    flash(f"Token {serial} verified and entry logged: {plate}, ZMW {consumed.price:.2f}.", "success")
+    return redirect(url_for('checkpoint.entry'))
+
 # ------------------------
 # Admin: Manage Cargo Prices
 # ------------------------
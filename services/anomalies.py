@@ -0,0 +1,325 @@
+"""Streaming detection of cloned plates and reused tokens.
+
+A detector thread consumes the committed-change feed (``services.events``)
+and keeps a sliding window of sightings per normalised plate. Two kinds of
+alert are raised:
+
+- ``impossible_travel``: the plate was logged at two different checkpoints
+  closer together in time than the configured travel time between them.
+- ``token_reuse``: one token serial is attached to two vehicle logs, or a
+  token that was already used is presented again at verification.
+
+Travel times come from ``ANOMALY_TRAVEL_MINUTES``, a mapping such as
+``{"North|South": 90}`` (the pair is unordered, and names are matched
+case-insensitively). ``ANOMALY_DEFAULT_TRAVEL_MINUTES`` applies to any pair
+not listed, and 0 disables it. The detector uses event time, not arrival
+time: each plate's sightings are kept in timestamp order whatever order they
+arrive in. Sightings older than the longest travel time behind the newest
+event are evicted (a late one already that old is checked but not kept), and
+so are token uses older than ``ANOMALY_TOKEN_WINDOW_HOURS``. Memory therefore tracks the traffic inside the window, not the size of the
+table. At most ``ANOMALY_MAX_ALERTS`` alerts are kept.
+
+State lives in memory, per worker. On start the detector is rebuilt by
+replaying the window from ``vehicle_logs``. Every worker receives every
+event (through LISTEN/NOTIFY on Postgres), so all workers converge on the
+same alerts. ``rebuild(hours)`` replays a longer stretch of history on
+demand.
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict, deque, namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import select
+
+from models import db, VehicleLog
+from services import events
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+REPLAY_BATCH = 5000
+
+ALERTS = registry.counter('checkpoint_anomaly_alerts_total', 'Anomaly alerts raised, by kind.', ('kind',))
+TRACKED = registry.gauge('checkpoint_anomaly_tracked', 'Plates and token serials inside the detection window.',
+                         ('key',))
+
+Sighting = namedtuple('Sighting', 'log_id timestamp checkpoint officer_id token_serial')
+Alert = namedtuple('Alert', 'kind plate timestamp message first second token_serial detected_at')
+
+
+def normalise_plate(plate):
+    """'abc 123' and 'ABC-123' are the same vehicle."""
+    return re.sub(r'[^A-Z0-9]', '', (plate or '').upper())
+
+
+def _checkpoint_key(checkpoint):
+    return (checkpoint or '').strip().lower()
+
+
+def parse_travel_minutes(mapping):
+    """``{"North|South": 90}`` -> ``{frozenset({'north', 'south'}): 90.0}``."""
+    travel = {}
+    for pair, minutes in (mapping or {}).items():
+        names = [_checkpoint_key(name) for name in pair.split('|')]
+        if len(names) != 2 or not all(names):
+            raise ValueError(f"Travel time key {pair!r} must look like 'Checkpoint A|Checkpoint B'")
+        travel[frozenset(names)] = float(minutes)
+    return travel
+
+
+class AnomalyDetector:
+    def __init__(self, travel_minutes=None, default_travel_minutes=30, token_window_hours=72, max_alerts=1000):
+        self.travel = parse_travel_minutes(travel_minutes)
+        self.default_travel = timedelta(minutes=default_travel_minutes)
+        self.window = max([self.default_travel] + [timedelta(minutes=m) for m in self.travel.values()])
+        self.token_window = timedelta(hours=token_window_hours)
+        self.max_alerts = max_alerts
+        self._lock = threading.Lock()
+        self._reset()
+        self._alerts = OrderedDict()
+        self.events_processed = 0
+
+    def _reset(self):
+        self._plates = OrderedDict()   # plate -> deque of Sightings, least recently seen plate first
+        self._tokens = OrderedDict()   # serial -> (Sighting, plate), oldest use first
+        self._high_water = None        # newest event time seen; the windows trail it
+
+    def travel_time(self, a, b):
+        a, b = _checkpoint_key(a), _checkpoint_key(b)
+        if not a or not b or a == b:
+            return None
+        limit = self.travel.get(frozenset((a, b)))
+        if limit is not None:
+            return timedelta(minutes=limit)
+        return self.default_travel or None
+
+    # ---------------------
+    # Feeding
+    # ---------------------
+    def observe(self, payload):
+        """Process one event payload from the bus. Returns the alerts it raised."""
+        with self._lock:
+            self.events_processed += 1
+            if payload.get('type') == 'vehicle_log':
+                sighting = Sighting(payload['id'], datetime.fromisoformat(payload['timestamp']),
+                                    payload.get('checkpoint'), payload.get('officer_id'), payload.get('token_serial'))
+                return self._log(normalise_plate(payload.get('number_plate')), sighting)
+            if payload.get('type') == 'token_rejected' and payload.get('reason') == 'used':
+                return self._representation(payload)
+            return []
+
+    def _log(self, plate, sighting):
+        if not plate or sighting.timestamp is None:
+            return []
+        self._advance(sighting.timestamp)
+        alerts = []
+        seen = self._plates.get(plate)
+        if seen is None:
+            seen = self._plates[plate] = deque()
+        elif any(s.log_id == sighting.log_id for s in seen):
+            # Already replayed from history (rebuild racing the live feed)
+            return []
+        horizon = self._high_water - self.window
+        while seen and seen[0].timestamp < horizon:
+            seen.popleft()
+        for earlier in seen:
+            limit = self.travel_time(earlier.checkpoint, sighting.checkpoint)
+            gap = abs(sighting.timestamp - earlier.timestamp)
+            if limit is not None and gap < limit:
+                first, second = sorted((earlier, sighting), key=lambda s: s.timestamp)
+                alerts.append(self._raise(
+                    'impossible_travel', plate, second.timestamp,
+                    f"{plate} logged at {first.checkpoint} and {second.checkpoint} "
+                    f"{gap.total_seconds() / 60:.0f} min apart (travel takes at least "
+                    f"{limit.total_seconds() / 60:.0f} min)",
+                    first, second))
+        if sighting.timestamp < horizon:
+            # Too late to keep: it would be the first thing evicted
+            if not seen:
+                del self._plates[plate]
+        else:
+            # Keep the sightings in event order, so eviction from the left holds when a late or
+            # back-dated log arrives after newer ones; late arrivals are rare and land near the end
+            position = len(seen)
+            while position and seen[position - 1].timestamp > sighting.timestamp:
+                position -= 1
+            seen.insert(position, sighting)
+            if position == len(seen) - 1:
+                self._plates.move_to_end(plate)
+
+        if sighting.token_serial:
+            earlier = self._tokens.get(sighting.token_serial)
+            if earlier is not None and earlier[0].log_id != sighting.log_id:
+                first, second = sorted((earlier[0], sighting), key=lambda s: s.timestamp)
+                alerts.append(self._raise(
+                    'token_reuse', plate, second.timestamp,
+                    f"Token {sighting.token_serial} attached to two entries "
+                    f"({first.checkpoint} and {second.checkpoint})",
+                    first, second, sighting.token_serial))
+            else:
+                self._tokens[sighting.token_serial] = (sighting, plate)
+                self._tokens.move_to_end(sighting.token_serial)
+        return [alert for alert in alerts if alert]
+
+    def _representation(self, payload):
+        serial = payload.get('serial')
+        presented_at = datetime.fromisoformat(payload['timestamp'])
+        self._advance(presented_at)
+        plate = normalise_plate(payload.get('vehicle_plate'))
+        again = Sighting(None, presented_at, payload.get('checkpoint'), payload.get('officer_id'), serial)
+        earlier = self._tokens.get(serial)
+        where = f" (first used at {earlier[0].checkpoint} {earlier[0].timestamp:%Y-%m-%d %H:%M})" if earlier else ''
+        alert = self._raise('token_reuse', plate, presented_at,
+                            f"Used token {serial} presented again for {plate}{where}",
+                            earlier[0] if earlier else None, again, serial)
+        return [alert] if alert else []
+
+    def _raise(self, kind, plate, timestamp, message, first, second, token_serial=None):
+        key = (kind, token_serial or plate, first and first.log_id, second.log_id, second.timestamp)
+        if key in self._alerts:
+            return None
+        alert = Alert(kind, plate, timestamp, message, first, second, token_serial, datetime.utcnow())
+        self._alerts[key] = alert
+        while len(self._alerts) > self.max_alerts:
+            self._alerts.popitem(last=False)
+        ALERTS.inc((kind,))
+        logger.warning('Anomaly: %s', message)
+        return alert
+
+    def _advance(self, timestamp):
+        if self._high_water is None or timestamp > self._high_water:
+            self._high_water = timestamp
+        self._evict()
+
+    def _evict(self):
+        horizon = self._high_water - self.window
+        while self._plates:
+            plate, seen = next(iter(self._plates.items()))
+            while seen and seen[0].timestamp < horizon:
+                seen.popleft()
+            if seen:
+                break
+            del self._plates[plate]
+        token_horizon = self._high_water - self.token_window
+        while self._tokens:
+            serial, (sighting, _) = next(iter(self._tokens.items()))
+            if sighting.timestamp >= token_horizon:
+                break
+            del self._tokens[serial]
+
+    # ---------------------
+    # Reading
+    # ---------------------
+    def alerts(self, kind=None, limit=None):
+        """Alerts newest first."""
+        with self._lock:
+            alerts = [a for a in reversed(self._alerts.values()) if kind is None or a.kind == kind]
+        return alerts[:limit] if limit else alerts
+
+    def stats(self):
+        with self._lock:
+            return {
+                'plates': len(self._plates),
+                'sightings': sum(len(seen) for seen in self._plates.values()),
+                'tokens': len(self._tokens),
+                'alerts': len(self._alerts),
+                'events': self.events_processed,
+                'window_minutes': self.window.total_seconds() / 60,
+                'high_water': self._high_water,
+            }
+
+    # ---------------------
+    # History
+    # ---------------------
+    def replay(self, since):
+        """Feed every log from ``since`` onwards through the detector, oldest first. Returns the alerts raised."""
+        stmt = (
+            select(VehicleLog.id, VehicleLog.number_plate, VehicleLog.timestamp, VehicleLog.checkpoint,
+                   VehicleLog.officer_id, VehicleLog.token_serial)
+            .where(VehicleLog.timestamp >= since)
+            .order_by(VehicleLog.timestamp, VehicleLog.id)
+            .execution_options(yield_per=REPLAY_BATCH)
+        )
+        raised = []
+        for row in db.session.execute(stmt):
+            with self._lock:
+                self.events_processed += 1
+                raised.extend(self._log(normalise_plate(row.number_plate), Sighting(
+                    row.id, row.timestamp, row.checkpoint, row.officer_id, row.token_serial)))
+        return raised
+
+    def rebuild(self, hours=None):
+        """Forget the windows and replay history: the last ``hours``, or just enough to refill the windows."""
+        span = timedelta(hours=hours) if hours else max(self.window, self.token_window)
+        with self._lock:
+            self._reset()
+        raised = self.replay(datetime.utcnow() - span)
+        logger.info('Anomaly detector rebuilt from %s of history: %d new alerts', span, len(raised))
+        return raised
+
+
+class DetectorThread:
+    """Subscribes the detector to the event bus of one worker; started by its first request."""
+
+    def __init__(self, app, detector):
+        self.app = app
+        self.detector = detector
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='anomaly-detector', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # Subscribe before replaying so nothing committed in between is missed; duplicates are skipped
+        subscription = events.bus.subscribe()
+        try:
+            with self.app.app_context():
+                self.detector.rebuild()
+                db.session.remove()
+        except Exception:
+            logger.exception('Anomaly detector could not replay history; starting from live events only')
+        while True:
+            payload = subscription.get()
+            try:
+                self.detector.observe(payload)
+            except Exception:
+                logger.exception('Anomaly detector failed on event %r', payload)
+
+
+def detector():
+    """The app's anomaly detector, or None when disabled."""
+    return current_app.extensions.get('anomalies')
+
+
+def init_app(app):
+    for key, default in (('ANOMALY_DETECTION', True), ('ANOMALY_TRAVEL_MINUTES', {}),
+                         ('ANOMALY_DEFAULT_TRAVEL_MINUTES', 30), ('ANOMALY_TOKEN_WINDOW_HOURS', 72),
+                         ('ANOMALY_MAX_ALERTS', 1000)):
+        app.config.setdefault(key, default)
+    anomaly_detector = AnomalyDetector(
+        travel_minutes=app.config['ANOMALY_TRAVEL_MINUTES'],
+        default_travel_minutes=app.config['ANOMALY_DEFAULT_TRAVEL_MINUTES'],
+        token_window_hours=app.config['ANOMALY_TOKEN_WINDOW_HOURS'],
+        max_alerts=app.config['ANOMALY_MAX_ALERTS'],
+    )
+    app.extensions['anomalies'] = anomaly_detector
+
+    def collect():
+        stats = anomaly_detector.stats()
+        TRACKED.set(('plates',), stats['plates'])
+        TRACKED.set(('tokens',), stats['tokens'])
+
+    registry.add_collector(collect)
+    if app.config['ANOMALY_DETECTION']:
+        # Started by the first request rather than at import, so CLI commands never spawn it
+        app.before_request(DetectorThread(app, anomaly_detector).start)
+    return anomaly_detector
@@ -0,0 +1,511 @@
+"""Cold archive of closed months of vehicle logs.
+
+``archive_month`` copies one calendar month of ``vehicle_logs`` into a
+compressed columnar file: ``vehicle_logs_YYYY-MM.npz`` holds one NumPy array
+per column. It verifies the copy and then removes the month from the hot
+table. On a partitioned table the month's partition is dropped; otherwise
+the rows are deleted. ``manifest.json`` in the same directory lists every
+archived month with its row count, revenue, id range and checksum, plus a
+summary: totals per (company, checkpoint) and the weekday x hour grid.
+
+Months are archived oldest first, so the archive always covers one
+contiguous stretch ending at ``archived_until``. Everything from that date
+onwards is still hot. The archive is only consulted when a filter's time
+range reaches back before ``archived_until``. Totals, series and the
+heatmap for whole months (by company or checkpoint at most) come from the
+summaries without reading a file, so an unfiltered dashboard costs nothing
+here. Everything else reads month by month, through a small frame cache
+when the range fits in it.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from flask import current_app
+from sqlalchemy import delete, func, select, text
+
+from models import db, VehicleLog, CompanyProfile
+from services import partitions
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+NULL_ID = -1
+# Hot rows are deleted by id in chunks of this many
+DELETE_BATCH = 5000
+INT_COLUMNS = ('id', 'company_id', 'officer_id')
+TEXT_COLUMNS = ('number_plate', 'phone', 'email', 'location', 'checkpoint', 'token_serial')
+COLUMNS = ('id', 'number_plate', 'company_id', 'phone', 'email', 'location', 'checkpoint',
+           'amount_paid', 'officer_id', 'timestamp', 'token_serial')
+
+
+def month_key(month):
+    return f'{month.year:04d}-{month.month:02d}'
+
+
+def parse_month_key(key):
+    year, month = key.split('-')
+    return date(int(year), int(month), 1)
+
+
+class LogArchive:
+    def __init__(self, directory, cache_months=12):
+        self.directory = directory
+        self.cache_months = cache_months
+        self._lock = threading.Lock()
+        self._manifest = {'version': 0, 'months': {}}
+        self._manifest_mtime = None
+        self._frames = OrderedDict()
+
+    # ---------------------
+    # Manifest
+    # ---------------------
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    @property
+    def manifest(self):
+        """The manifest, re-read whenever another process has rewritten it."""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return self._manifest
+        with self._lock:
+            if mtime != self._manifest_mtime:
+                with open(self.manifest_path) as fh:
+                    self._manifest = json.load(fh)
+                self._manifest_mtime = mtime
+                self._frames.clear()
+            return self._manifest
+
+    def _save_manifest(self, manifest):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f'{self.manifest_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(manifest, fh, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
+
+    @property
+    def version(self):
+        return self.manifest['version']
+
+    @property
+    def archived_until(self):
+        """Exclusive end of the archived stretch, or None when nothing is archived."""
+        months = self.manifest['months']
+        if not months:
+            return None
+        return partitions.add_months(parse_month_key(max(months)), 1)
+
+    # ---------------------
+    # Reading
+    # ---------------------
+    def months_for(self, filters):
+        """Archived month keys that can hold rows matching ``filters``, oldest first."""
+        keys = []
+        for key in sorted(self.manifest['months']):
+            start = parse_month_key(key)
+            end = partitions.add_months(start, 1)
+            if filters.month and not filters.year and start.month != filters.month:
+                continue
+            if all(lo.date() < end and hi.date() > start for lo, hi in filters.time_ranges()):
+                keys.append(key)
+        return keys
+
+    def filter_options(self):
+        """``(years, checkpoints)`` present in the archive, for the dashboard dropdowns."""
+        years, checkpoints = set(), set()
+        for key, entry in self.manifest['months'].items():
+            if not entry['rows']:
+                continue
+            years.add(parse_month_key(key).year)
+            summary = entry.get('summary')
+            if summary is not None:
+                checkpoints.update(group[1] for group in summary['groups'])
+            else:
+                checkpoints.update(_nullable(value) for value in self._read(key)['checkpoint'].unique())
+        checkpoints.discard(None)
+        return years, checkpoints
+
+    def reaches(self, filters):
+        return bool(self.months_for(filters))
+
+    @staticmethod
+    def whole_months(filters):
+        """True when ``filters`` keep or drop whole months, narrowed at most by company and checkpoint.
+
+        Such filters are answered from the manifest's per-month summaries without reading any file.
+        """
+        if filters.week or filters.day or filters.hour is not None or filters.date:
+            return False
+        return not (filters.year and not 1 <= filters.year <= 9998) and not (filters.month and not 1 <= filters.month <= 12)
+
+    def _read(self, key):
+        entry = self.manifest['months'][key]
+        with np.load(os.path.join(self.directory, entry['file'])) as data:
+            return pd.DataFrame({name: data[name] for name in COLUMNS})
+
+    def _load(self, key):
+        with self._lock:
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return self._frames[key]
+        frame = self._read(key)
+        with self._lock:
+            self._frames[key] = frame
+            while len(self._frames) > self.cache_months:
+                self._frames.popitem(last=False)
+        return frame
+
+    def _month_frame(self, key, filters, cache=True):
+        """One month's rows matching ``filters``, newest first. ``cache=False`` reads past the frame cache."""
+        df = self._load(key) if cache else self._read(key)
+        ts = df['timestamp']
+        mask = np.ones(len(df), dtype=bool)
+        if filters.company_id:
+            mask &= df['company_id'].to_numpy() == filters.company_id
+        if filters.checkpoint:
+            mask &= df['checkpoint'].to_numpy() == filters.checkpoint
+        for start, end in filters.time_ranges():
+            mask &= ((ts >= start) & (ts < end)).to_numpy()
+        if filters.month:
+            mask &= (ts.dt.month == filters.month).to_numpy()
+        if filters.year:
+            mask &= (ts.dt.year == filters.year).to_numpy()
+        if filters.week:
+            mask &= (ts.dt.isocalendar().week == filters.week).to_numpy()
+        if filters.day:
+            mask &= ts.dt.day_name().str.contains(filters.day.capitalize(), regex=False).to_numpy()
+        if filters.hour is not None:
+            mask &= (ts.dt.hour == filters.hour).to_numpy()
+        return df[mask].sort_values(['timestamp', 'id'], ascending=False, ignore_index=True)
+
+    def _cacheable(self, keys):
+        # A query spanning more months than the cache holds would only evict everything else
+        return len(keys) <= self.cache_months
+
+    def frames(self, filters, newest_first=True):
+        """Matching archived rows one month at a time, for exports that walk every row.
+
+        Months are read one by one, so memory holds a single month however wide the range.
+        """
+        keys = self.months_for(filters)
+        cache = self._cacheable(keys)
+        for key in (reversed(keys) if newest_first else keys):
+            df = self._month_frame(key, filters, cache)
+            if len(df):
+                yield df
+
+    def frame(self, filters):
+        """Archived rows matching ``filters`` as one DataFrame, newest first. Meant for bounded ranges."""
+        frames = list(self.frames(filters))
+        if not frames:
+            return pd.DataFrame({name: [] for name in COLUMNS})
+        return pd.concat(frames, ignore_index=True)
+
+    def _month_groups(self, key, filters, cache=True):
+        """``[(company_id, checkpoint, vehicles, revenue)]`` for one month under ``filters``."""
+        summary = self.manifest['months'][key].get('summary')
+        if summary is not None and self.whole_months(filters):
+            return [(company_id, checkpoint, count, revenue)
+                    for company_id, checkpoint, count, revenue in summary['groups']
+                    if (not filters.company_id or company_id == filters.company_id)
+                    and (not filters.checkpoint or checkpoint == filters.checkpoint)]
+        df = self._month_frame(key, filters, cache)
+        if not len(df):
+            return []
+        grouped = df.groupby(['company_id', 'checkpoint'])['amount_paid'].agg(['size', 'sum'])
+        return [(_nullable(company_id), _nullable(checkpoint), int(count), float(total))
+                for (company_id, checkpoint), (count, total) in grouped.iterrows()]
+
+    def _groups(self, filters):
+        keys = self.months_for(filters)
+        cache = self._cacheable(keys)
+        for key in keys:
+            yield from self._month_groups(key, filters, cache)
+
+    def totals(self, filters):
+        vehicles, revenue = 0, 0.0
+        for _, _, count, total in self._groups(filters):
+            vehicles += count
+            revenue += total
+        return vehicles, revenue
+
+    def group_totals(self, filters, column):
+        """``{value: (vehicles, revenue)}`` grouped on ``column`` (company_id or checkpoint)."""
+        index = 0 if column == 'company_id' else 1
+        groups = {}
+        for group in self._groups(filters):
+            count, total = groups.get(group[index], (0, 0.0))
+            groups[group[index]] = (count + group[2], total + group[3])
+        return groups
+
+    def matrix(self, filters):
+        """Vehicle counts and revenue as 7 x 24 (weekday x hour, Monday first) grids."""
+        counts, revenue = np.zeros((7, 24), dtype=np.int64), np.zeros((7, 24))
+        keys = self.months_for(filters)
+        cache = self._cacheable(keys)
+        for key in keys:
+            summary = self.manifest['months'][key].get('summary')
+            if summary is not None and self.whole_months(filters) and not filters.company_id and not filters.checkpoint:
+                counts += np.array(summary['vehicles'], dtype=np.int64)
+                revenue += np.array(summary['revenue'])
+                continue
+            month_counts, month_revenue = _matrix(self._month_frame(key, filters, cache))
+            counts += month_counts
+            revenue += month_revenue
+        return counts, revenue
+
+    def page(self, filters, offset, limit):
+        """Records ``offset`` to ``offset + limit`` of the matching archived rows, newest first.
+
+        Newer months are skipped by their counts (from the summaries where possible), so a page
+        only reads the months it actually shows.
+        """
+        keys = self.months_for(filters)
+        cache = self._cacheable(keys)
+        records = []
+        for key in reversed(keys):
+            count = sum(group[2] for group in self._month_groups(key, filters, cache))
+            if offset >= count:
+                offset -= count
+                continue
+            # A page spans a month or two, so those months are worth caching even when the range is wide
+            df = self._month_frame(key, filters)
+            records += self.records(df.iloc[offset:offset + limit - len(records)])
+            offset = 0
+            if len(records) >= limit:
+                break
+        return records
+
+    def records(self, df):
+        """Plain dicts (hot-row shape) for the rows of an archived frame."""
+        rows = []
+        for row in df.itertuples(index=False):
+            rows.append({
+                'id': int(row.id),
+                'number_plate': row.number_plate,
+                'company_id': _nullable(row.company_id),
+                'checkpoint': _nullable(row.checkpoint),
+                'amount_paid': None if np.isnan(row.amount_paid) else float(row.amount_paid),
+                'timestamp': row.timestamp.to_pydatetime(),
+            })
+        return rows
+
+    # ---------------------
+    # Writing
+    # ---------------------
+    def archive_month(self, conn, month):
+        """Move ``month`` from ``vehicle_logs`` into the archive. Returns its manifest entry.
+
+        Runs inside the caller's transaction. The file is written and verified,
+        and recorded in the manifest as *pending*, before the hot rows go.
+        ``commit_month`` publishes it once the transaction has committed;
+        ``abandon_month`` drops it after a rollback. If the process dies in
+        between, ``reconcile`` settles the pending month at the next start, so
+        rows deleted from the hot table are never left without their archive.
+
+        Only rows that were read into the file are removed. On Postgres the
+        month's partition is locked against writes before it is read, so a
+        back-dated import or late entry waits rather than landing in a
+        partition that is about to be dropped. Rows elsewhere are deleted by id,
+        and if the count removed differs from the count archived, the
+        transaction is failed.
+        """
+        month = partitions.month_start(month)
+        key = month_key(month)
+        if key in self.manifest['months']:
+            raise ValueError(f'{key} is already archived')
+        start, end = datetime.combine(month, datetime.min.time()), datetime.combine(
+            partitions.add_months(month, 1), datetime.min.time())
+        partition = partitions.partition_name(month)
+        partitioned = partitions.is_partitioned(conn) and any(m == month for m, _ in partitions.list_partitions(conn))
+        if partitioned:
+            # SHARE blocks inserts, updates and deletes on this month only; reads carry on
+            conn.execute(text(f'LOCK TABLE "{partition}" IN SHARE MODE'))
+        columns = [getattr(VehicleLog, name) for name in COLUMNS]
+        rows = conn.execute(
+            select(*columns).where(VehicleLog.timestamp >= start, VehicleLog.timestamp < end)
+            .order_by(VehicleLog.id)
+        ).all()
+
+        arrays = _to_arrays(rows)
+        filename = f'vehicle_logs_{key}.npz'
+        path = os.path.join(self.directory, filename)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez_compressed(tmp, **arrays)
+        with open(tmp, 'rb') as fh:
+            sha256 = hashlib.sha256(fh.read()).hexdigest()
+
+        revenue = float(np.nansum(arrays['amount_paid']))
+        with np.load(tmp) as check:
+            if len(check['id']) != len(rows) or not np.isclose(float(np.nansum(check['amount_paid'])), revenue):
+                os.remove(tmp)
+                raise RuntimeError(f'Archive file for {key} failed verification')
+        os.replace(tmp, path)
+
+        entry = {
+            'file': filename,
+            'rows': len(rows),
+            'revenue': round(revenue, 2),
+            'min_id': int(arrays['id'].min()) if len(rows) else None,
+            'max_id': int(arrays['id'].max()) if len(rows) else None,
+            'sha256': sha256,
+            'summary': _summary(arrays),
+            'archived_at': datetime.utcnow().isoformat(timespec='seconds'),
+        }
+        manifest = dict(self.manifest)
+        manifest['pending'] = dict(manifest.get('pending', {}), **{key: entry})
+        self._save_manifest(manifest)
+
+        dropped = 0
+        if partitioned:
+            dropped = conn.execute(text(f'SELECT count(*) FROM "{partition}"')).scalar()
+            conn.execute(text(f'ALTER TABLE {partitions.PARENT} DETACH PARTITION "{partition}"'))
+            conn.execute(text(f'DROP TABLE "{partition}"'))
+        # Rows outside the partition (the default partition, or an unpartitioned table) go by id, so a row
+        # committed to this month after the read stays hot
+        deleted = 0
+        ids = arrays['id'].tolist()
+        for i in range(0, len(ids), DELETE_BATCH):
+            deleted += conn.execute(
+                delete(VehicleLog.__table__).where(VehicleLog.timestamp >= start, VehicleLog.timestamp < end,
+                                                   VehicleLog.id.in_(ids[i:i + DELETE_BATCH]))
+            ).rowcount
+        if dropped + deleted != len(rows):
+            raise RuntimeError(f'Archive of {key} removed {dropped + deleted} hot rows but archived {len(rows)}')
+
+        logger.info('Archived %s: %d rows (%d deleted outside a partition)', key, len(rows), deleted)
+        return key, entry
+
+    def commit_month(self, key, entry):
+        manifest = dict(self.manifest)
+        manifest['months'] = dict(manifest['months'], **{key: entry})
+        manifest['pending'] = {k: v for k, v in manifest.get('pending', {}).items() if k != key}
+        manifest['version'] = manifest.get('version', 0) + 1
+        self._save_manifest(manifest)
+
+    def abandon_month(self, key):
+        """Forget a pending month whose transaction rolled back; its rows are still hot."""
+        manifest = dict(self.manifest)
+        pending = dict(manifest.get('pending', {}))
+        entry = pending.pop(key, None)
+        if entry is None:
+            return
+        manifest['pending'] = pending
+        self._save_manifest(manifest)
+        try:
+            os.remove(os.path.join(self.directory, entry['file']))
+        except OSError:
+            pass
+
+    def reconcile(self, conn):
+        """Settle months left pending by a crash: publish them if their rows left the hot table, else drop them."""
+        for key, entry in sorted(self.manifest.get('pending', {}).items()):
+            start = datetime.combine(parse_month_key(key), datetime.min.time())
+            end = datetime.combine(partitions.add_months(parse_month_key(key), 1), datetime.min.time())
+            still_hot = entry['rows'] and conn.execute(
+                select(func.count(VehicleLog.id)).where(
+                    VehicleLog.timestamp >= start, VehicleLog.timestamp < end,
+                    VehicleLog.id >= entry['min_id'], VehicleLog.id <= entry['max_id'])
+            ).scalar()
+            if still_hot:
+                logger.warning('Archive of %s did not commit; its rows are still hot, dropping the pending file', key)
+                self.abandon_month(key)
+            else:
+                logger.warning('Archive of %s committed but was never published; adding it to the manifest', key)
+                self.commit_month(key, entry)
+
+
+def _nullable(value):
+    if isinstance(value, (np.integer, int)):
+        return None if value == NULL_ID else int(value)
+    return value or None
+
+
+def _matrix(df):
+    cells = (df['timestamp'].dt.weekday * 24 + df['timestamp'].dt.hour).to_numpy(dtype=np.int64)
+    counts = np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+    revenue = np.bincount(cells, weights=np.nan_to_num(df['amount_paid'].to_numpy(dtype=np.float64)),
+                          minlength=7 * 24).reshape(7, 24)
+    return counts, revenue
+
+
+def _summary(arrays):
+    """Per-month aggregates kept in the manifest: totals per (company, checkpoint) and the weekday x hour grid."""
+    df = pd.DataFrame({name: arrays[name] for name in ('company_id', 'checkpoint', 'amount_paid', 'timestamp')})
+    grouped = df.groupby(['company_id', 'checkpoint'])['amount_paid'].agg(['size', 'sum'])
+    counts, revenue = _matrix(df)
+    return {
+        'groups': [[_nullable(company_id), _nullable(checkpoint), int(count), round(float(total), 2)]
+                   for (company_id, checkpoint), (count, total) in grouped.iterrows()],
+        'vehicles': counts.tolist(),
+        'revenue': np.round(revenue, 2).tolist(),
+    }
+
+
+def _to_arrays(rows):
+    columns = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+    arrays = {}
+    for name, values in zip(COLUMNS, columns):
+        if name in INT_COLUMNS:
+            arrays[name] = np.array([NULL_ID if v is None else int(v) for v in values], dtype=np.int64)
+        elif name in TEXT_COLUMNS:
+            arrays[name] = np.array(['' if v is None else str(v) for v in values], dtype=np.str_)
+        elif name == 'amount_paid':
+            arrays[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        else:
+            arrays[name] = np.array(values, dtype='datetime64[us]')
+    return arrays
+
+
+def archive_for(filters):
+    """The app's archive when ``filters`` reach into it, else None."""
+    log_archive = current_app.extensions.get('archive')
+    return log_archive if log_archive is not None and log_archive.reaches(filters) else None
+
+
+def company_names(company_ids):
+    """``{user_id: company_name}`` for companies seen only in archived rows."""
+    ids = [cid for cid in company_ids if cid is not None]
+    if not ids:
+        return {}
+    rows = db.session.execute(
+        select(CompanyProfile.user_id, CompanyProfile.company_name).where(CompanyProfile.user_id.in_(ids))
+    ).all()
+    return dict(rows)
+
+
+def closed_months(conn, before):
+    """Months with hot rows that end on or before ``before``, oldest first."""
+    first = conn.execute(select(func.min(VehicleLog.timestamp))).scalar()
+    if first is None:
+        return []
+    months = []
+    month = partitions.month_start(first)
+    while partitions.add_months(month, 1) <= before:
+        months.append(month)
+        month = partitions.add_months(month, 1)
+    return months
+
+
+def init_app(app):
+    directory = app.config.setdefault('ARCHIVE_DIR', os.path.join(app.instance_path, 'archive'))
+    archive = LogArchive(directory, cache_months=int(app.config.setdefault('ARCHIVE_CACHE_MONTHS', 12)))
+    app.extensions['archive'] = archive
+    if archive.manifest.get('pending'):
+        with app.app_context():
+            try:
+                with db.engine.begin() as conn:
+                    archive.reconcile(conn)
+            except Exception:
+                logger.exception('Could not reconcile pending archive months')
+    return archive
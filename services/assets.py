@@ -0,0 +1,175 @@
+"""Fingerprinted, precompressed static assets and dynamic response compression.
+
+``build()`` copies stylesheets, scripts and images from ``static/`` into
+``static/dist/`` under content-hashed names, with ``.gz`` and ``.br``
+siblings for text assets, and records the mapping in ``manifest.json``.
+Templates call ``asset_url('styles.css')`` to get the hashed URL. Hashed
+files never change, so they are served with a one-year immutable cache
+lifetime.
+
+Building is a deploy step (``flask build-assets``, run by the Render build
+command), not a startup one: Brotli at quality 11 over every file takes
+seconds, and workers may run from a read-only tree. At runtime the app only
+reads the manifest; without one, templates fall back to plain ``/static``
+URLs.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from mimetypes import guess_type
+
+import brotli
+from flask import request, send_from_directory, url_for, abort
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_EXTENSIONS = {'.css', '.js', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.ico', '.woff', '.woff2'}
+PRECOMPRESS_EXTENSIONS = {'.css', '.js', '.svg'}
+COMPRESS_MIMETYPES = {'text/html', 'text/plain', 'text/csv', 'application/json', 'image/svg+xml'}
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+# ---------------------
+# Build
+# ---------------------
+def build(static_folder):
+    """Fingerprint and precompress every asset; returns the manifest."""
+    dist = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root) == os.path.abspath(static_folder):
+            dirs[:] = [d for d in dirs if d != DIST_DIR]
+        for name in files:
+            base, ext = os.path.splitext(name)
+            if ext.lower() not in FINGERPRINT_EXTENSIONS:
+                continue
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as fh:
+                content = fh.read()
+            digest = hashlib.sha256(content).hexdigest()[:12]
+            hashed = os.path.join(os.path.dirname(logical), f'{base}.{digest}{ext}').replace(os.sep, '/')
+            _write_variants(os.path.join(dist, hashed), content, ext.lower() in PRECOMPRESS_EXTENSIONS)
+            manifest[logical] = hashed
+
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST_NAME), 'w') as fh:
+        json.dump(manifest, fh, indent=1, sort_keys=True)
+    return manifest
+
+
+def _write_variants(target, content, precompress):
+    # Names are content addressed: an existing file already holds these bytes
+    if os.path.exists(target):
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    _atomic_write(target, content)
+    if not precompress:
+        return
+    gz = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(gz) < len(content):
+        _atomic_write(target + '.gz', gz)
+    br = brotli.compress(content, quality=11)
+    if len(br) < len(content):
+        _atomic_write(target + '.br', br)
+
+
+def _atomic_write(path, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+# ---------------------
+# Serving
+# ---------------------
+def serve_asset(dist, filename):
+    """Send the best precompressed variant the client accepts."""
+    path = os.path.join(dist, filename)
+    if not os.path.isfile(path):
+        abort(404)
+
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and os.path.isfile(path + suffix):
+            encoding = candidate
+            break
+
+    mimetype = None
+    if encoding:
+        mimetype = guess_type(filename)[0]
+        filename += '.br' if encoding == 'br' else '.gz'
+
+    response = send_from_directory(dist, filename, mimetype=mimetype, max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE
+    return response
+
+
+def compress_response(min_size):
+    """after_request hook compressing large HTML/JSON/CSV bodies on the fly."""
+    def after_request(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESS_MIMETYPES):
+            return response
+        response.vary.add('Accept-Encoding')
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+
+        accepted = request.accept_encodings
+        if accepted['br']:
+            compressed, encoding = brotli.compress(body, quality=4), 'br'
+        elif accepted['gzip']:
+            compressed, encoding = gzip.compress(body, compresslevel=6), 'gzip'
+        else:
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # Same entity, different bytes: keep the validator but make it weak
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+    return after_request
+
+
+def init_app(app):
+    static_folder = app.static_folder
+    dist = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+    if app.config.setdefault('ASSETS_FINGERPRINT', True):
+        manifest = load_manifest(static_folder)
+        if not manifest:
+            logger.info('No asset manifest in static/%s; run "flask build-assets" to fingerprint assets', DIST_DIR)
+
+    def asset_url(filename):
+        hashed = manifest.get(filename)
+        if hashed:
+            return url_for('assets', filename=hashed)
+        return url_for('static', filename=filename)
+
+    app.add_url_rule('/assets/<path:filename>', 'assets', lambda filename: serve_asset(dist, filename))
+    app.jinja_env.globals['asset_url'] = asset_url
+
+    min_size = int(app.config.setdefault('COMPRESS_MIN_SIZE', 1024))
+    if min_size > 0:
+        app.after_request(compress_response(min_size))
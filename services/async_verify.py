@@ -0,0 +1,248 @@
+"""Async JSON token verification, served apart from the Flask workers.
+
+``verify_token`` is the most latency-sensitive call in the system. In the
+Flask app it waits behind report renders for a gunicorn thread. This module
+is a small ASGI application (run with ``uvicorn verify_api:app``) built on
+SQLAlchemy's asyncio extension (asyncpg on Postgres, aiosqlite for local
+runs). An in-flight verification is a coroutine waiting on the database
+rather than a thread, so one process can hold thousands of them. Only
+``VERIFY_POOL_SIZE`` of them hold a connection at any moment.
+
+It uses the same ``Token`` model and rules as the sync views (see
+``services.tokens``): one conditional UPDATE ... RETURNING consumes the
+token, and rejections are classified and lapsed tokens marked expired in
+exactly the same way. Callers are authenticated with the Flask login
+session cookie, signed with the same ``SECRET_KEY``. The API therefore
+needs no new accounts: a scanner logs in at ``/login`` and sends its cookie
+here. Requests must be JSON, which keeps cross-site form posts out.
+
+    POST /verify   {"serial": "...", "vehicle_plate": "..."}
+      200 {"status": "valid", "message": ..., "token": {...}}
+      200 {"status": "invalid" | "mismatch" | "used" | "expired", "message": ...}
+      400 malformed body, 401 no or bad session, 403 not an officer, 415 not JSON
+    GET /healthz
+
+On Postgres, verifications and rejections are published with NOTIFY
+(``services.events``), so live dashboards and the anomaly detector see
+them as if they came from the Flask app.
+"""
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from http.cookies import SimpleCookie
+from types import SimpleNamespace
+
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+from itsdangerous import BadSignature
+from sqlalchemy import select, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from models import Token, User, OfficerProfile, CargoType
+from services import events, tokens
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 4096
+USER_CACHE_SECONDS = 30
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'postgresql+psycopg2': 'postgresql+asyncpg',
+                 'sqlite': 'sqlite+aiosqlite', 'sqlite+pysqlite': 'sqlite+aiosqlite'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def async_url(uri):
+    """The async-driver equivalent of a sync ``SQLALCHEMY_DATABASE_URI``."""
+    url = make_url(uri)
+    url = url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+    if url.drivername == 'postgresql+asyncpg' and 'sslmode' in url.query:
+        # asyncpg spells libpq's sslmode as ssl
+        url = url.update_query_dict({'ssl': url.query['sslmode']}).difference_update_query(['sslmode'])
+    return url
+
+
+class SessionCookie:
+    """Reads the Flask login session exactly as the Flask app signs it."""
+
+    def __init__(self, secret_key, cookie_name='session', lifetime=timedelta(days=31)):
+        signer_app = Flask(__name__)
+        signer_app.secret_key = secret_key
+        self.serializer = SecureCookieSessionInterface().get_signing_serializer(signer_app)
+        self.cookie_name = cookie_name
+        self.max_age = int(lifetime.total_seconds())
+
+    def user_id(self, cookie_header):
+        cookie = SimpleCookie()
+        try:
+            cookie.load(cookie_header or '')
+        except Exception:
+            return None
+        morsel = cookie.get(self.cookie_name)
+        if morsel is None:
+            return None
+        try:
+            data = self.serializer.loads(morsel.value, max_age=self.max_age)
+        except BadSignature:
+            return None
+        try:
+            return int(data.get('_user_id'))
+        except (TypeError, ValueError):
+            return None
+
+
+class VerifyAPI:
+    def __init__(self, database_uri, secret_key, pool_size=20, max_overflow=10, pool_timeout=30,
+                 cookie_name='session', session_lifetime=timedelta(days=31), events_backend='auto'):
+        url = async_url(database_uri)
+        options = {} if url.drivername.startswith('sqlite') else {
+            'pool_size': pool_size, 'max_overflow': max_overflow, 'pool_timeout': pool_timeout, 'pool_pre_ping': True}
+        self.engine = create_async_engine(url, **options)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.cookies = SessionCookie(secret_key, cookie_name, session_lifetime)
+        if events_backend == 'auto':
+            events_backend = 'postgres' if url.get_backend_name() == 'postgresql' else 'local'
+        # The local bus lives in the Flask process; only NOTIFY can reach it from here
+        self.notify = events_backend == 'postgres'
+        self._users = {}
+        self._cargo_names = {}
+
+    # ---------------------
+    # ASGI
+    # ---------------------
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        try:
+            if scope['path'] == '/verify':
+                if scope['method'] != 'POST':
+                    raise HTTPError(405, 'Use POST')
+                status, body = 200, await self.verify(scope, receive)
+            elif scope['path'] == '/healthz':
+                status, body = 200, {'ok': True}
+            else:
+                raise HTTPError(404, 'Not found')
+        except HTTPError as exc:
+            status, body = exc.status, {'error': exc.message}
+        except Exception:
+            logger.exception('Verification failed')
+            status, body = 500, {'error': 'Internal error'}
+        payload = json.dumps(body).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode()),
+                                (b'cache-control', b'no-store')]})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _body(receive):
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, 'Request body too large')
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    # ---------------------
+    # Verification
+    # ---------------------
+    async def _officer(self, session, user_id):
+        """``(role, checkpoint)`` of ``user_id``, cached briefly; None when the user is gone."""
+        cached = self._users.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        row = (await session.execute(
+            select(User.role, OfficerProfile.checkpoint)
+            .outerjoin(OfficerProfile, OfficerProfile.user_id == User.id)
+            .where(User.id == user_id)
+        )).first()
+        officer = tuple(row) if row else None
+        self._users[user_id] = (time.monotonic() + USER_CACHE_SECONDS, officer)
+        return officer
+
+    async def _cargo_name(self, session, cargo_type_id):
+        if cargo_type_id not in self._cargo_names:
+            self._cargo_names.update((await session.execute(select(CargoType.id, CargoType.name))).all())
+        return self._cargo_names.get(cargo_type_id)
+
+    async def _publish(self, session, payload):
+        if self.notify:
+            await session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                                  {'channel': events.CHANNEL, 'payload': json.dumps(payload)})
+
+    async def verify(self, scope, receive):
+        headers = dict(scope['headers'])
+        if headers.get(b'content-type', b'').split(b';')[0].strip() != b'application/json':
+            raise HTTPError(415, 'Send the request as application/json')
+        user_id = self.cookies.user_id(headers.get(b'cookie', b'').decode('latin-1'))
+        if user_id is None:
+            raise HTTPError(401, 'Log in first')
+        try:
+            data = json.loads(await self._body(receive))
+            serial, plate = tokens.normalise(data['serial'], data['vehicle_plate'])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise HTTPError(400, 'Expected {"serial": ..., "vehicle_plate": ...}')
+        if not serial or not plate:
+            raise HTTPError(400, 'serial and vehicle_plate are required')
+
+        async with self.sessions() as session, session.begin():
+            officer = await self._officer(session, user_id)
+            if officer is None:
+                raise HTTPError(401, 'Log in first')
+            role, checkpoint = officer
+            if role != 'officer':
+                raise HTTPError(403, 'Only checkpoint officers can verify tokens')
+
+            now = datetime.utcnow()
+            consumed = (await session.execute(
+                tokens.consume(serial, plate, now).returning(
+                    Token.company_id, Token.price, Token.cargo_type_id, Token.expiration_date)
+            )).first()
+            if consumed is not None:
+                await self._publish(session, events.token_verified_event(SimpleNamespace(
+                    serial=serial, vehicle_plate=plate, company_id=consumed.company_id, price=consumed.price,
+                    used_at=now)))
+                return {
+                    'status': 'valid',
+                    'message': "Token is valid and marked as used.",
+                    'token': {
+                        'serial': serial,
+                        'vehicle_plate': plate,
+                        'company_id': consumed.company_id,
+                        'cargo_type': await self._cargo_name(session, consumed.cargo_type_id),
+                        'price': consumed.price,
+                        'expiration_date': consumed.expiration_date.isoformat(),
+                        'used_at': now.isoformat(),
+                    },
+                }
+
+            token = (await session.execute(
+                select(Token.id, Token.vehicle_plate, Token.status).where(Token.serial == serial)
+            )).first()
+            reason = tokens.rejection(token, plate)
+            if reason == 'expired' and token.status != 'expired':
+                await session.execute(tokens.expire(token.id))
+            await self._publish(session, events.token_rejected_event(serial, plate, reason, checkpoint, user_id))
+        return {'status': reason, 'message': tokens.REJECTIONS[reason]}
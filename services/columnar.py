@@ -0,0 +1,281 @@
+"""Per-worker columnar copy of ``vehicle_logs`` for fast dashboard slicing.
+
+When ``ANALYTICS_CACHE_MB`` is set, each worker keeps the hot table's
+analytic columns as NumPy arrays: timestamp, checkpoint code, company id,
+officer id and amount, plus derived hour / weekday / month columns. Logs are
+append-only, so every request first pulls rows above the cached id
+watermark, which is one index range scan and normally returns nothing.
+
+Ids are allocated at insert but become visible at commit, so a concurrent
+entry or group commit can appear *below* the watermark after it has moved
+on. Ids missing from the last ``WATERMARK_TAIL_IDS`` below the watermark
+are therefore kept as gaps. Each refresh counts the committed rows in that
+window, one index range scan like the ETag watermark's. Only when the count
+exceeds what the cache holds is the span of the gaps read again and the
+late rows picked out. Holes left by rollbacks or failed group-commit rows
+never fill, so they cost nothing beyond the count. Gaps that fall out of
+the window are taken to be rolled back.
+Totals and group-bys are then answered with boolean masks and
+``np.bincount`` instead of a SQL scan.
+
+The cache answers nothing (callers fall back to SQL) when:
+- it is disabled;
+- the table has outgrown the memory cap;
+- a filter it cannot evaluate (ISO week) is set.
+
+Archiving removes rows, so a new archive version triggers a full reload.
+"""
+import logging
+import threading
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, select
+
+from models import db, VehicleLog
+
+logger = logging.getLogger(__name__)
+
+NULL_ID = -1
+FETCH_CHUNK = 50_000
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+US_PER_HOUR = 3_600_000_000
+US_PER_DAY = 24 * US_PER_HOUR
+# Column name -> dtype; hour/weekday/month are derived from the timestamp on append
+DTYPES = {
+    'id': np.int64,
+    'ts': np.int64,          # microseconds since the epoch (naive UTC)
+    'checkpoint': np.int32,  # index into ColumnarCache.checkpoints
+    'company_id': np.int32,
+    'officer_id': np.int32,
+    'amount': np.float64,
+    'hour': np.int8,
+    'weekday': np.int8,      # Monday = 0
+    'month': np.int32,       # year * 12 + month - 1
+}
+ROW_BYTES = sum(np.dtype(dtype).itemsize for dtype in DTYPES.values())
+
+
+def _rows_select():
+    return select(VehicleLog.id, VehicleLog.timestamp, VehicleLog.checkpoint, VehicleLog.company_id,
+                  VehicleLog.officer_id, VehicleLog.amount_paid)
+
+
+class ColumnarCache:
+    def __init__(self, max_bytes, tail_ids=10_000):
+        self.max_bytes = max_bytes
+        self.tail_ids = tail_ids
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.size = 0
+        self.watermark = 0
+        self.gaps = set()
+        self.archive_version = None
+        self.overflow = False
+        self.checkpoints = []
+        self._codes = {}
+        self._columns = {name: np.empty(0, dtype=dtype) for name, dtype in DTYPES.items()}
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self._columns.values())
+
+    def column(self, name):
+        return self._columns[name][:self.size]
+
+    # ---------------------
+    # Loading
+    # ---------------------
+    def refresh(self, session, archive_version=None):
+        """Append rows above the watermark and late commits filling gaps; returns False when the cache cannot serve."""
+        with self._lock:
+            if archive_version != self.archive_version:
+                self._reset()
+                self.archive_version = archive_version
+            if self.overflow:
+                return False
+            late = self._late_rows(session)
+            if late:
+                if not self._fits(len(late), archive_version):
+                    return False
+                self._append(late)
+            while True:
+                rows = session.execute(
+                    _rows_select().where(VehicleLog.id > self.watermark).order_by(VehicleLog.id).limit(FETCH_CHUNK)
+                ).all()
+                if not rows:
+                    return True
+                if not self._fits(len(rows), archive_version):
+                    return False
+                self._append(rows)
+                if len(rows) < FETCH_CHUNK:
+                    return True
+
+    def _fits(self, count, archive_version):
+        if (self.size + count) * ROW_BYTES <= self.max_bytes:
+            return True
+        logger.warning('Analytics cache would exceed %d MB; falling back to SQL', self.max_bytes // (1024 * 1024))
+        self._reset()
+        self.archive_version = archive_version
+        self.overflow = True
+        return False
+
+    def _late_rows(self, session):
+        """Rows that committed into a gap since the last refresh; usually none, found with one count."""
+        if not self.gaps:
+            return []
+        floor = max(self.watermark - self.tail_ids, 0)
+        committed = session.execute(
+            select(func.count(VehicleLog.id)).where(VehicleLog.id > floor, VehicleLog.id <= self.watermark)
+        ).scalar()
+        # Every id in the window that is not a gap is cached
+        if committed <= self.watermark - floor - len(self.gaps):
+            return []
+        rows = session.execute(
+            _rows_select().where(VehicleLog.id >= min(self.gaps), VehicleLog.id <= max(self.gaps))
+            .order_by(VehicleLog.id)
+        ).all()
+        return [row for row in rows if row.id in self.gaps]
+
+    def _append(self, rows):
+        ids, stamps, checkpoints, companies, officers, amounts = zip(*rows)
+        ts = np.array(stamps, dtype='datetime64[us]')
+        micros = ts.astype(np.int64)
+        months = ts.astype('datetime64[M]').astype(np.int64) + 1970 * 12
+        days = np.floor_divide(micros, US_PER_DAY)
+        new = {
+            'id': np.array(ids, dtype=np.int64),
+            'ts': micros,
+            'checkpoint': np.array([self._code(name) for name in checkpoints], dtype=np.int32),
+            'company_id': np.array([NULL_ID if c is None else int(c) for c in companies], dtype=np.int32),
+            'officer_id': np.array([NULL_ID if o is None else o for o in officers], dtype=np.int32),
+            'amount': np.array([0.0 if a is None else a for a in amounts], dtype=np.float64),
+            'hour': (np.floor_divide(micros, US_PER_HOUR) % 24).astype(np.int8),
+            # 1970-01-01 was a Thursday (weekday 3)
+            'weekday': ((days + 3) % 7).astype(np.int8),
+            'month': months.astype(np.int32),
+        }
+        needed = self.size + len(rows)
+        for name, values in new.items():
+            column = self._columns[name]
+            if needed > len(column):
+                # Amortised growth: double (at least) so appends stay O(1) per row
+                grown = np.empty(max(needed, 2 * len(column), 1024), dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                self._columns[name] = column = grown
+            column[self.size:needed] = values
+        self.size = needed
+        self._track_gaps(new['id'])
+
+    def _track_gaps(self, ids):
+        """Advance the watermark past ``ids`` (sorted), noting the recent ids still missing below it."""
+        self.gaps.difference_update(ids.tolist())
+        top = int(ids[-1])
+        if top > self.watermark:
+            low = max(self.watermark, top - self.tail_ids)
+            self.gaps.update(np.setdiff1d(np.arange(low + 1, top + 1), ids).tolist())
+            self.watermark = top
+        floor = self.watermark - self.tail_ids
+        self.gaps = {gap for gap in self.gaps if gap > floor}
+
+    def _code(self, name):
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.checkpoints)
+            self.checkpoints.append(name)
+        return code
+
+    # ---------------------
+    # Querying
+    # ---------------------
+    @staticmethod
+    def supports(filters):
+        return not filters.week
+
+    def mask(self, filters):
+        size = self.size
+        mask = np.ones(size, dtype=bool)
+        if filters.company_id:
+            mask &= self._columns['company_id'][:size] == filters.company_id
+        if filters.checkpoint:
+            code = self._codes.get(filters.checkpoint)
+            if code is None:
+                return np.zeros(size, dtype=bool)
+            mask &= self._columns['checkpoint'][:size] == code
+        ts = self._columns['ts'][:size]
+        for start, end in filters.time_ranges():
+            mask &= (ts >= _micros(start)) & (ts < _micros(end))
+        if filters.month:
+            mask &= self._columns['month'][:size] % 12 == filters.month - 1
+        if filters.year:
+            mask &= self._columns['month'][:size] // 12 == filters.year
+        if filters.day:
+            days = [i for i, name in enumerate(WEEKDAYS) if filters.day.capitalize() in name]
+            mask &= np.isin(self._columns['weekday'][:size], days)
+        if filters.hour is not None:
+            mask &= self._columns['hour'][:size] == filters.hour
+        return mask
+
+    def totals(self, filters):
+        with self._lock:
+            mask = self.mask(filters)
+            return int(mask.sum()), float(self._columns['amount'][:self.size][mask].sum())
+
+    def group_totals(self, filters, column):
+        """``{value: (vehicles, revenue)}`` for ``column`` in ('company_id', 'checkpoint', 'officer_id')."""
+        with self._lock:
+            mask = self.mask(filters)
+            keys = self._columns[column][:self.size][mask]
+            amounts = self._columns['amount'][:self.size][mask]
+            if not len(keys):
+                return {}
+            # Shift so NULL (-1) lands in bin 0
+            counts = np.bincount(keys + 1)
+            revenue = np.bincount(keys + 1, weights=amounts)
+            result = {}
+            for shifted in np.flatnonzero(counts):
+                key = int(shifted) - 1
+                if column == 'checkpoint':
+                    key = self.checkpoints[key]
+                elif key == NULL_ID:
+                    key = None
+                result[key] = (int(counts[shifted]), float(revenue[shifted]))
+            return result
+
+
+    def matrix(self, filters):
+        """Vehicle counts and revenue as 7 x 24 (weekday x hour) grids."""
+        with self._lock:
+            mask = self.mask(filters)
+            cells = (self._columns['weekday'][:self.size][mask].astype(np.int64) * 24
+                     + self._columns['hour'][:self.size][mask])
+            counts = np.bincount(cells, minlength=7 * 24).reshape(7, 24)
+            revenue = np.bincount(cells, weights=self._columns['amount'][:self.size][mask],
+                                  minlength=7 * 24).reshape(7, 24)
+            return counts, revenue
+
+
+def _micros(value):
+    return int(np.datetime64(value, 'us').astype(np.int64))
+
+
+def cache_for(filters):
+    """The worker's refreshed cache when it can answer ``filters``, else None (use SQL)."""
+    cache = current_app.extensions.get('columnar')
+    if cache is None or not cache.supports(filters):
+        return None
+    archive = current_app.extensions.get('archive')
+    if not cache.refresh(db.session, archive.version if archive else None):
+        return None
+    return cache
+
+
+def init_app(app):
+    max_mb = int(app.config.setdefault('ANALYTICS_CACHE_MB', 0))
+    if max_mb <= 0:
+        return None
+    cache = ColumnarCache(max_mb * 1024 * 1024, tail_ids=int(app.config.get('WATERMARK_TAIL_IDS', 10_000)))
+    app.extensions['columnar'] = cache
+    return cache
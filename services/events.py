@@ -0,0 +1,247 @@
+"""Committed-change feed for live dashboards.
+
+New ``VehicleLog`` rows and token verifications are captured from the ORM
+session and published only once their transaction commits. Each worker
+fans events out to its local subscribers (one queue per open stream). On
+Postgres the events travel through ``NOTIFY checkpoint_events``. A single
+``LISTEN`` connection per worker feeds the local bus, so every worker sees
+commits made by every other worker. Other databases use the in-process bus
+directly.
+
+Under gunicorn's gthread worker every open stream holds one worker thread
+for up to ``SSE_MAX_SECONDS``. ``SSE_MAX_STREAMS`` caps the streams per
+worker so the rest of the thread pool stays free for ordinary requests; it
+must stay below gunicorn's ``--threads``. Dashboards turned away fall back
+to polling the (ETag-validated) JSON API every ``SSE_POLL_SECONDS``.
+"""
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+from models import VehicleLog, Token
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'checkpoint_events'
+
+
+class EventBus:
+    def __init__(self, max_queue=1000):
+        self.max_queue = max_queue
+        self.backend = 'local'
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._on_first_subscribe = None
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add(q)
+            starter, self._on_first_subscribe = self._on_first_subscribe, None
+        if starter:
+            starter()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, payload):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                # A stalled client loses events rather than blocking every publisher
+                pass
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+bus = EventBus()
+
+
+# ---------------------
+# Payloads
+# ---------------------
+def vehicle_log_event(log):
+    return {
+        'type': 'vehicle_log',
+        'id': log.id,
+        'number_plate': log.number_plate,
+        'company_id': int(log.company_id) if log.company_id else None,
+        'checkpoint': log.checkpoint,
+        'amount_paid': log.amount_paid,
+        'officer_id': log.officer_id,
+        'token_serial': log.token_serial,
+        'timestamp': log.timestamp.isoformat() if log.timestamp else None,
+    }
+
+
+def token_verified_event(token):
+    return {
+        'type': 'token_verified',
+        'serial': token.serial,
+        'vehicle_plate': token.vehicle_plate,
+        'company_id': token.company_id,
+        'price': token.price,
+        'used_at': token.used_at.isoformat() if token.used_at else None,
+    }
+
+
+def token_rejected_event(serial, vehicle_plate, reason, checkpoint=None, officer_id=None):
+    return {
+        'type': 'token_rejected',
+        'serial': serial,
+        'vehicle_plate': vehicle_plate,
+        'reason': reason,
+        'checkpoint': checkpoint,
+        'officer_id': officer_id,
+        'timestamp': datetime.utcnow().isoformat(),
+    }
+
+
+# ---------------------
+# Session hooks
+# ---------------------
+def _collect(session, flush_context):
+    pending = session.info.setdefault('checkpoint_events', [])
+    for obj in session.new:
+        if isinstance(obj, VehicleLog):
+            pending.append(vehicle_log_event(obj))
+    for obj in session.dirty:
+        if isinstance(obj, Token) and 'used' in inspect(obj).attrs.status.history.added:
+            pending.append(token_verified_event(obj))
+
+
+def _notify_in_transaction(session, flush_context):
+    # NOTIFY is transactional: Postgres delivers it on commit and drops it on rollback
+    _collect(session, flush_context)
+    pending = session.info.pop('checkpoint_events', None)
+    for payload in pending or ():
+        session.connection().execute(text('SELECT pg_notify(:channel, :payload)'),
+                                     {'channel': CHANNEL, 'payload': json.dumps(payload)})
+
+
+def _publish_after_commit(session):
+    for payload in session.info.pop('checkpoint_events', None) or ():
+        bus.publish(payload)
+
+
+def _discard_after_rollback(session):
+    session.info.pop('checkpoint_events', None)
+
+
+# ---------------------
+# Core writes (bypass the session hooks above)
+# ---------------------
+def record(session, payload):
+    """Queue an event for a change the flush hooks cannot see (e.g. a bulk UPDATE) on ``session``.
+
+    It is delivered when the session's transaction commits and dropped on rollback, like the ones
+    collected above. It does not wait for a flush, because a commit with only Core statements has
+    nothing to flush and never fires ``after_flush``.
+    """
+    if bus.backend == 'postgres':
+        # NOTIFY now, in the session's transaction: Postgres holds it until the commit
+        notify_in_transaction(session.connection(), [payload])
+    else:
+        session.info.setdefault('checkpoint_events', []).append(payload)
+
+
+def emit(session, payload):
+    """Publish an event that no row change carries (e.g. a rejected token) and commit ``session``."""
+    if bus.backend == 'postgres':
+        session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                        {'channel': CHANNEL, 'payload': json.dumps(payload)})
+        session.commit()
+    else:
+        session.commit()
+        bus.publish(payload)
+
+
+def notify_in_transaction(conn, payloads):
+    """Queue events for rows written on ``conn`` outside the ORM; call before committing."""
+    if bus.backend == 'postgres':
+        for payload in payloads:
+            conn.execute(text('SELECT pg_notify(:channel, :payload)'),
+                         {'channel': CHANNEL, 'payload': json.dumps(payload)})
+
+
+def publish_committed(payloads):
+    """Deliver events for Core-written rows once their transaction has committed."""
+    if bus.backend != 'postgres':
+        for payload in payloads:
+            bus.publish(payload)
+
+
+# ---------------------
+# Postgres LISTEN loop
+# ---------------------
+class PostgresListener(threading.Thread):
+    def __init__(self, dsn, target):
+        super().__init__(name='checkpoint-events-listener', daemon=True)
+        self.dsn = dsn
+        self.target = target
+
+    def run(self):
+        import psycopg2
+        import psycopg2.extensions
+
+        backoff = 1
+        while True:
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                backoff = 1
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            self.target.publish(json.loads(notify.payload))
+                        except ValueError:
+                            logger.warning('Ignoring malformed event payload: %r', notify.payload)
+            except Exception:
+                logger.exception('Event listener lost its connection; reconnecting in %ss', backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+
+def init_app(app, db):
+    backend = app.config.setdefault('EVENTS_BACKEND', 'auto')
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        url = db.engine.url
+    if backend == 'auto':
+        backend = 'postgres' if dialect == 'postgresql' else 'local'
+    app.extensions['events'] = bus
+    app.extensions['sse_slots'] = threading.BoundedSemaphore(int(app.config.setdefault('SSE_MAX_STREAMS', 24)))
+    app.config.setdefault('SSE_POLL_SECONDS', 30)
+    bus.backend = backend
+
+    if backend == 'postgres':
+        event.listen(Session, 'after_flush', _notify_in_transaction)
+        dsn = url.set(drivername='postgresql').render_as_string(hide_password=False)
+        # Started lazily in the serving process (not in a pre-fork master)
+        bus._on_first_subscribe = lambda: PostgresListener(dsn, bus).start()
+    else:
+        event.listen(Session, 'after_flush', _collect)
+        event.listen(Session, 'after_commit', _publish_after_commit)
+        event.listen(Session, 'after_rollback', _discard_after_rollback)
+    return bus
@@ -0,0 +1,36 @@
+"""Conditional GET helpers (ETag / Last-Modified)."""
+from datetime import timezone
+
+from flask import request, session, make_response
+
+
+def cacheable():
+    """Pages carrying flashed messages must not be cached or revalidated."""
+    return request.method in ('GET', 'HEAD') and not session.get('_flashes')
+
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response when the client's validators still match."""
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    else:
+        since = request.if_modified_since
+        matched = bool(since and last_modified and _utc(last_modified).replace(microsecond=0) <= since)
+    if not matched:
+        return None
+    response = make_response('', 304)
+    return add_validators(response, etag, last_modified)
+
+
+def add_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _utc(last_modified)
+    # Private: every page is per-user; no-cache: always revalidate with the ETag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _utc(value):
+    # Timestamps are stored as naive UTC (datetime.utcnow)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
@@ -0,0 +1,175 @@
+"""Write-behind group commit for vehicle entries (``INGEST_MODE=group``).
+
+In the default ``sync`` mode every ``/entry`` POST commits its own
+transaction and pays its own fsync. In ``group`` mode the request puts its
+row on a bounded in-process queue and waits. A writer thread collects rows
+until it has ``INGEST_GROUP_SIZE`` of them or ``INGEST_GROUP_WINDOW_MS``
+has passed since the first one. It inserts the whole group with one
+multi-row ``INSERT ... RETURNING`` and commits once. Only then is each
+waiting request released with its new id. Durability is unchanged: nothing
+is acknowledged before its commit. Under load, though, one fsync is shared
+by the whole group.
+
+If the group's transaction fails, its rows are retried one by one, so a
+single bad row only fails its own request. When the queue is full,
+``submit`` raises ``IngestUnavailable`` and the caller falls back to a
+normal commit. A row that is queued but not acknowledged within
+``INGEST_ACK_TIMEOUT`` raises ``TimeoutError`` instead. It may still
+commit, so it must not be inserted again.
+
+The rows are written through Core, which the session event hooks never
+see, so live-dashboard events are published here explicitly.
+"""
+import logging
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+from sqlalchemy import insert
+
+from models import db, VehicleLog
+from services import events
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+GROUP_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+COMMIT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+GROUPS = registry.counter(
+    'checkpoint_ingest_groups_total', 'Group commits by outcome.', ('outcome',))
+ROWS = registry.counter(
+    'checkpoint_ingest_rows_total', 'Vehicle entries written by the group writer, by outcome.', ('outcome',))
+FALLBACKS = registry.counter(
+    'checkpoint_ingest_fallbacks_total', 'Entries committed synchronously because the queue was full.')
+GROUP_SIZE = registry.histogram(
+    'checkpoint_ingest_group_size', 'Rows per group commit.', (), GROUP_SIZE_BUCKETS)
+COMMIT_SECONDS = registry.histogram(
+    'checkpoint_ingest_commit_seconds', 'Time to insert and commit one group.', (), COMMIT_BUCKETS)
+WAIT_SECONDS = registry.histogram(
+    'checkpoint_ingest_ack_seconds', 'Time from enqueue to commit acknowledgement.', (), COMMIT_BUCKETS)
+QUEUE_DEPTH = registry.gauge(
+    'checkpoint_ingest_queue_depth', 'Entries waiting for the group writer.', ())
+
+
+class IngestUnavailable(Exception):
+    """The writer cannot take the row now; commit it synchronously instead."""
+
+
+class _Pending:
+    __slots__ = ('row', 'done', 'id', 'error', 'enqueued')
+
+    def __init__(self, row):
+        self.row = row
+        self.done = threading.Event()
+        self.id = None
+        self.error = None
+        self.enqueued = time.perf_counter()
+
+
+class GroupCommitWriter:
+    def __init__(self, app):
+        self.app = app
+        self.group_size = max(1, app.config['INGEST_GROUP_SIZE'])
+        self.window = app.config['INGEST_GROUP_WINDOW_MS'] / 1000.0
+        self.ack_timeout = app.config['INGEST_ACK_TIMEOUT']
+        self._queue = queue.Queue(maxsize=app.config['INGEST_QUEUE_SIZE'])
+        self._thread = None
+        self._start_lock = threading.Lock()
+        registry.add_collector(lambda: QUEUE_DEPTH.set((), self._queue.qsize()))
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ingest-group-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, row):
+        """Queue one ``vehicle_logs`` row and block until its group commits. Returns the new id."""
+        self.start()
+        pending = _Pending(row)
+        try:
+            self._queue.put_nowait(pending)
+        except queue.Full:
+            FALLBACKS.inc(())
+            raise IngestUnavailable('ingest queue is full')
+        if not pending.done.wait(self.ack_timeout):
+            ROWS.inc(('timed_out',))
+            raise TimeoutError('group commit was not acknowledged in time')
+        WAIT_SECONDS.observe((), time.perf_counter() - pending.enqueued)
+        if pending.error is not None:
+            raise pending.error
+        return pending.id
+
+    # ---------------------
+    # Writer thread
+    # ---------------------
+    def _collect(self):
+        group = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(group) < self.group_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                group.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return group
+
+    def _run(self):
+        with self.app.app_context():
+            engine = db.engine
+        while True:
+            group = self._collect()
+            try:
+                self._commit(engine, group)
+            except Exception:
+                logger.exception('Group commit of %d entries failed; retrying one by one', len(group))
+                GROUPS.inc(('split',))
+                for pending in group:
+                    try:
+                        self._commit(engine, [pending])
+                    except Exception as exc:
+                        ROWS.inc(('failed',))
+                        pending.error = exc
+                        pending.done.set()
+
+    def _commit(self, engine, group):
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            inserted = conn.execute(
+                insert(VehicleLog).returning(VehicleLog.id, sort_by_parameter_order=True),
+                [pending.row for pending in group],
+            ).scalars().all()
+            payloads = [events.vehicle_log_event(SimpleNamespace(**{'token_serial': None, **pending.row, 'id': log_id}))
+                        for log_id, pending in zip(inserted, group)]
+            events.notify_in_transaction(conn, payloads)
+        COMMIT_SECONDS.observe((), time.perf_counter() - started)
+        GROUP_SIZE.observe((), len(group))
+        GROUPS.inc(('committed',))
+        ROWS.inc(('committed',), len(group))
+        events.publish_committed(payloads)
+        for log_id, pending in zip(inserted, group):
+            pending.id = log_id
+            pending.done.set()
+
+
+def writer():
+    """The app's group writer, or None in ``sync`` mode."""
+    from flask import current_app
+    return current_app.extensions.get('ingest')
+
+
+def init_app(app):
+    for key, default in (('INGEST_MODE', 'sync'), ('INGEST_GROUP_SIZE', 64), ('INGEST_GROUP_WINDOW_MS', 5),
+                         ('INGEST_QUEUE_SIZE', 1000), ('INGEST_ACK_TIMEOUT', 10)):
+        app.config.setdefault(key, default)
+    if app.config['INGEST_MODE'] != 'group':
+        return None
+    group_writer = GroupCommitWriter(app)
+    app.extensions['ingest'] = group_writer
+    return group_writer
@@ -0,0 +1,189 @@
+"""One parsed set of vehicle-log filters, shared by every view that slices logs.
+
+``LogFilter.from_args(request.args)`` reads the dashboard query string once.
+The same object then builds the SQL, checks single events for the live
+stream and supplies the cache key used by ETags.
+
+``select()`` returns a lambda statement. SQLAlchemy caches it by the code
+locations of its lambdas and turns the captured filter values into bound
+parameters, so each filter *shape* (which filters are set) is compiled once
+per process. Later requests with the same shape skip both statement
+construction and compilation.
+
+Year, year+month and date filters become half-open ``timestamp`` ranges
+rather than ``extract()`` calls. The ranges can use the timestamp index, and
+Postgres can prune the monthly partitions of ``vehicle_logs`` with them.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import extract, func, lambda_stmt
+
+from models import VehicleLog
+
+
+class LogFilter:
+    INT_FIELDS = ('company_id', 'month', 'year', 'week', 'hour')
+    FIELDS = ('company_id', 'checkpoint', 'month', 'year', 'week', 'day', 'hour', 'date')
+
+    def __init__(self, company_id=None, checkpoint=None, month=None, year=None,
+                 week=None, day=None, hour=None, date=None):
+        self.company_id = company_id
+        self.checkpoint = checkpoint or None
+        self.month = month
+        self.year = year
+        self.week = week
+        self.day = day or None
+        self.hour = hour
+        self.date = date or None
+
+    @classmethod
+    def from_args(cls, args):
+        values = {name: args.get(name, type=int) for name in cls.INT_FIELDS}
+        values.update(checkpoint=args.get('checkpoint'), day=args.get('day'), date=args.get('date'))
+        return cls(**values)
+
+    # ---------------------
+    # Introspection
+    # ---------------------
+    @property
+    def date_value(self):
+        try:
+            return datetime.strptime(self.date, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return None
+
+    @property
+    def invalid_date(self):
+        return bool(self.date) and self.date_value is None
+
+    def time_ranges(self):
+        """``[(start, end)]`` half-open timestamp ranges implied by the year, month and date filters."""
+        ranges = []
+        if self.year and 1 <= self.year <= 9998:
+            if self.month and 1 <= self.month <= 12:
+                start = datetime(self.year, self.month, 1)
+                end = datetime(self.year + self.month // 12, self.month % 12 + 1, 1)
+            else:
+                start, end = datetime(self.year, 1, 1), datetime(self.year + 1, 1, 1)
+            ranges.append((start, end))
+        if self.date_value:
+            start = datetime.combine(self.date_value, datetime.min.time())
+            ranges.append((start, start + timedelta(days=1)))
+        return ranges
+
+    def time_range(self):
+        """The intersection of ``time_ranges()`` as one ``(start, end)``, or None when no range is set.
+
+        Disjoint ranges give ``start >= end``, which matches no rows.
+        """
+        ranges = self.time_ranges()
+        if not ranges:
+            return None
+        return max(start for start, _ in ranges), min(end for _, end in ranges)
+
+    def _month_needs_extract(self):
+        # A month without a usable year (e.g. "every July") has no single range
+        return bool(self.month) and not (self.year and 1 <= self.year <= 9998 and 1 <= self.month <= 12)
+
+    def _year_needs_extract(self):
+        return bool(self.year) and not 1 <= self.year <= 9998
+
+    def as_args(self):
+        """Set filters as a dict, ready for ``url_for(..., **filters.as_args())``."""
+        return {name: getattr(self, name) for name in self.FIELDS if getattr(self, name) is not None}
+
+    def cache_key(self):
+        return tuple(sorted(self.as_args().items()))
+
+    def __repr__(self):
+        return f'LogFilter({self.as_args()!r})'
+
+    # ---------------------
+    # SQL
+    # ---------------------
+    def criteria(self):
+        """Plain WHERE clauses, for ORM queries that cannot take a lambda statement."""
+        clauses = []
+        if self.company_id:
+            clauses.append(VehicleLog.company_id == self.company_id)
+        if self.checkpoint:
+            clauses.append(VehicleLog.checkpoint == self.checkpoint)
+        bounds = self.time_range()
+        if bounds:
+            clauses.append(VehicleLog.timestamp >= bounds[0])
+            clauses.append(VehicleLog.timestamp < bounds[1])
+        if self._month_needs_extract():
+            clauses.append(extract('month', VehicleLog.timestamp) == self.month)
+        if self._year_needs_extract():
+            clauses.append(extract('year', VehicleLog.timestamp) == self.year)
+        if self.week:
+            clauses.append(func.date_part('week', VehicleLog.timestamp) == self.week)
+        if self.day:
+            clauses.append(func.to_char(VehicleLog.timestamp, 'Day').ilike(f'%{self.day.capitalize()}%'))
+        if self.hour is not None:
+            clauses.append(extract('hour', VehicleLog.timestamp) == self.hour)
+        return clauses
+
+    def apply(self, query):
+        return query.filter(*self.criteria())
+
+    def select(self, build):
+        """Cached lambda statement: ``build()`` plus one WHERE lambda per set filter.
+
+        ``build`` must be a lambda returning a ``select()``; extend the result
+        with ``stmt += lambda s: s.group_by(...)`` and run it through
+        ``db.session.execute``.
+        """
+        stmt = lambda_stmt(build)
+        # Each lambda below captures a plain local, which becomes a bound parameter
+        if self.company_id:
+            company_id = self.company_id
+            stmt += lambda s: s.where(VehicleLog.company_id == company_id)
+        if self.checkpoint:
+            checkpoint = self.checkpoint
+            stmt += lambda s: s.where(VehicleLog.checkpoint == checkpoint)
+        # One lambda for all the ranges: a lambda added in a loop would be cached once, with the first bounds
+        bounds = self.time_range()
+        if bounds:
+            start, end = bounds
+            stmt += lambda s: s.where(VehicleLog.timestamp >= start, VehicleLog.timestamp < end)
+        if self._month_needs_extract():
+            month = self.month
+            stmt += lambda s: s.where(extract('month', VehicleLog.timestamp) == month)
+        if self._year_needs_extract():
+            year = self.year
+            stmt += lambda s: s.where(extract('year', VehicleLog.timestamp) == year)
+        if self.week:
+            week = self.week
+            stmt += lambda s: s.where(func.date_part('week', VehicleLog.timestamp) == week)
+        if self.day:
+            day_pattern = f'%{self.day.capitalize()}%'
+            stmt += lambda s: s.where(func.to_char(VehicleLog.timestamp, 'Day').ilike(day_pattern))
+        if self.hour is not None:
+            hour = self.hour
+            stmt += lambda s: s.where(extract('hour', VehicleLog.timestamp) == hour)
+        return stmt
+
+    # ---------------------
+    # Single events
+    # ---------------------
+    def matches(self, log):
+        """Python-side twin of ``criteria()`` for one log (a dict with company_id, checkpoint and timestamp)."""
+        ts = log['timestamp']
+        if self.company_id and log['company_id'] != self.company_id:
+            return False
+        if self.checkpoint and log['checkpoint'] != self.checkpoint:
+            return False
+        if self.month and ts.month != self.month:
+            return False
+        if self.year and ts.year != self.year:
+            return False
+        if self.week and ts.isocalendar()[1] != self.week:
+            return False
+        if self.day and self.day.capitalize() not in ts.strftime('%A'):
+            return False
+        if self.hour is not None and ts.hour != self.hour:
+            return False
+        if self.date_value and ts.date() != self.date_value:
+            return False
+        return True
@@ -0,0 +1,273 @@
+"""Bulk import of historical vehicle logs from Excel or CSV.
+
+Rows are streamed. Excel files are opened with openpyxl in read-only mode
+and CSV files are read line by line, so memory stays flat however large the
+spreadsheet is. Each row is validated on its own. Company names resolve to
+``CompanyProfile`` user ids through a dictionary built once per import, and
+valid rows are buffered and loaded ``CHUNK_SIZE`` at a time: through
+``COPY ... FROM STDIN`` on Postgres, and through ``executemany`` elsewhere.
+The whole file loads in one transaction, so an import either lands
+completely or not at all.
+
+Invalid rows are skipped and listed in the error report with their row
+number and reason. The report is spooled to a temporary file as errors
+occur, and only the first ``ERRORS_KEPT`` are held in memory for display,
+so a file of nothing but bad rows costs no more memory than a good one. Headers are matched case-insensitively, so the files
+``generate_report`` exports can be imported again unchanged.
+"""
+import csv
+import io
+import logging
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from datetime import date, datetime, time
+
+from flask import current_app
+from sqlalchemy import select
+
+from models import db, VehicleLog, CompanyProfile
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 10_000
+COLUMNS = ('number_plate', 'company_id', 'phone', 'email', 'location', 'checkpoint',
+           'amount_paid', 'officer_id', 'timestamp')
+# Accepted header spellings for each field (compared lower-cased, spaces and dashes as underscores)
+HEADERS = {
+    'number_plate': ('number_plate', 'plate', 'vehicle', 'registration'),
+    'company': ('company', 'company_name'),
+    'checkpoint': ('checkpoint',),
+    'amount_paid': ('amount_paid', 'amount', 'amount_paid_(zmw)', 'paid'),
+    'timestamp': ('timestamp', 'time', 'date', 'datetime', 'date_time'),
+    'phone': ('phone', 'phone_number'),
+    'email': ('email',),
+    'location': ('location',),
+}
+REQUIRED = ('number_plate', 'checkpoint', 'amount_paid', 'timestamp')
+TIMESTAMP_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d',
+                     '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d/%m/%Y')
+UNKNOWN_COMPANIES = ('', 'unknown')
+# Row errors kept in memory for display; the rest are only counted and written to the report
+ERRORS_KEPT = 1000
+# The error report stays in memory up to this size, then moves to a temporary file
+REPORT_SPOOL_BYTES = 1024 * 1024
+
+RowError = namedtuple('RowError', 'row message values')
+
+
+class ImportResult:
+    """Counts, the first ``keep_errors`` row errors, and the full error report spooled as it is written."""
+
+    def __init__(self, keep_errors=None):
+        self.rows = 0
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+        self.keep_errors = ERRORS_KEPT if keep_errors is None else keep_errors
+        self._report = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_BYTES, mode='w+', newline='')
+        self._report_writer = csv.writer(self._report)
+        self._report_writer.writerow(['Row', 'Error', 'Values'])
+
+    def add_error(self, error):
+        self.skipped += 1
+        if len(self.errors) < self.keep_errors:
+            self.errors.append(error)
+        self._report_writer.writerow(
+            [error.row, error.message, ' | '.join('' if v is None else str(v) for v in error.values)])
+
+    def error_report(self, out):
+        """Write the per-row error report, every skipped row included, as CSV to the text stream ``out``."""
+        self._report.seek(0)
+        shutil.copyfileobj(self._report, out)
+        self._report.seek(0, io.SEEK_END)
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be imported (unknown type, missing columns)."""
+
+
+# ---------------------
+# Reading
+# ---------------------
+def _normalise(header):
+    return str(header or '').strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def _header_map(header_row):
+    positions = {}
+    names = [_normalise(h) for h in header_row]
+    for field, aliases in HEADERS.items():
+        for i, name in enumerate(names):
+            if name in aliases:
+                positions[field] = i
+                break
+    missing = [field for field in REQUIRED if field not in positions]
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(missing)}")
+    return positions
+
+
+def _excel_rows(fileobj):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _csv_rows(fileobj):
+    # utf-8-sig drops the byte-order mark Excel writes at the start of "CSV UTF-8" files
+    yield from csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+
+
+def read_rows(fileobj, filename):
+    """Raw row tuples of the first sheet (Excel) or the file (CSV), header included."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        return _excel_rows(fileobj)
+    if extension == '.csv':
+        return _csv_rows(fileobj)
+    raise ImportFileError(f"Unsupported file type '{extension or filename}'; upload .xlsx or .csv")
+
+
+# ---------------------
+# Validation
+# ---------------------
+def _text(value):
+    return str(value).strip() if value is not None else ''
+
+
+def _parse_timestamp(value):
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    text = _text(value)
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognised timestamp '{text}'")
+
+
+def _parse_amount(value):
+    if isinstance(value, (datetime, date, time)):
+        # openpyxl takes any number format containing "M" (e.g. 'ZMW #,##0.00') for a date
+        from openpyxl.utils.datetime import to_excel
+        value = to_excel(value)
+    if isinstance(value, (int, float)):
+        amount = float(value)
+    else:
+        text = _text(value).upper().replace('ZMW', '').replace(',', '').strip()
+        try:
+            amount = float(text)
+        except ValueError:
+            raise ValueError(f"invalid amount '{_text(value)}'")
+    if amount < 0:
+        raise ValueError('amount cannot be negative')
+    return amount
+
+
+def _cell(values, i):
+    return values[i] if i is not None and i < len(values) else None
+
+
+def _build_row(values, positions, companies, officer_id, archived_until):
+    def field(name):
+        return _cell(values, positions.get(name))
+
+    plate = _text(field('number_plate')).upper()
+    if not plate:
+        raise ValueError('number plate is required')
+    if len(plate) > 20:
+        raise ValueError('number plate is longer than 20 characters')
+    checkpoint = _text(field('checkpoint'))
+    if not checkpoint:
+        raise ValueError('checkpoint is required')
+    if len(checkpoint) > 50:
+        raise ValueError('checkpoint is longer than 50 characters')
+
+    company_name = _text(field('company'))
+    company_id = None
+    if company_name.lower() not in UNKNOWN_COMPANIES:
+        company_id = companies.get(company_name.lower())
+        if company_id is None:
+            raise ValueError(f"unknown company '{company_name}'")
+
+    timestamp = _parse_timestamp(field('timestamp'))
+    if archived_until and timestamp.date() < archived_until:
+        raise ValueError(f"{timestamp:%Y-%m} is already archived")
+
+    return (plate, company_id, _text(field('phone'))[:20] or None, _text(field('email'))[:100] or None,
+            _text(field('location'))[:100] or None, checkpoint, _parse_amount(field('amount_paid')),
+            officer_id, timestamp)
+
+
+# ---------------------
+# Loading
+# ---------------------
+def _load_chunk(conn, rows):
+    if conn.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['\\N' if value is None else value for value in row])
+        buffer.seek(0)
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {VehicleLog.__tablename__} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer)
+        finally:
+            cursor.close()
+    else:
+        conn.execute(VehicleLog.__table__.insert(), [dict(zip(COLUMNS, row)) for row in rows])
+
+
+def import_logs(fileobj, filename, officer_id=None, dry_run=False, chunk_size=CHUNK_SIZE):
+    """Validate and load every row of ``fileobj``. Returns an ``ImportResult``.
+
+    Raises ``ImportFileError`` when the file type or header is unusable.
+    """
+    rows = read_rows(fileobj, filename)
+    header = next(rows, None)
+    if header is None:
+        raise ImportFileError('The file is empty')
+    positions = _header_map(header)
+
+    companies = {name.strip().lower(): user_id for user_id, name in db.session.execute(
+        select(CompanyProfile.user_id, CompanyProfile.company_name)) if name}
+    archive = current_app.extensions.get('archive')
+    archived_until = archive.archived_until if archive else None
+
+    result = ImportResult()
+    buffer = []
+    with db.engine.begin() as conn:
+        # Row 1 is the header, so data rows are numbered as the spreadsheet shows them
+        for number, values in enumerate(rows, start=2):
+            # Blank lines and footers such as the exported "Total:" row carry neither plate nor time
+            if not _text(_cell(values, positions['number_plate'])) and not _text(_cell(values, positions['timestamp'])):
+                continue
+            result.rows += 1
+            try:
+                buffer.append(_build_row(values, positions, companies, officer_id, archived_until))
+            except ValueError as exc:
+                result.add_error(RowError(number, str(exc), tuple(values)))
+                continue
+            if len(buffer) >= chunk_size:
+                if not dry_run:
+                    _load_chunk(conn, buffer)
+                result.imported += len(buffer)
+                buffer = []
+        if buffer:
+            if not dry_run:
+                _load_chunk(conn, buffer)
+            result.imported += len(buffer)
+    logger.info('Imported %d of %d rows from %s (%d errors%s)', result.imported, result.rows, filename,
+                result.skipped, ', dry run' if dry_run else '')
+    return result
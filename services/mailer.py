@@ -0,0 +1,269 @@
+"""Queued report emails.
+
+``enqueue`` stores a message and its attachment in ``email_outbox`` and
+returns at once, so a request never waits on SMTP. Each worker runs a
+sender thread that wakes on enqueue, or every
+``MAIL_POLL_SECONDS``. The thread claims a batch of due rows and delivers
+them all over one SMTP connection, which stays open while the queue keeps
+producing work. A failed message is retried with exponential backoff until
+``MAIL_MAX_ATTEMPTS`` is reached, then marked ``failed``.
+
+Rows are claimed with ``FOR UPDATE SKIP LOCKED`` on Postgres, so several
+workers can drain the same outbox without sending anything twice. A row
+left in ``sending`` by a worker that died is reclaimed once the claim is
+older than the longest a live worker could take over its batch:
+``BATCH_SIZE`` messages, each waiting on up to ``SEND_TIMEOUTS`` SMTP
+socket timeouts. A reclaim counts as an attempt, so a message that keeps
+killing its sender ends up ``failed`` like any other.
+
+Backends (``MAIL_BACKEND``):
+- ``smtp``: the real server at ``MAIL_SERVER``. Point it at a local
+  stand-in (e.g. ``python -m aiosmtpd -n -l localhost:1025`` or Mailpit)
+  for development.
+- ``console``: logs each message instead of sending it.
+- ``memory``: appends each message to ``mailer.sent``, for tests.
+
+The default is ``smtp`` when ``MAIL_SERVER`` is set, otherwise ``console``.
+"""
+import logging
+import smtplib
+import threading
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from sqlalchemy import and_, case, or_, select, update
+
+from models import db, EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+SMTP_TIMEOUT = 30
+# Socket timeouts one send can wait on: the liveness NOOP, a connect, the send, a reconnect and the resend
+SEND_TIMEOUTS = 5
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 3600
+
+
+# ---------------------
+# Transports
+# ---------------------
+class SMTPTransport:
+    """One SMTP connection, opened on first use and reused until closed or dropped."""
+
+    def __init__(self, host, port, username=None, password=None, use_tls=True, timeout=SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._conn = None
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            conn.starttls()
+        if self.username:
+            conn.login(self.username, self.password)
+        return conn
+
+    def send(self, message):
+        if self._conn is not None:
+            try:
+                self._conn.noop()
+            except (smtplib.SMTPException, OSError):
+                self._conn = None
+        if self._conn is None:
+            self._conn = self._connect()
+        try:
+            self._conn.send_message(message)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # The server dropped an idle connection: reconnect once and retry
+            self._conn = self._connect()
+            self._conn.send_message(message)
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._conn = None
+
+
+class ConsoleTransport:
+    def send(self, message):
+        logger.info('Email (console backend) to %s: %s [%s]', message['To'], message['Subject'],
+                    ', '.join(part.get_filename() or '' for part in message.iter_attachments()))
+
+    def close(self):
+        pass
+
+
+class MemoryTransport:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+    def close(self):
+        pass
+
+
+# ---------------------
+# Outbox
+# ---------------------
+class Mailer:
+    def __init__(self, app, transport):
+        self.app = app
+        self.transport = transport
+        self.sender = app.config['MAIL_DEFAULT_SENDER']
+        self.max_attempts = app.config['MAIL_MAX_ATTEMPTS']
+        self.poll_seconds = app.config['MAIL_POLL_SECONDS']
+        # A live worker never holds a claim longer than this, so an older one was abandoned
+        self.claim_timeout = timedelta(
+            seconds=BATCH_SIZE * SEND_TIMEOUTS * getattr(transport, 'timeout', SMTP_TIMEOUT))
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def sent(self):
+        """Messages delivered by the memory backend."""
+        return getattr(self.transport, 'sent', [])
+
+    def enqueue(self, to_address, subject, body='', attachment=None, attachment_name=None,
+                attachment_type='application/octet-stream'):
+        """Queue one message in the caller's session. It is sent after the caller commits."""
+        row = EmailOutbox(to_address=to_address, subject=subject, body=body, attachment=attachment,
+                          attachment_name=attachment_name, attachment_type=attachment_type,
+                          status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+        db.session.add(row)
+        return row
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        if not self.app.config['MAIL_SENDER_THREAD'] or (self._thread is not None and self._thread.is_alive()):
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='email-outbox-sender', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    while self.send_due():
+                        pass
+                    db.session.remove()
+            except Exception:
+                logger.exception('Email outbox sender failed; retrying in %ss', self.poll_seconds)
+            finally:
+                # Idle: let the server reclaim the connection rather than holding it between bursts
+                self.transport.close()
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _claim(self):
+        now = datetime.utcnow()
+        abandoned = and_(EmailOutbox.status == 'sending', EmailOutbox.claimed_at < now - self.claim_timeout)
+        # The abandoned delivery was an attempt; one that used up the last attempt is not retried
+        given_up = db.session.execute(
+            update(EmailOutbox).where(abandoned, EmailOutbox.attempts + 1 >= self.max_attempts)
+            .values(status='failed', attempts=EmailOutbox.attempts + 1,
+                    last_error='Sender stopped while delivering this message')
+        ).rowcount
+        if given_up:
+            logger.error('Giving up on %d email(s) whose sender stopped on the last attempt', given_up)
+        due = or_(
+            and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+            abandoned,
+        )
+        ids = db.session.execute(
+            select(EmailOutbox.id).where(due).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+            .limit(BATCH_SIZE).with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not ids:
+            db.session.commit()
+            return []
+        db.session.execute(
+            update(EmailOutbox).where(EmailOutbox.id.in_(ids), due)
+            .values(status='sending', claimed_at=now,
+                    attempts=case((EmailOutbox.status == 'sending', EmailOutbox.attempts + 1),
+                                  else_=EmailOutbox.attempts))
+        )
+        db.session.commit()
+        # Without row locks (SQLite) another worker may have won some rows between the two statements
+        return db.session.execute(
+            select(EmailOutbox).where(EmailOutbox.id.in_(ids), EmailOutbox.status == 'sending',
+                                      EmailOutbox.claimed_at == now)
+        ).scalars().all()
+
+    def send_due(self):
+        """Deliver one batch of due messages. Returns the number handled (0 when the queue is idle)."""
+        rows = self._claim()
+        for row in rows:
+            try:
+                self.transport.send(self._message(row))
+            except Exception as exc:
+                row.attempts += 1
+                row.last_error = f'{type(exc).__name__}: {exc}'
+                if row.attempts >= self.max_attempts:
+                    row.status = 'failed'
+                    logger.error('Giving up on email %s to %s: %s', row.id, row.to_address, row.last_error)
+                else:
+                    delay = min(BACKOFF_BASE_SECONDS * 2 ** (row.attempts - 1), BACKOFF_MAX_SECONDS)
+                    row.status = 'pending'
+                    row.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                    logger.warning('Email %s failed (attempt %d), retrying in %ss: %s',
+                                   row.id, row.attempts, delay, row.last_error)
+            else:
+                row.attempts += 1
+                row.status = 'sent'
+                row.sent_at = datetime.utcnow()
+                # Sent attachments are not needed again
+                row.attachment = None
+            db.session.commit()
+        return len(rows)
+
+    def _message(self, row):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = row.to_address
+        message['Subject'] = row.subject
+        message.set_content(row.body or '')
+        if row.attachment is not None:
+            maintype, _, subtype = (row.attachment_type or 'application/octet-stream').partition('/')
+            message.add_attachment(row.attachment, maintype=maintype, subtype=subtype,
+                                   filename=row.attachment_name)
+        return message
+
+
+def _transport(app):
+    backend = app.config['MAIL_BACKEND'] or ('smtp' if app.config['MAIL_SERVER'] else 'console')
+    if backend == 'smtp':
+        return SMTPTransport(app.config['MAIL_SERVER'], app.config['MAIL_PORT'], app.config['MAIL_USERNAME'],
+                             app.config['MAIL_PASSWORD'], use_tls=app.config['MAIL_USE_TLS'])
+    if backend == 'memory':
+        return MemoryTransport()
+    if backend == 'console':
+        return ConsoleTransport()
+    raise ValueError(f'Unknown MAIL_BACKEND {backend!r}')
+
+
+def init_app(app):
+    for key, default in (('MAIL_BACKEND', ''), ('MAIL_SERVER', ''), ('MAIL_PORT', 587), ('MAIL_USERNAME', ''),
+                         ('MAIL_PASSWORD', ''), ('MAIL_USE_TLS', True), ('MAIL_DEFAULT_SENDER', 'noreply@localhost'),
+                         ('MAIL_MAX_ATTEMPTS', 5), ('MAIL_POLL_SECONDS', 30), ('MAIL_SENDER_THREAD', True)):
+        app.config.setdefault(key, default)
+    mailer = Mailer(app, _transport(app))
+    app.extensions['mailer'] = mailer
+    # Started by the first request rather than at import, so CLI commands and migrations never spawn it
+    app.before_request(mailer.start)
+    return mailer
@@ -0,0 +1,254 @@
+"""Per-endpoint request metrics rendered in the Prometheus text format.
+
+Each worker process keeps its own registry. Nothing is hooked into Flask or
+SQLAlchemy unless ``METRICS_SAMPLE_RATE`` is above zero, so the metrics cost
+nothing when sampling is turned off.
+"""
+import random
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from models import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 1000)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 ** 2, 5 * 1024 ** 2, 25 * 1024 ** 2)
+
+
+# ---------------------
+# Metric types
+# ---------------------
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(label_values, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._values[label_values] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for label_values, (counts, total) in sorted(values.items()):
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', {**labels, 'le': _format_value(bound)}, cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, tuple(labels)))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.register(Gauge(name, documentation, tuple(labels)))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, tuple(labels), buckets))
+
+    def add_collector(self, collector):
+        """Register a callable run right before every exposition (for gauges)."""
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels.items()
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+# ---------------------
+# Request / SQL instrumentation
+# ---------------------
+registry = Registry()
+
+REQUESTS = registry.counter(
+    'checkpoint_http_requests_total', 'Sampled HTTP requests by endpoint and status.', ('endpoint', 'status'))
+LATENCY = registry.histogram(
+    'checkpoint_http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint',), LATENCY_BUCKETS)
+RESPONSE_SIZE = registry.histogram(
+    'checkpoint_http_response_size_bytes', 'Response body size by endpoint.', ('endpoint',), SIZE_BUCKETS)
+SQL_STATEMENTS = registry.histogram(
+    'checkpoint_sql_statements_per_request', 'SQL statements executed per request.', ('endpoint',), SQL_COUNT_BUCKETS)
+SQL_TIME = registry.histogram(
+    'checkpoint_sql_duration_seconds_per_request', 'Time spent in the database per request.', ('endpoint',),
+    LATENCY_BUCKETS)
+SQL_STATEMENTS_TOTAL = registry.counter(
+    'checkpoint_sql_statements_total', 'SQL statements executed by sampled requests.', ('endpoint',))
+POOL_SIZE = registry.gauge(
+    'checkpoint_db_pool_size', 'Configured connection pool size of this worker.', ('bind',))
+POOL_CHECKED_OUT = registry.gauge(
+    'checkpoint_db_pool_checked_out', 'Connections currently checked out of the pool.', ('bind',))
+POOL_OVERFLOW = registry.gauge(
+    'checkpoint_db_pool_overflow', 'Connections opened beyond the pool size.', ('bind',))
+POOL_CAPACITY = registry.gauge(
+    'checkpoint_db_pool_capacity', 'Pool size plus the allowed overflow connections.', ('bind',))
+
+
+class _RequestSample:
+    __slots__ = ('start', 'sql_count', 'sql_time')
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+
+
+def _endpoint_label():
+    return request.endpoint or 'unmatched'
+
+
+def _start_request(sample_rate):
+    def before_request():
+        if sample_rate >= 1 or random.random() < sample_rate:
+            g.metrics_sample = _RequestSample()
+    return before_request
+
+
+def _finish_request(response):
+    sample = g.pop('metrics_sample', None)
+    if sample is None:
+        return response
+
+    endpoint = _endpoint_label()
+    LATENCY.observe((endpoint,), perf_counter() - sample.start)
+    REQUESTS.inc((endpoint, str(response.status_code)))
+    SQL_STATEMENTS.observe((endpoint,), sample.sql_count)
+    SQL_TIME.observe((endpoint,), sample.sql_time)
+    if sample.sql_count:
+        SQL_STATEMENTS_TOTAL.inc((endpoint,), sample.sql_count)
+    size = response.content_length
+    if size is None and not response.is_streamed:
+        size = response.calculate_content_length()
+    if size is not None:
+        RESPONSE_SIZE.observe((endpoint,), size)
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'metrics_sample' in g:
+        conn.info.setdefault('metrics_query_start', []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    elapsed = perf_counter() - starts.pop()
+    sample = g.get('metrics_sample') if has_request_context() else None
+    if sample is not None:
+        sample.sql_count += 1
+        sample.sql_time += elapsed
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('metrics_query_start'):
+        connection.info['metrics_query_start'].pop()
+
+
+def _collect_pool_stats():
+    for bind_key, engine in db.engines.items():
+        pool = engine.pool
+        if not hasattr(pool, 'checkedout'):
+            continue
+        label = (bind_key or 'default',)
+        POOL_SIZE.set(label, pool.size())
+        POOL_CHECKED_OUT.set(label, pool.checkedout())
+        POOL_OVERFLOW.set(label, max(pool.overflow(), 0))
+        POOL_CAPACITY.set(label, pool.size() + max(getattr(pool, '_max_overflow', 0), 0))
+
+
+def init_app(app):
+    sample_rate = float(app.config.setdefault('METRICS_SAMPLE_RATE', 0.0))
+    app.extensions['metrics'] = registry
+    registry.add_collector(_collect_pool_stats)
+    if sample_rate <= 0:
+        return
+
+    app.before_request(_start_request(sample_rate))
+    app.after_request(_finish_request)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
@@ -0,0 +1,140 @@
+"""Monthly range partitions of ``vehicle_logs`` (Postgres only).
+
+Once the ``partition vehicle_logs by month`` migration has run,
+``vehicle_logs`` is a table partitioned by ``RANGE ("timestamp")``. It has
+one partition per calendar month, named ``vehicle_logs_yYYYYmMM``, plus
+``vehicle_logs_default``, which catches anything outside the existing
+months.
+
+``ensure_partitions`` pre-creates upcoming months. It runs at startup and
+from ``flask partitions ensure``, and moves any rows the default partition
+already holds for a new month into it. ``expire_partitions`` detaches (and
+optionally drops) months older than the retention window.
+
+On other databases every helper is a no-op.
+"""
+import logging
+import re
+from datetime import date
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+PARENT = 'vehicle_logs'
+DEFAULT_PARTITION = 'vehicle_logs_default'
+NAME_PATTERN = re.compile(r'^vehicle_logs_y(\d{4})m(\d{2})$')
+# Serialises partition DDL between workers that start at the same time
+ADVISORY_LOCK_ID = 7_302_114
+
+
+# ---------------------
+# Month arithmetic
+# ---------------------
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{PARENT}_y{month.year:04d}m{month.month:02d}'
+
+
+# ---------------------
+# Catalog
+# ---------------------
+def is_partitioned(conn):
+    if conn.dialect.name != 'postgresql':
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :parent AND pg_table_is_visible(c.oid)"), {'parent': PARENT}).first() is not None
+
+
+def list_partitions(conn):
+    """Attached monthly partitions as ``[(month_start, name)]``, oldest first."""
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :parent AND pg_table_is_visible(p.oid)"), {'parent': PARENT}).scalars()
+    months = []
+    for name in rows:
+        match = NAME_PATTERN.match(name)
+        if match:
+            months.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(months)
+
+
+# ---------------------
+# Create
+# ---------------------
+def create_partition(conn, month):
+    """Attach the partition for ``month``, adopting its rows from the default partition."""
+    month = month_start(month)
+    name = partition_name(month)
+    bounds = {'start': month, 'end': add_months(month, 1)}
+    # Attaching next to a non-empty default partition fails if the default holds
+    # rows for this range, so the table is filled before it is attached.
+    conn.execute(text(f'CREATE TABLE "{name}" (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    conn.execute(text(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+        f'WHERE "timestamp" >= :start AND "timestamp" < :end RETURNING *) '
+        f'INSERT INTO "{name}" SELECT * FROM moved'), bounds)
+    conn.execute(text(
+        f"ALTER TABLE {PARENT} ATTACH PARTITION \"{name}\" "
+        f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"))
+    return name
+
+
+def ensure_partitions(conn, months_ahead=3, today=None):
+    """Create every missing monthly partition from this month to ``months_ahead`` months out."""
+    if not is_partitioned(conn):
+        return []
+    conn.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': ADVISORY_LOCK_ID})
+    existing = {month for month, _ in list_partitions(conn)}
+    current = month_start(today or date.today())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            created.append(create_partition(conn, month))
+    return created
+
+
+# ---------------------
+# Expire
+# ---------------------
+def expire_partitions(conn, retain_months, drop=False, today=None):
+    """Detach (and with ``drop`` delete) monthly partitions that ended before the retention window."""
+    if not is_partitioned(conn):
+        return []
+    conn.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': ADVISORY_LOCK_ID})
+    cutoff = add_months(month_start(today or date.today()), -retain_months)
+    expired = []
+    for month, name in list_partitions(conn):
+        if month >= cutoff:
+            break
+        conn.execute(text(f'ALTER TABLE {PARENT} DETACH PARTITION "{name}"'))
+        if drop:
+            conn.execute(text(f'DROP TABLE "{name}"'))
+        expired.append(name)
+    return expired
+
+
+def init_app(app, db):
+    months_ahead = int(app.config.setdefault('PARTITION_PREMAKE_MONTHS', 3))
+    if months_ahead < 0:
+        return
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                created = ensure_partitions(conn, months_ahead)
+            if created:
+                logger.info('Created vehicle_logs partitions: %s', ', '.join(created))
+        except Exception:
+            # Missing partitions only cost pruning (rows land in the default partition)
+            logger.exception('Could not pre-create vehicle_logs partitions')
@@ -0,0 +1,178 @@
+"""Raw CSV export of vehicle logs with company and officer names.
+
+On Postgres the query runs as ``COPY (SELECT ...) TO STDOUT WITH CSV``.
+The server formats every row, and the CSV bytes are relayed to the
+response as psycopg2 receives them, with no ORM objects and no Python
+formatting. ``copy_expert`` blocks until the whole result has been
+written, so it runs in a helper thread that feeds a bounded queue. The
+response generator drains that queue, which gives back-pressure: a slow
+client pauses the COPY rather than buffering the table in memory. If the
+client disconnects, the thread is told to stop and the COPY is aborted.
+When the request is routed to the read replica, the COPY runs there.
+
+Other databases (SQLite in tests) stream the same SELECT in batches
+through the csv module. Archived months selected by the filters follow the
+hot rows in both cases.
+"""
+import csv
+import io
+import logging
+import queue
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from models import db, VehicleLog, CompanyProfile, OfficerProfile
+from services.archive import archive_for, company_names
+from services.replica import read_engine
+
+logger = logging.getLogger(__name__)
+
+HEADER = ('id', 'timestamp', 'number_plate', 'company_id', 'company_name', 'phone', 'email', 'location',
+          'checkpoint', 'amount_paid', 'officer_id', 'officer_name', 'token_serial')
+QUEUE_CHUNKS = 64
+BATCH_ROWS = 5000
+_DONE = object()
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def export_select(filters):
+    company = aliased(CompanyProfile)
+    officer = aliased(OfficerProfile)
+    return (
+        select(VehicleLog.id, VehicleLog.timestamp, VehicleLog.number_plate, VehicleLog.company_id,
+               company.company_name, VehicleLog.phone, VehicleLog.email, VehicleLog.location,
+               VehicleLog.checkpoint, VehicleLog.amount_paid, VehicleLog.officer_id, officer.full_name,
+               VehicleLog.token_serial)
+        .outerjoin(company, company.user_id == VehicleLog.company_id)
+        .outerjoin(officer, officer.user_id == VehicleLog.officer_id)
+        .where(*filters.criteria())
+        .order_by(VehicleLog.id)
+    )
+
+
+# ---------------------
+# Postgres: COPY TO STDOUT relayed through a queue
+# ---------------------
+class _QueueWriter:
+    """File-like target for ``copy_expert`` that hands each chunk to the response generator."""
+
+    def __init__(self, chunks, cancelled):
+        self.chunks = chunks
+        self.cancelled = cancelled
+
+    def write(self, data):
+        while True:
+            if self.cancelled.is_set():
+                raise ExportCancelled()
+            try:
+                self.chunks.put(data if isinstance(data, bytes) else data.encode('utf-8'), timeout=1)
+                return len(data)
+            except queue.Full:
+                continue
+
+
+def _copy_sql(cursor, stmt, engine):
+    compiled = stmt.compile(dialect=engine.dialect)
+    # mogrify quotes the bound filter values exactly as execute() would
+    query = cursor.mogrify(str(compiled), compiled.params).decode('utf-8')
+    return f'COPY ({query}) TO STDOUT WITH (FORMAT csv)'
+
+
+def _copy_rows(engine, stmt):
+    chunks = queue.Queue(maxsize=QUEUE_CHUNKS)
+    cancelled = threading.Event()
+
+    def run():
+        raw = None
+        try:
+            raw = engine.raw_connection()
+            cursor = raw.cursor()
+            cursor.copy_expert(_copy_sql(cursor, stmt, engine), _QueueWriter(chunks, cancelled))
+            cursor.close()
+            chunks.put(_DONE)
+        except ExportCancelled:
+            pass
+        except Exception as exc:
+            logger.exception('Raw export COPY failed')
+            chunks.put(exc)
+        finally:
+            if raw is not None:
+                # Back to the pool, which rolls back the read-only transaction
+                raw.close()
+
+    worker = threading.Thread(target=run, name='raw-export-copy', daemon=True)
+    worker.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        # Also runs when the client goes away and the response generator is closed
+        cancelled.set()
+
+
+# ---------------------
+# Fallback: batched SELECT through the csv module
+# ---------------------
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+def _select_rows(stmt):
+    result = db.session.execute(stmt.execution_options(yield_per=BATCH_ROWS))
+    for batch in result.partitions():
+        yield _csv_lines(batch)
+
+
+def _archived_rows(filters):
+    archived = archive_for(filters)
+    if not archived:
+        return
+    # One month in memory at a time, oldest first
+    for df in archived.frames(filters, newest_first=False):
+        yield from _archived_month_rows(df.sort_values('id', ignore_index=True))
+
+
+def _archived_month_rows(df):
+    companies = company_names(set(int(c) for c in df['company_id'].unique()))
+    officer_ids = [int(o) for o in df['officer_id'].unique() if o >= 0]
+    officers = dict(db.session.execute(
+        select(OfficerProfile.user_id, OfficerProfile.full_name).where(OfficerProfile.user_id.in_(officer_ids))
+    ).all()) if officer_ids else {}
+    rows = []
+    for row in df.itertuples(index=False):
+        company_id = int(row.company_id) if row.company_id >= 0 else None
+        officer_id = int(row.officer_id) if row.officer_id >= 0 else None
+        rows.append((int(row.id), row.timestamp.to_pydatetime(), row.number_plate, company_id,
+                     companies.get(company_id), row.phone or None, row.email or None, row.location or None,
+                     row.checkpoint or None, None if row.amount_paid != row.amount_paid else float(row.amount_paid),
+                     officer_id, officers.get(officer_id), row.token_serial or None))
+        if len(rows) >= BATCH_ROWS:
+            yield _csv_lines(rows)
+            rows = []
+    if rows:
+        yield _csv_lines(rows)
+
+
+def stream_csv(filters):
+    """CSV bytes (header first) for every log ``filters`` selects, hot rows then archived ones."""
+    yield _csv_lines([HEADER])
+    stmt = export_select(filters)
+    engine = read_engine()
+    if engine.dialect.name == 'postgresql' and engine.dialect.driver == 'psycopg2':
+        yield from _copy_rows(engine, stmt)
+    else:
+        yield from _select_rows(stmt)
+    yield from _archived_rows(filters)
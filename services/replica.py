@@ -0,0 +1,176 @@
+"""Read-replica routing for the analytics views.
+
+Set ``REPLICA_DATABASE_URI`` to a streaming replica of the primary and it
+becomes the ``replica`` bind. Views decorated with ``@read_replica``
+(dashboard, reports, exports, officer performance, the JSON API) may then
+run their SELECTs there. Everything else stays on the primary:
+- writes and ``SELECT ... FOR UPDATE``;
+- raw ``text()`` statements;
+- every statement of a request once it has written anything;
+- work outside a request (CLI, background threads).
+
+Two guards keep replica reads from going stale:
+- Lag guard. The replica's lag is probed at most every
+  ``REPLICA_LAG_CHECK_SECONDS``. When it is more than
+  ``REPLICA_MAX_LAG_SECONDS`` behind, or cannot be reached, requests read
+  from the primary. A standby only counts as caught up while its WAL
+  receiver is streaming; with the receiver down, the lag is the age of the
+  last commit it replayed.
+- Read-after-write. A request that writes pins its user to the primary for
+  ``REPLICA_STICKY_SECONDS``, so the page they are redirected to shows
+  their own entry even before the replica has replayed it.
+
+The routing is decided once per request, so a page never mixes the two
+databases. For a local test, point the URI at a second database holding a
+copy of the data. Databases other than Postgres, and Postgres servers that
+are not standbys, report no lag.
+"""
+import functools
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, session
+from sqlalchemy import event, text
+
+from models import db, RoutingSession
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+BIND_KEY = 'replica'
+PIN_KEY = '_primary_until'
+# Caught up when the WAL receiver is streaming and everything received has been replayed. A standby
+# whose receiver is down has nothing more to receive, so the LSNs match while it falls behind: then,
+# as when replay is behind, the lag is the age of the last replayed commit (NULL if it never replayed).
+LAG_SQL = text(
+    "SELECT pg_is_in_recovery() AS standby, "
+    "CASE WHEN EXISTS (SELECT 1 FROM pg_stat_wal_receiver) "
+    "AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END AS lag"
+)
+
+REQUESTS = registry.counter(
+    'checkpoint_replica_requests_total', 'Replica-eligible requests by where their reads went and why.',
+    ('target', 'reason'))
+LAG = registry.gauge('checkpoint_replica_lag_seconds', 'Replica lag at the last probe (-1 when unreachable).')
+
+
+class ReplicaRouter:
+    def __init__(self, app):
+        self.max_lag = app.config['REPLICA_MAX_LAG_SECONDS']
+        self.check_seconds = app.config['REPLICA_LAG_CHECK_SECONDS']
+        self.sticky_seconds = app.config['REPLICA_STICKY_SECONDS']
+        self._lag = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def lag(self):
+        """Seconds the replica is behind, probed at most every ``check_seconds``; None when unreachable."""
+        if self._checked is None or time.monotonic() - self._checked >= self.check_seconds:
+            with self._lock:
+                if self._checked is None or time.monotonic() - self._checked >= self.check_seconds:
+                    self._lag = self._probe()
+                    self._checked = time.monotonic()
+                    LAG.set((), -1 if self._lag is None else self._lag)
+        return self._lag
+
+    def _probe(self):
+        engine = db.engines[BIND_KEY]
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name != 'postgresql':
+                    return 0.0
+                row = conn.execute(LAG_SQL).one()
+        except Exception:
+            logger.warning('Replica lag probe failed; reading from the primary', exc_info=True)
+            return None
+        if not row.standby:
+            return 0.0
+        if row.lag is None:
+            logger.warning('Replica is not streaming and has replayed nothing; reading from the primary')
+            return None
+        return float(row.lag)
+
+    def _choose(self):
+        if session.get(PIN_KEY, 0) > time.time():
+            return None, 'pinned'
+        lag = self.lag()
+        if lag is None:
+            return None, 'unavailable'
+        if lag > self.max_lag:
+            return None, 'lagging'
+        return db.engines[BIND_KEY], 'fresh'
+
+    def read_engine(self):
+        """The replica engine for this request's reads, or None for the primary. Decided once per request."""
+        if 'replica_engine' not in g:
+            g.replica_engine, reason = self._choose()
+            REQUESTS.inc(('primary' if g.replica_engine is None else 'replica', reason))
+        return g.replica_engine
+
+    def route(self, db_session, clause):
+        """``RoutingSession.get_bind`` hook: an engine for ``clause``, or None to use the primary."""
+        if not has_request_context():
+            return None
+        if getattr(clause, 'is_dml', False):
+            # Bulk UPDATE/INSERT/DELETE through the session
+            note_write()
+            return None
+        if not g.get('replica_reads') or g.get('replica_wrote'):
+            return None
+        # Plain and lambda SELECTs (LogFilter.select builds lambda statements) without FOR UPDATE
+        if not getattr(clause, 'is_select', False) or getattr(clause, '_for_update_arg', None) is not None:
+            return None
+        return self.read_engine()
+
+    def pin_after_write(self, response):
+        if g.get('replica_wrote'):
+            session[PIN_KEY] = time.time() + self.sticky_seconds
+        return response
+
+
+def read_replica(view):
+    """Let ``view`` read from the replica (when one is configured and fresh enough)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.replica_reads = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def note_write():
+    """Keep this request, and its user for a while, on the primary after a write.
+
+    The session marks its own flushes and bulk statements; call this for writes made on ``db.engine`` directly.
+    """
+    if has_request_context():
+        g.replica_wrote = True
+
+
+def read_engine():
+    """Engine for raw reads (e.g. COPY) in this request: the replica when routing allows, else the primary."""
+    router = RoutingSession.read_router
+    if router is not None and has_request_context() and g.get('replica_reads') and not g.get('replica_wrote'):
+        engine = router.read_engine()
+        if engine is not None:
+            return engine
+    return db.engine
+
+
+def _note_flush(db_session, flush_context):
+    note_write()
+
+
+def init_app(app):
+    for key, default in (('REPLICA_MAX_LAG_SECONDS', 5), ('REPLICA_LAG_CHECK_SECONDS', 2),
+                         ('REPLICA_STICKY_SECONDS', 10)):
+        app.config.setdefault(key, default)
+    if BIND_KEY not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        return None
+    router = ReplicaRouter(app)
+    RoutingSession.read_router = router
+    app.extensions['replica'] = router
+    event.listen(RoutingSession, 'after_flush', _note_flush)
+    app.after_request(router.pin_after_write)
+    return router
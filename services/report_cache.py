@@ -0,0 +1,136 @@
+"""Content-addressed cache of rendered reports.
+
+A report is a pure function of its format, filters, chart flag and the logs
+those filters select. The cache key hashes all of these together with a
+watermark *scoped to the filtered range*:
+- the highest log id, the row count and the latest timestamp inside the range;
+- the reference version (companies, cargo types, archive manifest).
+
+A new log inside the range always changes the key: it raises the count even
+when it commits late, below an id that was already visible. New logs
+outside it (e.g. today's traffic, for a report on last March) do not.
+Rows leave the hot table only through the archive, whose manifest version
+is part of the reference.
+
+Artifacts live under ``REPORT_CACHE_DIR`` as ``<key[:2]>/<key>.<ext>``. A
+hit refreshes the file's mtime, and ``put`` evicts the least recently used
+files once the directory grows past ``REPORT_CACHE_MB``.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from models import VehicleLog, db
+from services.watermark import reference_version
+
+logger = logging.getLogger(__name__)
+
+# Bump when the report layout changes so old artifacts stop matching
+RENDER_VERSION = 2
+EXTENSIONS = {'pdf': 'pdf', 'excel': 'xlsx'}
+
+
+class RangeWatermark(namedtuple('RangeWatermark', 'log_id rows log_time reference')):
+    __slots__ = ()
+
+
+def range_watermark(filters):
+    """Watermark of just the logs ``filters`` select: one pass over the range."""
+    stmt = filters.select(lambda: select(func.max(VehicleLog.id), func.count(VehicleLog.id),
+                                         func.max(VehicleLog.timestamp)))
+    log_id, rows, log_time = db.session.execute(stmt).one()
+    return RangeWatermark(log_id or 0, rows, log_time, reference_version())
+
+
+def report_key(format, filters, include_chart, watermark):
+    payload = json.dumps([RENDER_VERSION, format, filters.cache_key(), bool(include_chart),
+                          watermark.log_id, watermark.rows, watermark.reference], default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ReportCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path(self, key, format):
+        return os.path.join(self.directory, key[:2], f'{key}.{EXTENSIONS[format]}')
+
+    def get(self, key, format):
+        """Path of the cached artifact, or None. A hit counts as a use for LRU."""
+        path = self.path(key, format)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, format, content):
+        path = self.path(key, format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as fh:
+            fh.write(content)
+        os.replace(tmp, path)
+        self.evict()
+        return path
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                full = os.path.join(root, name)
+                try:
+                    stat = os.stat(full)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, full))
+        return entries
+
+    def evict(self):
+        """Delete least recently used artifacts until the cache fits in ``max_bytes``."""
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return 0
+            removed = 0
+            for _, size, full in sorted(entries):
+                try:
+                    os.remove(full)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+                if total <= self.max_bytes:
+                    break
+            logger.info('Report cache evicted %d artifacts', removed)
+            return removed
+
+    def stats(self):
+        entries = self._entries()
+        return {'files': len(entries), 'bytes': sum(size for _, size, _ in entries), 'max_bytes': self.max_bytes}
+
+
+def cache():
+    """The app's report cache, or None when disabled."""
+    return current_app.extensions.get('report_cache')
+
+
+def init_app(app):
+    max_mb = int(app.config.setdefault('REPORT_CACHE_MB', 256))
+    directory = app.config.setdefault('REPORT_CACHE_DIR', os.path.join(app.instance_path, 'report_cache'))
+    if max_mb <= 0:
+        return None
+    report_cache = ReportCache(directory, max_mb * 1024 * 1024)
+    app.extensions['report_cache'] = report_cache
+    return report_cache
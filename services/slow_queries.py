@@ -0,0 +1,192 @@
+"""Slow-query log with sampled ``EXPLAIN`` capture.
+
+Statements slower than ``SLOW_QUERY_THRESHOLD_MS`` are logged and kept in a
+per-worker table keyed by a normalized fingerprint, so the same query issued
+with different literals shows up as one entry with a hit count.
+
+The captured plan is a plain ``EXPLAIN``: it only plans the statement, so
+it adds no more than a round trip to the request that was already slow.
+``SLOW_QUERY_EXPLAIN_ANALYZE`` switches to ``EXPLAIN (ANALYZE, BUFFERS)``,
+which runs the statement a second time on the request's connection; leave
+it off in production and use Postgres's ``auto_explain`` for measured plans.
+"""
+import hashlib
+import logging
+import random
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from time import perf_counter
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_BIND_MARKER = re.compile(r'%\(\w+\)s|%s|\?|(?<!:):\w+')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_statement(statement):
+    """Replace literals and bind markers with ``?`` and collapse whitespace."""
+    normalized = _STRING_LITERAL.sub('?', statement)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _BIND_MARKER.sub('?', normalized)
+    normalized = _IN_LIST.sub('(?)', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+class SlowQueryEntry:
+    def __init__(self, key, normalized):
+        self.fingerprint = key
+        self.statement = normalized
+        self.example = None
+        self.parameters = None
+        self.routes = set()
+        self.last_route = None
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+        self.first_seen = datetime.utcnow()
+        self.last_seen = self.first_seen
+        self.plan = None
+        self.plan_captured_at = None
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms=500.0, explain_sample_rate=0.0, max_entries=200, explain_analyze=False):
+        self.threshold_ms = threshold_ms
+        self.explain_sample_rate = explain_sample_rate
+        self.explain_analyze = explain_analyze
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, statement, parameters, elapsed_ms, route):
+        normalized = normalize_statement(statement)
+        key = fingerprint(normalized)
+        with self._lock:
+            entry = self._entries.pop(key, None) or SlowQueryEntry(key, normalized)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+            entry.count += 1
+            entry.total_ms += elapsed_ms
+            entry.max_ms = max(entry.max_ms, elapsed_ms)
+            entry.last_ms = elapsed_ms
+            entry.last_seen = datetime.utcnow()
+            entry.example = statement
+            entry.parameters = _truncate(repr(parameters))
+            entry.last_route = route
+            entry.routes.add(route)
+        return entry
+
+    def should_explain(self, statement):
+        return (
+            self.explain_sample_rate > 0
+            and statement.lstrip()[:6].upper() == 'SELECT'
+            and random.random() < self.explain_sample_rate
+        )
+
+    def entries(self):
+        with self._lock:
+            return sorted(self._entries.values(), key=lambda e: e.total_ms, reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _truncate(text, limit=500):
+    return text if len(text) <= limit else text[:limit] + '…'
+
+
+def _current_route():
+    if has_request_context():
+        return request.endpoint or request.path
+    return 'background'
+
+
+def _explain(cursor, statement, parameters, analyze=False):
+    """Run EXPLAIN (or EXPLAIN ANALYZE) on the raw DBAPI connection inside a savepoint.
+
+    Going through the DBAPI keeps the EXPLAIN out of SQLAlchemy's own events
+    and the savepoint keeps a failed EXPLAIN from aborting the caller's
+    transaction.
+    """
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute('SAVEPOINT slow_query_explain')
+        try:
+            prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+            explain_cursor.execute(prefix + statement, parameters)
+            plan = '\n'.join(row[0] for row in explain_cursor.fetchall())
+        except Exception:
+            explain_cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+            raise
+        explain_cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+        return plan
+    finally:
+        explain_cursor.close()
+
+
+def init_app(app):
+    threshold_ms = float(app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 500.0))
+    slow_log = SlowQueryLog(
+        threshold_ms=threshold_ms,
+        explain_sample_rate=float(app.config.setdefault('SLOW_QUERY_EXPLAIN_SAMPLE', 0.0)),
+        max_entries=int(app.config.setdefault('SLOW_QUERY_MAX_ENTRIES', 200)),
+        explain_analyze=bool(app.config.setdefault('SLOW_QUERY_EXPLAIN_ANALYZE', False)),
+    )
+    app.extensions['slow_queries'] = slow_log
+    if threshold_ms <= 0:
+        return slow_log
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_start', []).append(perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('slow_query_start')
+        if not starts:
+            return
+        elapsed_ms = (perf_counter() - starts.pop()) * 1000
+        if elapsed_ms < slow_log.threshold_ms:
+            return
+
+        route = _current_route()
+        entry = slow_log.record(statement, parameters, elapsed_ms, route)
+        logger.warning('Slow query %s (%.1f ms) from %s: %s params=%s',
+                       entry.fingerprint, elapsed_ms, route, entry.statement, entry.parameters)
+
+        if (not executemany and conn.dialect.name == 'postgresql'
+                and slow_log.should_explain(statement)):
+            try:
+                entry.plan = _explain(cursor, statement, parameters, slow_log.explain_analyze)
+                entry.plan_captured_at = datetime.utcnow()
+            except Exception:
+                logger.exception('EXPLAIN failed for slow query %s', entry.fingerprint)
+
+    def handle_error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('slow_query_start'):
+            connection.info['slow_query_start'].pop()
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(Engine, 'handle_error', handle_error)
+    return slow_log
@@ -0,0 +1,269 @@
+"""Month-end statements for every company in one batch.
+
+``build_statements(month)`` reads the month's logs once, ordered by company,
+and splits them into one job per company as the rows stream past. Archived
+months are read from the archive instead. Each job is rendered to PDF and/or
+Excel in a process pool. Rendering is CPU-bound, so wall-clock time scales
+with the number of cores rather than the number of companies. The
+statements are bundled into ``statements_YYYY-MM.zip`` together with a
+``manifest.json`` that lists each company's totals and file checksums.
+
+Workers only receive plain tuples and never touch the database. They are
+started from a forkserver (spawn where that is unavailable), never forked
+from the caller: a gunicorn worker has other request threads, open database
+connections and the ingest/mailer threads, none of which survive a fork.
+``flask statements`` writes the ZIP to STATEMENTS_DIR, and the admin download
+serves that file instead of rendering again while it is current. The
+manifest records the month's data version, a digest of its range watermark
+(see services/report_cache.py). A log back-dated into the month, or a
+change to the companies or the archive, changes that version, and the next
+download rebuilds the ZIP.
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import xlsxwriter
+from flask import current_app
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from sqlalchemy import select
+
+from models import db, VehicleLog, CompanyProfile
+from services import partitions
+from services.archive import archive_for, company_names, month_key
+from services.log_filter import LogFilter
+from services.report_cache import range_watermark
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('pdf', 'excel')
+LOGO_PATH = os.path.join(os.path.dirname(__file__), '..', 'static', 'logo.png')
+
+
+# ---------------------
+# Collecting (one pass)
+# ---------------------
+def collect_month(month):
+    """``[(company_id, company_name, rows)]`` for ``month``, where rows are ``(time, plate, checkpoint, amount)``."""
+    month = partitions.month_start(month)
+    filters = LogFilter(year=month.year, month=month.month)
+    stmt = (
+        select(VehicleLog.company_id, CompanyProfile.company_name, VehicleLog.timestamp,
+               VehicleLog.number_plate, VehicleLog.checkpoint, VehicleLog.amount_paid)
+        .outerjoin(CompanyProfile, CompanyProfile.user_id == VehicleLog.company_id)
+        .where(*filters.criteria())
+        .order_by(VehicleLog.company_id, VehicleLog.timestamp)
+        .execution_options(yield_per=5000)
+    )
+    jobs = {}
+    for company_id, name, ts, plate, checkpoint, amount in db.session.execute(stmt):
+        job = jobs.get(company_id)
+        if job is None:
+            job = jobs[company_id] = (company_id, name or 'Unknown', [])
+        job[2].append((ts.strftime('%Y-%m-%d %H:%M'), plate, checkpoint or '', float(amount or 0.0)))
+
+    archived = archive_for(filters)
+    if archived:
+        frame = archived.frame(filters).sort_values(['company_id', 'timestamp'])
+        records = archived.records(frame)
+        names = company_names({record['company_id'] for record in records})
+        for record in records:
+            company_id = record['company_id']
+            job = jobs.get(company_id)
+            if job is None:
+                job = jobs[company_id] = (company_id, names.get(company_id, 'Unknown'), [])
+            job[2].append((record['timestamp'].strftime('%Y-%m-%d %H:%M'), record['number_plate'],
+                           record['checkpoint'] or '', record['amount_paid'] or 0.0))
+    return sorted(jobs.values(), key=lambda job: job[1].lower())
+
+
+# ---------------------
+# Rendering (runs in worker processes)
+# ---------------------
+def _slug(name):
+    return ''.join(ch if ch.isalnum() else '_' for ch in name).strip('_') or 'company'
+
+
+def render_statement(job):
+    """Render one company's statement. Returns ``(company_id, name, vehicles, revenue, {filename: bytes})``."""
+    company_id, name, key, rows, formats = job
+    revenue = round(sum(row[3] for row in rows), 2)
+    base = f'{_slug(name)}_{company_id if company_id is not None else "none"}_{key}'
+    files = {}
+    if 'pdf' in formats:
+        files[f'{base}.pdf'] = _render_pdf(name, key, rows, revenue)
+    if 'excel' in formats:
+        files[f'{base}.xlsx'] = _render_excel(name, key, rows)
+    return company_id, name, len(rows), revenue, files
+
+
+def _render_pdf(name, key, rows, revenue):
+    output = io.BytesIO()
+    p = canvas.Canvas(output, pagesize=A4)
+    width, height = A4
+    y = height - 60
+    if os.path.exists(LOGO_PATH):
+        p.drawImage(ImageReader(LOGO_PATH), 40, y, width=80, preserveAspectRatio=True, mask='auto')
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(140, y, f"Monthly Statement: {name}")
+    y -= 20
+    p.setFont("Helvetica", 9)
+    p.drawString(140, y, f"Period: {key}    Vehicles: {len(rows):,}    Total: ZMW {revenue:,.2f}")
+    y -= 40
+
+    def header(y):
+        p.setFont("Helvetica-Bold", 10)
+        for i, title in enumerate(["Time", "Plate", "Checkpoint", "Amount"]):
+            p.drawString(40 + i * 120, y, title)
+        p.setFont("Helvetica", 9)
+        return y - 20
+
+    y = header(y)
+    for ts, plate, checkpoint, amount in rows:
+        p.drawString(40, y, ts)
+        p.drawString(160, y, plate)
+        p.drawString(280, y, checkpoint[:18])
+        p.drawString(400, y, f"ZMW {amount:.2f}")
+        y -= 16
+        if y < 60:
+            p.showPage()
+            y = header(height - 60)
+
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(40, y - 10, f"Total Due: ZMW {revenue:,.2f}")
+    p.setFont("Helvetica-Oblique", 8)
+    p.drawString(40, 30, "Generated by Vehicle Checkpoint Monitoring System")
+    p.save()
+    return output.getvalue()
+
+
+def _render_excel(name, key, rows):
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    sheet = workbook.add_worksheet(key)
+    bold = workbook.add_format({'bold': True})
+    money = workbook.add_format({'num_format': 'ZMW #,##0.00'})
+    sheet.write(0, 0, f"Monthly Statement: {name}", bold)
+    sheet.write_row(2, 0, ["Time", "Plate", "Checkpoint", "Amount"], bold)
+    sheet.set_column(0, 2, 20)
+    sheet.set_column(3, 3, 16, money)
+    for r, (ts, plate, checkpoint, amount) in enumerate(rows, start=3):
+        sheet.write_row(r, 0, [ts, plate, checkpoint, amount])
+    total_row = len(rows) + 3
+    sheet.write(total_row, 2, 'Total:', bold)
+    sheet.write_formula(total_row, 3, f'=SUM(D4:D{total_row})', money)
+    workbook.close()
+    return output.getvalue()
+
+
+# ---------------------
+# Batch
+# ---------------------
+def build_statements(month, output, formats=FORMATS, workers=None):
+    """Write every company's statement for ``month`` into the ZIP at ``output`` (a path or file object).
+
+    A path is written through a temporary file and renamed into place, so readers never see a partial ZIP.
+    Returns the manifest written alongside the statements.
+    """
+    month = partitions.month_start(month)
+    key = month_key(month)
+    formats = _formats(formats)
+    # Taken before reading, so a log that commits during the build makes the result stale, not current
+    version = data_version(month)
+    jobs = [(company_id, name, key, rows, formats) for company_id, name, rows in collect_month(month)]
+    if workers is None:
+        workers = current_app.config.get('STATEMENT_WORKERS') or os.cpu_count() or 1
+
+    manifest = {'month': key, 'generated_at': datetime.utcnow().isoformat(timespec='seconds'),
+                'data_version': version, 'formats': list(formats), 'companies': [], 'vehicles': 0, 'revenue': 0.0}
+    if isinstance(output, (str, os.PathLike)):
+        directory = os.path.dirname(os.path.abspath(output))
+        fd, partial = tempfile.mkstemp(prefix='.statements-', suffix='.zip', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                manifest = _write_bundle(fh, jobs, workers, manifest)
+            os.replace(partial, output)
+        except BaseException:
+            os.unlink(partial)
+            raise
+    else:
+        manifest = _write_bundle(output, jobs, workers, manifest)
+    logger.info('Statements for %s: %d companies, %d vehicles', key, len(jobs), manifest['vehicles'])
+    return manifest
+
+
+def _write_bundle(output, jobs, workers, manifest):
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+        for company_id, name, vehicles, revenue, files in _render_all(jobs, workers):
+            for filename, content in files.items():
+                bundle.writestr(filename, content)
+            manifest['companies'].append({
+                'company_id': company_id,
+                'company_name': name,
+                'vehicles': vehicles,
+                'revenue': revenue,
+                'files': {filename: {'bytes': len(content), 'sha256': hashlib.sha256(content).hexdigest()}
+                          for filename, content in files.items()},
+            })
+            manifest['vehicles'] += vehicles
+            manifest['revenue'] = round(manifest['revenue'] + revenue, 2)
+        bundle.writestr('manifest.json', json.dumps(manifest, indent=1))
+    return manifest
+
+
+def _render_all(jobs, workers):
+    # A pool only pays off with several companies to spread across processes
+    if workers <= 1 or len(jobs) <= 1:
+        yield from map(render_statement, jobs)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=_mp_context()) as pool:
+        # map yields in company order, so the ZIP layout is deterministic
+        yield from pool.map(render_statement, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+
+
+def data_version(month):
+    """Digest of ``month``'s range watermark; any change to its logs or reference data changes it."""
+    month = partitions.month_start(month)
+    watermark = range_watermark(LogFilter(year=month.year, month=month.month))
+    return hashlib.sha256(json.dumps(list(watermark), default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def is_current(path, month):
+    """True when the ZIP at ``path`` was built from ``month``'s data as it stands now."""
+    try:
+        with zipfile.ZipFile(path) as bundle:
+            manifest = json.loads(bundle.read('manifest.json'))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return False
+    return manifest.get('data_version') == data_version(month)
+
+
+def _mp_context():
+    # fork would copy the caller's threads, locks and pooled connections into every worker
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def _formats(formats):
+    return tuple(f for f in FORMATS if f in formats) or FORMATS
+
+
+def default_path(month, formats=FORMATS):
+    """``STATEMENTS_DIR/statements_YYYY-MM.zip``; a subset of the formats gets its own file."""
+    directory = current_app.config.get('STATEMENTS_DIR') or os.path.join(current_app.instance_path, 'statements')
+    os.makedirs(directory, exist_ok=True)
+    formats = _formats(formats)
+    suffix = '' if formats == FORMATS else '_' + '_'.join(formats)
+    return os.path.join(directory, f'statements_{month_key(partitions.month_start(month))}{suffix}.zip')
@@ -0,0 +1,279 @@
+"""Synthetic checkpoint data for benchmarks and load tests.
+
+Fills every table with realistically skewed data: a few large haulage
+companies dominate traffic, checkpoints differ in volume, and entries follow
+a daytime/weekday traffic curve. Rows are written in chunks through
+Postgres ``COPY`` when available and through executemany otherwise.
+"""
+import csv
+import io
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select, text
+from werkzeug.security import generate_password_hash
+
+from models import (db, User, CompanyProfile, OfficerProfile, CargoType, Token,
+                    VehicleLog, OfficerShift)
+
+SCALES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# Every synthetic company/officer account logs in with this password
+SYNTHETIC_PASSWORD = 'synthetic123'
+
+CHECKPOINTS = {
+    'Kapiri North': 0.22, 'Kapiri South': 0.18, 'Tazara Junction': 0.15, 'Great North Road': 0.14,
+    'Mkushi Turnoff': 0.10, 'Kabwe Road': 0.09, 'Ndola Road': 0.07, 'Lusaka Road': 0.05,
+}
+
+CARGO_TYPES = {
+    'Copper Cathodes': 450.0, 'Fuel Tanker': 380.0, 'Maize': 150.0, 'Timber': 200.0,
+    'Cement': 180.0, 'Fertiliser': 160.0, 'General Goods': 120.0, 'Livestock': 100.0,
+}
+
+# Relative traffic per hour of day (0-23) and per weekday (Monday first)
+HOUR_WEIGHTS = np.array([1, 1, 1, 1, 2, 4, 7, 9, 10, 10, 9, 9, 8, 9, 9, 9, 8, 7, 6, 4, 3, 2, 2, 1], dtype=float)
+WEEKDAY_WEIGHTS = np.array([1.0, 1.0, 1.0, 1.0, 1.1, 0.7, 0.4])
+
+CHUNK_SIZE = 100_000
+
+
+def scale_to_rows(scale):
+    if isinstance(scale, int):
+        return scale
+    key = str(scale).lower()
+    if key in SCALES:
+        return SCALES[key]
+    return int(key.replace('_', ''))
+
+
+def plan_sizes(log_rows):
+    """Derive the size of the other tables from the number of vehicle logs."""
+    return {
+        'companies': int(min(2000, max(20, log_rows // 2000))),
+        'officers': int(min(1000, max(10, log_rows // 5000))),
+        'tokens': int(log_rows // 2),
+        'logs': int(log_rows),
+    }
+
+
+class SyntheticDataGenerator:
+    def __init__(self, log_rows, days=365, seed=42, end=None, chunk_size=CHUNK_SIZE):
+        self.sizes = plan_sizes(log_rows)
+        self.days = days
+        self.end = (end or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+        self.start = self.end - timedelta(days=days)
+        self.rng = np.random.default_rng(seed)
+        self.chunk_size = chunk_size
+        self.counts = {}
+
+    # ---------------------
+    # Entry point
+    # ---------------------
+    def run(self):
+        engine = db.engine
+        with engine.begin() as conn:
+            self.ids = {
+                'users': _next_id(conn, User),
+                'company_profiles': _next_id(conn, CompanyProfile),
+                'officer_profiles': _next_id(conn, OfficerProfile),
+                'cargo_types': _next_id(conn, CargoType),
+                'tokens': _next_id(conn, Token),
+                'vehicle_logs': _next_id(conn, VehicleLog),
+                'officer_shifts': _next_id(conn, OfficerShift),
+            }
+            self._write_users(conn)
+            self._write_cargo_types(conn)
+            self._write_tokens(conn)
+            self._write_logs(conn)
+            self._write_shifts(conn)
+            if conn.dialect.name == 'postgresql':
+                for table in self.ids:
+                    conn.execute(text(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                        f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+                    ))
+        return self.counts
+
+    # ---------------------
+    # Tables
+    # ---------------------
+    def _write_users(self, conn):
+        password_hash = generate_password_hash(SYNTHETIC_PASSWORD)
+        now = self.end
+        first_user = self.ids['users']
+        n_companies, n_officers = self.sizes['companies'], self.sizes['officers']
+
+        self.company_user_ids = np.arange(first_user, first_user + n_companies)
+        self.officer_user_ids = np.arange(first_user + n_companies, first_user + n_companies + n_officers)
+
+        users = []
+        for uid in self.company_user_ids:
+            uid = int(uid)
+            users.append((uid, 'company', f'company{uid}@synthetic.test', f'+26097{uid:07d}', password_hash, now, None, False))
+        for uid in self.officer_user_ids:
+            uid = int(uid)
+            users.append((uid, 'officer', f'officer{uid}@synthetic.test', f'+26096{uid:07d}', password_hash, now, None, False))
+        self._copy(conn, User.__table__,
+                   ['id', 'role', 'email', 'phone', 'password_hash', 'created_at', 'last_login', 'is_logged_in'], users)
+
+        profile_id = self.ids['company_profiles']
+        companies = [
+            (profile_id + i, int(uid), f'Synthetic Haulage {uid}', f'Director {uid}', f'{uid:06d}/10/1')
+            for i, uid in enumerate(self.company_user_ids)
+        ]
+        self._copy(conn, CompanyProfile.__table__, ['id', 'user_id', 'company_name', 'full_name', 'nrc'], companies)
+
+        checkpoints = list(CHECKPOINTS)
+        self.officer_checkpoints = [checkpoints[i % len(checkpoints)] for i in range(n_officers)]
+        profile_id = self.ids['officer_profiles']
+        officers = [
+            (profile_id + i, int(uid), f'Officer {uid}', f'{uid:06d}/20/1', self.officer_checkpoints[i])
+            for i, uid in enumerate(self.officer_user_ids)
+        ]
+        self._copy(conn, OfficerProfile.__table__, ['id', 'user_id', 'full_name', 'nrc', 'checkpoint'], officers)
+
+        # Zipf-like company popularity: a handful of hauliers carry most trucks
+        ranks = np.arange(1, n_companies + 1)
+        self.company_weights = 1.0 / ranks ** 1.1
+        self.company_weights /= self.company_weights.sum()
+
+    def _write_cargo_types(self, conn):
+        existing = dict(conn.execute(select(CargoType.name, CargoType.id)).all())
+        rows = []
+        next_id = self.ids['cargo_types']
+        for name, price in CARGO_TYPES.items():
+            if name not in existing:
+                rows.append((next_id, name, price))
+                existing[name] = next_id
+                next_id += 1
+        self._copy(conn, CargoType.__table__, ['id', 'name', 'price'], rows)
+        self.cargo_ids = np.array([existing[name] for name in CARGO_TYPES])
+        self.cargo_prices = np.array(list(CARGO_TYPES.values()))
+        self.cargo_weights = np.array([0.25, 0.12, 0.15, 0.1, 0.1, 0.08, 0.15, 0.05])
+
+    def _write_tokens(self, conn):
+        total = self.sizes['tokens']
+        first_id = self.ids['tokens']
+        columns = ['id', 'serial', 'vehicle_plate', 'cargo_type_id', 'price', 'status',
+                   'created_at', 'expiration_date', 'used_at', 'company_id']
+        now = self.end
+        for offset in range(0, total, self.chunk_size):
+            n = min(self.chunk_size, total - offset)
+            ids = np.arange(first_id + offset, first_id + offset + n)
+            companies = self.rng.choice(self.company_user_ids, size=n, p=self.company_weights)
+            cargo = self.rng.choice(len(self.cargo_ids), size=n, p=self.cargo_weights)
+            created = self._random_timestamps(n)
+            valid_days = self.rng.choice([1, 3, 7, 14], size=n, p=[0.2, 0.5, 0.2, 0.1])
+            used = self.rng.random(n) < 0.8
+            rows = []
+            for i in range(n):
+                created_at = created[i]
+                expires = created_at + timedelta(days=int(valid_days[i]))
+                if used[i]:
+                    status, used_at = 'used', created_at + timedelta(hours=int(self.rng.integers(1, 24 * int(valid_days[i]))))
+                else:
+                    status, used_at = ('expired' if expires < now else 'active'), None
+                rows.append((int(ids[i]), f'SYN{ids[i]:010d}', self._plate(companies[i], ids[i]),
+                             int(self.cargo_ids[cargo[i]]), float(self.cargo_prices[cargo[i]]), status,
+                             created_at, expires, used_at, int(companies[i])))
+            self._copy(conn, Token.__table__, columns, rows)
+
+    def _write_logs(self, conn):
+        total = self.sizes['logs']
+        first_id = self.ids['vehicle_logs']
+        checkpoints = list(CHECKPOINTS)
+        checkpoint_weights = np.array(list(CHECKPOINTS.values()))
+        officers_by_checkpoint = {
+            cp: [int(uid) for uid, ocp in zip(self.officer_user_ids, self.officer_checkpoints) if ocp == cp]
+            for cp in checkpoints
+        }
+        columns = ['id', 'number_plate', 'company_id', 'phone', 'email', 'location', 'checkpoint',
+                   'amount_paid', 'officer_id', 'timestamp', 'token_serial']
+        for offset in range(0, total, self.chunk_size):
+            n = min(self.chunk_size, total - offset)
+            ids = np.arange(first_id + offset, first_id + offset + n)
+            companies = self.rng.choice(self.company_user_ids, size=n, p=self.company_weights)
+            checkpoint_idx = self.rng.choice(len(checkpoints), size=n, p=checkpoint_weights)
+            cargo = self.rng.choice(len(self.cargo_ids), size=n, p=self.cargo_weights)
+            vehicle = self.rng.integers(0, 50, size=n)
+            officer_pick = self.rng.integers(0, 1 << 30, size=n)
+            timestamps = np.sort(self._random_timestamps(n, as_datetime64=True))
+            rows = []
+            for i in range(n):
+                cp = checkpoints[checkpoint_idx[i]]
+                staff = officers_by_checkpoint[cp] or [int(self.officer_user_ids[0])]
+                company = int(companies[i])
+                rows.append((int(ids[i]), self._plate(company, vehicle[i]), company, f'+26095{company:07d}',
+                             f'dispatch{company}@synthetic.test', 'Kapiri Mposhi', cp,
+                             float(self.cargo_prices[cargo[i]]), staff[officer_pick[i] % len(staff)],
+                             timestamps[i].astype('datetime64[s]').item(), None))
+            self._copy(conn, VehicleLog.__table__, columns, rows)
+
+    def _write_shifts(self, conn):
+        next_id = self.ids['officer_shifts']
+        rows = []
+        columns = ['id', 'officer_id', 'start_time', 'end_time', 'checkpoint']
+        day0 = self.start.replace(hour=0)
+        for day in range(self.days):
+            date = day0 + timedelta(days=day)
+            for i, uid in enumerate(self.officer_user_ids):
+                # Two 12h shifts a day rotate across officers at the same checkpoint
+                start = date + timedelta(hours=6 if (i + day) % 2 == 0 else 18)
+                rows.append((next_id, int(uid), start, start + timedelta(hours=12), self.officer_checkpoints[i]))
+                next_id += 1
+                if len(rows) >= self.chunk_size:
+                    self._copy(conn, OfficerShift.__table__, columns, rows)
+                    rows = []
+        self._copy(conn, OfficerShift.__table__, columns, rows)
+
+    # ---------------------
+    # Helpers
+    # ---------------------
+    def _random_timestamps(self, n, as_datetime64=False):
+        days = self.rng.integers(0, self.days, size=n)
+        weekday_of_day = (np.datetime64(self.start.date()) + days).astype('datetime64[D]').view('int64')
+        weekday_of_day = (weekday_of_day + 3) % 7  # 1970-01-01 was a Thursday
+        # Thin out days by the weekday weight with a re-draw for rejected samples
+        keep = self.rng.random(n) < WEEKDAY_WEIGHTS[weekday_of_day] / WEEKDAY_WEIGHTS.max()
+        days = np.where(keep, days, self.rng.integers(0, self.days, size=n))
+        hours = self.rng.choice(24, size=n, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+        seconds = self.rng.integers(0, 3600, size=n)
+        base = np.datetime64(self.start.replace(hour=0), 's')
+        stamps = base + days.astype('timedelta64[D]') + hours.astype('timedelta64[h]') + seconds.astype('timedelta64[s]')
+        if as_datetime64:
+            return stamps
+        return [s.item() for s in stamps]
+
+    @staticmethod
+    def _plate(company_id, vehicle_no):
+        letters = 'ABCDEFGHJKLMNPRSTUVWXYZ'
+        a = letters[int(company_id) % len(letters)]
+        b = letters[(int(company_id) // len(letters)) % len(letters)]
+        return f'A{a}{b} {1000 + int(vehicle_no) % 9000}'
+
+    def _copy(self, conn, table, columns, rows):
+        if not rows:
+            return
+        self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+        if conn.dialect.name == 'postgresql':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows:
+                writer.writerow(['\\N' if value is None else value for value in row])
+            buffer.seek(0)
+            cursor = conn.connection.cursor()
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+            cursor.close()
+        else:
+            conn.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+
+def _next_id(conn, model):
+    return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def generate(scale='10k', days=365, seed=42):
+    """Populate the configured database; returns the row count per table."""
+    return SyntheticDataGenerator(scale_to_rows(scale), days=days, seed=seed).run()
@@ -0,0 +1,52 @@
+"""Token verification rules shared by the sync views and the async API.
+
+A token is consumed with one conditional UPDATE that matches only an
+active, unexpired token issued for the presented plate. Two concurrent
+verifications of the same token therefore cannot both succeed, whatever
+the driver. When nothing matched, ``rejection`` explains why, checking in
+the same order as ``verify_token``.
+"""
+from sqlalchemy import update
+
+from models import Token
+
+REJECTIONS = {
+    'invalid': "Invalid token serial number.",
+    'mismatch': "Number plate does not match the token.",
+    'used': "This token has already been used.",
+    'expired': "This token has expired.",
+}
+
+
+def normalise(serial, plate):
+    return (serial or '').strip().upper(), (plate or '').strip().upper()
+
+
+def consume(serial, plate, now):
+    """UPDATE marking the token used at ``now``. Add ``.returning(...)`` to learn whether it matched."""
+    return (
+        update(Token)
+        .where(Token.serial == serial, Token.vehicle_plate == plate, Token.status == 'active',
+               Token.expiration_date >= now)
+        .values(status='used', used_at=now)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def expire(token_id):
+    return (
+        update(Token).where(Token.id == token_id).values(status='expired')
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rejection(token, plate):
+    """Why ``consume`` matched nothing. ``token`` is the row for the serial (anything with
+    ``vehicle_plate`` and ``status``), or None when the serial is unknown."""
+    if token is None:
+        return 'invalid'
+    if token.vehicle_plate != plate:
+        return 'mismatch'
+    if token.status == 'used':
+        return 'used'
+    return 'expired'
@@ -0,0 +1,78 @@
+"""Data-version watermark used to validate cached pages and reports.
+
+Vehicle logs are append-only, so a new log changes the highest
+``vehicle_logs.id``. Ids are handed out when a row is inserted, not when it
+commits, though: a concurrent entry, a group commit or a long import can
+commit *below* an id that is already visible, leaving the maximum unchanged.
+The watermark therefore also counts the rows among the last
+``WATERMARK_TAIL_IDS`` ids. A late commit lands inside that window unless
+more than that many rows committed above it first, and the count is one
+short index range scan. Reference data (company and cargo type names, cargo
+prices) is tiny and hashed in full into a separate version, together with the cold archive's manifest
+version (archiving moves rows without adding any).
+"""
+import hashlib
+from collections import namedtuple
+
+from flask import g, has_app_context, current_app
+from sqlalchemy import func, select
+
+from models import db, VehicleLog, CompanyProfile, CargoType
+
+
+DEFAULT_TAIL_IDS = 10_000
+
+
+class Watermark(namedtuple('Watermark', 'log_id log_time recent reference')):
+    __slots__ = ()
+
+    def etag(self, *parts):
+        """Strong ETag for a view derived from this watermark and ``parts``."""
+        digest = hashlib.sha1(repr((tuple(self), parts)).encode('utf-8'))
+        return digest.hexdigest()
+
+
+def reference_version():
+    """Version of the reference data and the archive manifest, computed once per request."""
+    cached = g.get('reference_version') if has_app_context() else None
+    if cached is not None:
+        return cached
+    # Names, not just a count: reports and pages show them, so a rename must change the version
+    companies = db.session.execute(
+        select(CompanyProfile.id, CompanyProfile.user_id, CompanyProfile.company_name).order_by(CompanyProfile.id)
+    ).all()
+    cargo = db.session.execute(
+        select(CargoType.id, CargoType.name, CargoType.price).order_by(CargoType.id)
+    ).all()
+    archive = current_app.extensions.get('archive') if has_app_context() else None
+    archived = archive.version if archive else 0
+    version = hashlib.sha1(repr(([tuple(c) for c in companies], [tuple(c) for c in cargo], archived)).encode('utf-8')).hexdigest()[:16]
+    if has_app_context():
+        g.reference_version = version
+    return version
+
+
+def data_watermark():
+    """Current watermark, computed once per request."""
+    cached = g.get('data_watermark') if has_app_context() else None
+    if cached is not None:
+        return cached
+
+    latest = db.session.execute(
+        select(VehicleLog.id, VehicleLog.timestamp).order_by(VehicleLog.id.desc()).limit(1)
+    ).first()
+    recent = 0
+    if latest:
+        tail = current_app.config.get('WATERMARK_TAIL_IDS', DEFAULT_TAIL_IDS)
+        recent = db.session.execute(
+            select(func.count(VehicleLog.id)).where(VehicleLog.id > latest.id - tail)
+        ).scalar()
+    watermark = Watermark(
+        log_id=latest.id if latest else 0,
+        log_time=latest.timestamp if latest else None,
+        recent=recent,
+        reference=reference_version(),
+    )
+    if has_app_context():
+        g.data_watermark = watermark
+    return watermark
@@ -0,0 +1,100 @@
+"""Test fixtures: the app on a throwaway SQLite database.
+
+Run from the repository root::
+
+    python -m pytest tests
+
+Mail goes to the ``memory`` backend, no background sender is started and
+live events stay in-process, so nothing here needs a network service.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from itertools import count
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TMP = tempfile.mkdtemp()
+os.environ['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(TMP, 'test.db')
+os.environ['ARCHIVE_DIR'] = os.path.join(TMP, 'archive')
+os.environ['STATEMENTS_DIR'] = os.path.join(TMP, 'statements')
+os.environ['STATEMENT_WORKERS'] = '1'
+os.environ['SECRET_KEY'] = 'test'
+os.environ['MAIL_BACKEND'] = 'memory'
+os.environ['MAIL_SENDER_THREAD'] = '0'
+os.environ['EVENTS_BACKEND'] = 'local'
+os.environ['INGEST_MODE'] = 'sync'
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app as flask_app  # noqa: E402
+from models import db, User, CargoType, Token  # noqa: E402
+
+PASSWORD = 'test123'
+ADMIN_PHONE, ADMIN_PASSWORD = '0973939888', 'admin123'
+_serials = count(1)
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    return flask_app
+
+
+def _user(app, role, phone):
+    with app.app_context():
+        user = User.query.filter_by(phone=phone).first()
+        if user is None:
+            user = User(role=role, phone=phone, email=f'{phone}@example.test',
+                        password_hash=generate_password_hash(PASSWORD))
+            db.session.add(user)
+            db.session.commit()
+        return user.id
+
+
+@pytest.fixture(scope='session')
+def admin_client(app):
+    client = app.test_client()
+    response = client.post('/login', data={'phone': ADMIN_PHONE, 'password': ADMIN_PASSWORD})
+    assert response.status_code == 302, "admin login failed"
+    return client
+
+
+@pytest.fixture(scope='session')
+def company_id(app):
+    return _user(app, 'company', '100')
+
+
+@pytest.fixture
+def login(app):
+    """Factory for a test client logged in as a new or existing officer with ``phone``."""
+    def make(phone):
+        _user(app, 'officer', phone)
+        client = app.test_client()
+        response = client.post('/login', data={'phone': phone, 'password': PASSWORD})
+        assert response.status_code == 302, "test login failed"
+        return client
+    return make
+
+
+@pytest.fixture
+def make_token(app, company_id):
+    """Factory for an active token; returns ``(serial, plate)``."""
+    def make(expires_in=timedelta(days=1)):
+        with app.app_context():
+            cargo = CargoType.query.first()
+            if cargo is None:
+                cargo = CargoType(name='General', price=50.0)
+                db.session.add(cargo)
+                db.session.flush()
+            number = next(_serials)
+            token = Token(serial=f'T{number:07d}', vehicle_plate=f'TEST {number:04d}', cargo_type_id=cargo.id,
+                          price=cargo.price, expiration_date=datetime.utcnow() + expires_in, company_id=company_id)
+            db.session.add(token)
+            db.session.commit()
+            return token.serial, token.vehicle_plate
+    return make
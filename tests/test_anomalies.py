@@ -0,0 +1,87 @@
+"""Anomaly detector (services/anomalies.py): event-time eviction, duplicate events and replay."""
+from datetime import datetime, timedelta
+
+from models import db, VehicleLog
+from services.anomalies import AnomalyDetector
+
+START = datetime(2022, 3, 1, 8)
+
+
+def _log(log_id, minutes, checkpoint, plate='ANO 1', token_serial=None):
+    return {'type': 'vehicle_log', 'id': log_id, 'number_plate': plate, 'checkpoint': checkpoint,
+            'timestamp': (START + timedelta(minutes=minutes)).isoformat(), 'token_serial': token_serial}
+
+
+def _detector():
+    return AnomalyDetector({'North|South': 60}, default_travel_minutes=0)
+
+
+def test_impossible_travel_is_raised_once():
+    detector = _detector()
+    assert detector.observe(_log(1, 0, 'North')) == []
+    [alert] = detector.observe(_log(2, 20, 'South'))
+    assert (alert.kind, alert.first.log_id, alert.second.log_id) == ('impossible_travel', 1, 2)
+
+    # The same log again (replay racing the live feed) is skipped
+    assert detector.observe(_log(2, 20, 'South')) == []
+    assert len(detector.alerts()) == 1
+
+
+def test_sightings_leave_the_window_by_event_time():
+    detector = _detector()
+    detector.observe(_log(1, 0, 'North'))
+    detector.observe(_log(2, 30, 'North', plate='ANO 2'))
+    assert detector.stats()['sightings'] == 2
+
+    detector.observe(_log(3, 200, 'North', plate='ANO 3'))
+    assert detector.stats()['sightings'] == 1
+    # Far enough apart in event time, however close they arrive
+    assert detector.observe(_log(4, 210, 'South')) == []
+
+
+def test_late_sighting_is_kept_in_event_order():
+    detector = _detector()
+    detector.observe(_log(1, 100, 'North'))
+    # Back-dated, but still inside the window behind the newest event
+    [alert] = detector.observe(_log(2, 70, 'South'))
+    assert (alert.first.log_id, alert.second.log_id) == (2, 1)
+    assert [s.log_id for s in detector._plates['ANO1']] == [2, 1]
+
+    # Moving the window past the late sighting evicts it and keeps the newer one
+    detector.observe(_log(3, 135, 'North', plate='ANO 9'))
+    assert [s.log_id for s in detector._plates['ANO1']] == [1]
+
+
+def test_sighting_older_than_the_window_is_checked_not_kept():
+    detector = _detector()
+    detector.observe(_log(1, 300, 'North'))
+    detector.observe(_log(2, 0, 'North', plate='ANO 2'))
+    assert 'ANO2' not in detector._plates
+    assert detector.stats()['sightings'] == 1
+
+
+def test_token_on_two_logs():
+    detector = _detector()
+    detector.observe(_log(1, 0, 'North', plate='ANO 4', token_serial='T-1'))
+    [alert] = detector.observe(_log(2, 500, 'North', plate='ANO 5', token_serial='T-1'))
+    assert (alert.kind, alert.token_serial) == ('token_reuse', 'T-1')
+
+
+def test_replay_raises_alerts_from_history(app):
+    now = datetime.utcnow().replace(microsecond=0)
+    with app.app_context():
+        rows = [VehicleLog(number_plate='REPLAY 1', checkpoint='North', timestamp=now - timedelta(minutes=50)),
+                VehicleLog(number_plate='replay-1', checkpoint='South', timestamp=now - timedelta(minutes=30))]
+        db.session.add_all(rows)
+        db.session.commit()
+        ids = [row.id for row in rows]
+
+        detector = _detector()
+        raised = [a for a in detector.rebuild() if a.plate == 'REPLAY1']
+        assert [(a.first.log_id, a.second.log_id) for a in raised] == [tuple(ids)]
+
+        # The live feed delivering the same logs again raises nothing new
+        assert detector.observe({'type': 'vehicle_log', 'id': ids[1], 'number_plate': 'REPLAY 1',
+                                 'checkpoint': 'South', 'timestamp': rows[1].timestamp.isoformat()}) == []
+        assert detector.replay(now - timedelta(hours=1)) == []
+        db.session.remove()
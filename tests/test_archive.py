@@ -0,0 +1,131 @@
+"""Cold archive (services/archive.py): archived months answer exactly as they did while hot."""
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from models import db, VehicleLog
+
+QUERIES = [
+    '',
+    'year=2019',
+    'year=2019&month=3',
+    'month=4',
+    'date=2019-03-05',
+    'hour=10',
+    'year=2019&checkpoint=North',
+    'year=2019&company_id={company_id}',
+]
+VIEWS = ['totals', 'series/company', 'series/checkpoint', 'heatmap', 'logs?per_page=7&page=1',
+         'logs?per_page=7&page=3']
+
+
+@pytest.fixture(scope='module')
+def seeded(app, company_id):
+    rng = random.Random(36)
+    with app.app_context():
+        for month in (3, 4):
+            for i in range(40):
+                db.session.add(VehicleLog(
+                    number_plate=f'AR {month}{i:03d}', company_id=rng.choice([company_id, None]),
+                    checkpoint=rng.choice(['North', 'South', None]),
+                    amount_paid=rng.choice([25.0, 40.5, None]),
+                    timestamp=datetime(2019, month, 1) + timedelta(hours=rng.randrange(28 * 24))))
+        db.session.commit()
+    return company_id
+
+
+def _snapshot(admin_client, company_id):
+    answers = {}
+    for query in QUERIES:
+        query = query.format(company_id=company_id)
+        for view in VIEWS:
+            url = f'/api/v1/{view}' + ('&' if '?' in view else '?') + query
+            response = admin_client.get(url)
+            assert response.status_code == 200, url
+            payload = response.get_json()
+            payload.pop('watermark', None)
+            answers[url] = payload
+    return answers
+
+
+def _archive(app, month):
+    log_archive = app.extensions['archive']
+    with app.app_context():
+        with db.engine.begin() as conn:
+            key, entry = log_archive.archive_month(conn, month)
+        log_archive.commit_month(key, entry)
+    return entry
+
+
+def _hot_rows(app, month):
+    start = datetime.combine(month, datetime.min.time())
+    with app.app_context():
+        return db.session.execute(select(func.count(VehicleLog.id)).where(
+            VehicleLog.timestamp >= start, VehicleLog.timestamp < start + timedelta(days=31))).scalar()
+
+
+def test_archived_months_answer_like_hot_ones(app, admin_client, seeded):
+    before = _snapshot(admin_client, seeded)
+
+    assert _archive(app, date(2019, 3, 1))['rows'] == 40
+    assert _archive(app, date(2019, 4, 1))['rows'] == 40
+    assert _hot_rows(app, date(2019, 3, 1)) == _hot_rows(app, date(2019, 4, 1)) == 0
+
+    after = _snapshot(admin_client, seeded)
+    for url, payload in before.items():
+        assert after[url] == payload, url
+
+
+def test_row_committed_during_archiving_stays_hot(app, monkeypatch):
+    month = date(2019, 5, 1)
+    with app.app_context():
+        db.session.add_all(VehicleLog(number_plate=f'EARLY {i}', timestamp=datetime(2019, 5, 2, i))
+                           for i in range(5))
+        db.session.commit()
+    log_archive = app.extensions['archive']
+    save_manifest = log_archive._save_manifest
+
+    def late_entry(manifest):
+        # Another connection commits into the month after it was read, before its rows are removed
+        if 'pending' in manifest and manifest['pending']:
+            with db.engine.begin() as conn:
+                conn.execute(VehicleLog.__table__.insert().values(number_plate='LATE', timestamp=datetime(2019, 5, 9)))
+        save_manifest(manifest)
+    monkeypatch.setattr(log_archive, '_save_manifest', late_entry)
+
+    assert _archive(app, month)['rows'] == 5
+    with app.app_context():
+        assert VehicleLog.query.filter_by(number_plate='LATE').count() == 1
+        assert VehicleLog.query.filter(VehicleLog.number_plate.like('EARLY %')).count() == 0
+
+
+def test_reconcile_drops_a_month_that_rolled_back(app):
+    month = date(2019, 6, 1)
+    with app.app_context():
+        db.session.add(VehicleLog(number_plate='ROLLBACK', timestamp=datetime(2019, 6, 3)))
+        db.session.commit()
+        log_archive = app.extensions['archive']
+        with pytest.raises(RuntimeError):
+            with db.engine.begin() as conn:
+                log_archive.archive_month(conn, month)
+                raise RuntimeError('crash before commit')
+        assert '2019-06' in log_archive.manifest['pending']
+        with db.engine.begin() as conn:
+            log_archive.reconcile(conn)
+        assert '2019-06' not in log_archive.manifest['pending']
+        assert '2019-06' not in log_archive.manifest['months']
+    assert _hot_rows(app, month) == 1
+
+
+def test_archived_years_and_checkpoints_stay_in_the_filters(app, admin_client):
+    with app.app_context():
+        db.session.add(VehicleLog(number_plate='OLD', checkpoint='Archived Only', timestamp=datetime(2018, 1, 5)))
+        db.session.commit()
+    _archive(app, date(2018, 1, 1))
+
+    options = admin_client.get('/api/v1/filters').get_json()
+    assert 2018 in options['years']
+    assert 'Archived Only' in options['checkpoints']
+    assert options['checkpoints'] == sorted(options['checkpoints'])
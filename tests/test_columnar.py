@@ -0,0 +1,110 @@
+"""Analytics cache (services/columnar.py): refresh, late commits into gaps and holes that never fill."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, func, select
+
+from models import db, VehicleLog
+from services.columnar import ColumnarCache
+from services.log_filter import LogFilter
+
+CHECKPOINT = 'Columnar Test'
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+        db.session.remove()
+
+
+@pytest.fixture
+def statements(ctx):
+    """SQL statements run while the fixture is active, as lowercased strings."""
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement.lower())
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield seen
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def _insert(log_id, amount=10.0):
+    db.session.execute(VehicleLog.__table__.insert().values(
+        id=log_id, number_plate=f'COL {log_id}', checkpoint=CHECKPOINT, amount_paid=amount,
+        timestamp=datetime(2021, 7, 1, 12)))
+    db.session.commit()
+
+
+def _base():
+    # Leave room below for the gaps each test makes
+    return (db.session.execute(select(func.max(VehicleLog.id))).scalar() or 0) + 100
+
+
+def _totals(cache):
+    return cache.totals(LogFilter(checkpoint=CHECKPOINT))
+
+
+def test_refresh_appends_new_rows(ctx):
+    base = _base()
+    cache = ColumnarCache(64 * 1024 * 1024, tail_ids=50)
+    _insert(base)
+    assert cache.refresh(db.session)
+    assert cache.watermark == base
+    count, revenue = _totals(cache)
+
+    _insert(base + 1, amount=5.0)
+    assert cache.refresh(db.session)
+    assert _totals(cache) == (count + 1, revenue + 5.0)
+
+
+def test_late_commit_below_the_watermark_is_picked_up(ctx):
+    base = _base()
+    cache = ColumnarCache(64 * 1024 * 1024, tail_ids=50)
+    _insert(base)
+    _insert(base + 2)
+    cache.refresh(db.session)
+    assert base + 1 in cache.gaps
+    count, _ = _totals(cache)
+
+    # base + 1 was allocated first but commits after base + 2 was cached
+    _insert(base + 1)
+    assert cache.refresh(db.session)
+    assert base + 1 not in cache.gaps
+    assert cache.watermark == base + 2
+    assert _totals(cache)[0] == count + 1
+
+
+def test_unfilled_holes_cost_one_count_per_refresh(ctx, statements):
+    base = _base()
+    cache = ColumnarCache(64 * 1024 * 1024, tail_ids=50)
+    for log_id in range(base, base + 40, 4):
+        _insert(log_id)
+    cache.refresh(db.session)
+    assert len(cache.gaps) >= 27
+
+    statements.clear()
+    assert cache.refresh(db.session)
+    # The tail count and the probe above the watermark; no IN list of gap ids, no re-read of the window
+    assert len(statements) == 2
+    assert not any(' in (' in statement for statement in statements)
+
+
+def test_gaps_leave_the_window(ctx):
+    base = _base()
+    cache = ColumnarCache(64 * 1024 * 1024, tail_ids=10)
+    _insert(base)
+    _insert(base + 2)
+    cache.refresh(db.session)
+    assert base + 1 in cache.gaps
+
+    _insert(base + 30)
+    cache.refresh(db.session)
+    assert cache.gaps and min(cache.gaps) > base + 20
+
+
+def test_overflow_falls_back_to_sql(ctx):
+    base = _base()
+    _insert(base)
+    assert not ColumnarCache(1, tail_ids=10).refresh(db.session)
@@ -0,0 +1,96 @@
+"""Group commit writer (services/ingest.py)."""
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from models import db, VehicleLog
+from services import ingest
+
+
+@pytest.fixture
+def group_writer(app, monkeypatch):
+    """A writer whose groups are recorded in ``writer.groups`` as lists of row sizes."""
+    def make(size=4, window_ms=500, queue_size=100, ack_timeout=10):
+        monkeypatch.setitem(app.config, 'INGEST_GROUP_SIZE', size)
+        monkeypatch.setitem(app.config, 'INGEST_GROUP_WINDOW_MS', window_ms)
+        monkeypatch.setitem(app.config, 'INGEST_QUEUE_SIZE', queue_size)
+        monkeypatch.setitem(app.config, 'INGEST_ACK_TIMEOUT', ack_timeout)
+        writer = ingest.GroupCommitWriter(app)
+        writer.groups = []
+        commit = writer._commit
+
+        def recording_commit(engine, group):
+            writer.groups.append(len(group))
+            return commit(engine, group)
+        writer._commit = recording_commit
+        return writer
+    return make
+
+
+def _row(plate):
+    return dict(number_plate=plate, company_id=None, phone='0970000000', email='driver@example.test',
+                location='Test', checkpoint='North', amount_paid=10.0, officer_id=None, timestamp=datetime.utcnow())
+
+
+def _submit_together(writer, rows):
+    """Submit every row from its own thread at once; returns each row's id or exception."""
+    results = [None] * len(rows)
+    start = threading.Barrier(len(rows))
+
+    def submit(i):
+        start.wait()
+        try:
+            results[i] = writer.submit(rows[i])
+        except Exception as exc:
+            results[i] = exc
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(rows))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    return results
+
+
+def test_group_is_acknowledged_after_one_commit(app, group_writer):
+    writer = group_writer(size=4)
+    ids = _submit_together(writer, [_row(f'GROUP {i}') for i in range(4)])
+
+    assert writer.groups == [4]
+    assert all(isinstance(log_id, int) for log_id in ids) and len(set(ids)) == 4
+    with app.app_context():
+        plates = dict(db.session.query(VehicleLog.id, VehicleLog.number_plate).filter(VehicleLog.id.in_(ids)))
+    assert plates == {log_id: f'GROUP {i}' for i, log_id in enumerate(ids)}
+
+
+def test_failed_group_is_retried_row_by_row(app, group_writer):
+    writer = group_writer(size=3)
+    rows = [_row('SPLIT 0'), _row(None), _row('SPLIT 2')]
+    results = _submit_together(writer, rows)
+
+    assert writer.groups == [3, 1, 1, 1]
+    assert isinstance(results[1], IntegrityError)
+    good = [results[0], results[2]]
+    assert all(isinstance(log_id, int) for log_id in good)
+    with app.app_context():
+        assert db.session.query(VehicleLog).filter(VehicleLog.id.in_(good)).count() == 2
+
+
+def test_full_queue_falls_back_to_the_caller(group_writer, monkeypatch):
+    writer = group_writer(queue_size=1)
+    # No writer thread, so the queue stays full
+    monkeypatch.setattr(writer, 'start', lambda: None)
+    writer._queue.put_nowait(ingest._Pending(_row('QUEUED')))
+
+    with pytest.raises(ingest.IngestUnavailable):
+        writer.submit(_row('OVERFLOW'))
+
+
+def test_unacknowledged_row_times_out(group_writer, monkeypatch):
+    writer = group_writer(ack_timeout=0.05)
+    monkeypatch.setattr(writer, 'start', lambda: None)
+
+    with pytest.raises(TimeoutError):
+        writer.submit(_row('STUCK'))
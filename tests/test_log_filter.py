@@ -0,0 +1,68 @@
+"""LogFilter (services/log_filter.py): the cached lambda statement against the plain criteria."""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from models import db, VehicleLog
+from services.log_filter import LogFilter
+
+CHECKPOINT = 'Filter Test'
+TIMES = [datetime(2023, 12, 31, 23, 30), datetime(2024, 5, 2, 8), datetime(2024, 5, 3, 10),
+         datetime(2024, 5, 3, 17), datetime(2024, 6, 1, 0), datetime(2025, 5, 3, 10)]
+
+COMBINATIONS = [
+    {},
+    {'year': 2024},
+    {'year': 2024, 'month': 5},
+    {'date': '2024-05-03'},
+    {'year': 2024, 'date': '2024-05-03'},
+    {'year': 2023, 'date': '2024-05-03'},
+    {'year': 2024, 'month': 5, 'date': '2024-05-03'},
+    {'year': 2024, 'month': 6, 'date': '2024-05-03'},
+    {'year': 2024, 'month': 12, 'date': '2023-12-31'},
+    {'month': 5},
+    {'month': 5, 'date': '2025-05-03'},
+    {'year': 2024, 'month': 5, 'hour': 10},
+]
+
+
+@pytest.fixture(scope='module')
+def logs(app):
+    with app.app_context():
+        db.session.add_all(VehicleLog(number_plate=f'LF {i}', checkpoint=CHECKPOINT, timestamp=ts)
+                           for i, ts in enumerate(TIMES))
+        db.session.commit()
+    return TIMES
+
+
+def _expected(filters):
+    return sum(filters.matches({'company_id': None, 'checkpoint': CHECKPOINT, 'timestamp': ts}) for ts in TIMES)
+
+
+@pytest.mark.parametrize('values', COMBINATIONS, ids=repr)
+def test_select_matches_criteria(app, logs, values):
+    filters = LogFilter(checkpoint=CHECKPOINT, **values)
+    with app.app_context():
+        # Twice, so the second run goes through the cached statement
+        for _ in range(2):
+            selected = db.session.execute(filters.select(lambda: select(func.count(VehicleLog.id)))).scalar()
+            criteria = db.session.query(VehicleLog).filter(*filters.criteria()).count()
+            assert selected == criteria == _expected(filters)
+
+
+def test_cached_shape_takes_new_bounds(app, logs):
+    counts = []
+    with app.app_context():
+        for date in ('2024-05-03', '2024-05-02', '2024-05-04'):
+            filters = LogFilter(checkpoint=CHECKPOINT, year=2024, month=5, date=date)
+            counts.append(db.session.execute(filters.select(lambda: select(func.count(VehicleLog.id)))).scalar())
+    assert counts == [2, 1, 0]
+
+
+def test_time_range_is_the_intersection():
+    assert LogFilter(year=2024, month=5, date='2024-05-03').time_range() == \
+        (datetime(2024, 5, 3), datetime(2024, 5, 4))
+    start, end = LogFilter(year=2023, date='2024-05-03').time_range()
+    assert start >= end
+    assert LogFilter(month=5).time_range() is None
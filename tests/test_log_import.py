@@ -0,0 +1,33 @@
+"""Bulk log import (services/log_import.py): row errors are capped in memory but reported in full."""
+import csv
+import io
+
+from models import db, VehicleLog
+from services import log_import
+
+
+def _csv(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['Number Plate', 'Checkpoint', 'Amount Paid', 'Timestamp'])
+    writer.writerows(rows)
+    return io.BytesIO(out.getvalue().encode())
+
+
+def test_errors_beyond_the_cap_are_counted_and_reported(app, monkeypatch):
+    monkeypatch.setattr(log_import, 'ERRORS_KEPT', 5)
+    rows = [[f'IMP {i}', 'Import Test', 'lots', '2021-08-01 10:00'] for i in range(12)]
+    rows.insert(3, ['IMP OK', 'Import Test', '25', '2021-08-01 10:00'])
+    with app.app_context():
+        result = log_import.import_logs(_csv(rows), 'logs.csv', dry_run=True)
+
+        assert (result.rows, result.imported, result.skipped) == (13, 1, 12)
+        assert [error.row for error in result.errors] == [2, 3, 4, 6, 7]
+        report = io.StringIO()
+        result.error_report(report)
+        lines = list(csv.reader(io.StringIO(report.getvalue())))
+        assert lines[0] == ['Row', 'Error', 'Values']
+        assert [int(line[0]) for line in lines[1:]] == [2, 3, 4] + list(range(6, 15))
+        assert "invalid amount 'lots'" in lines[-1][1]
+        assert VehicleLog.query.filter_by(checkpoint='Import Test').count() == 0
+        db.session.remove()
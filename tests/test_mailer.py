@@ -0,0 +1,106 @@
+"""Email outbox (services/mailer.py) on the memory backend."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, EmailOutbox
+from services import mailer as outbox
+
+
+class FailingTransport:
+    def send(self, message):
+        raise ConnectionRefusedError('relay down')
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def mailer(app):
+    with app.app_context():
+        EmailOutbox.query.delete()
+        db.session.commit()
+        mailer = app.extensions['mailer']
+        mailer.sent.clear()
+        yield mailer
+        db.session.remove()
+
+
+def _row(status='pending', due=timedelta(0), claimed=None, attempts=0):
+    now = datetime.utcnow()
+    row = EmailOutbox(to_address='ops@example.test', subject=status, status=status, attempts=attempts,
+                      next_attempt_at=now + due, claimed_at=now - claimed if claimed is not None else None)
+    db.session.add(row)
+    db.session.commit()
+    return row.id
+
+
+def test_claim_takes_due_and_abandoned_rows(mailer):
+    due = _row()
+    _row(due=timedelta(minutes=5))
+    _row('sending', claimed=timedelta(minutes=1))
+    abandoned = _row('sending', claimed=mailer.claim_timeout + timedelta(minutes=1))
+    _row('sent')
+    _row('failed')
+
+    claimed = mailer._claim()
+
+    assert sorted(row.id for row in claimed) == sorted([due, abandoned])
+    assert {row.status for row in claimed} == {'sending'}
+    # Only the abandoned delivery counts as an attempt
+    assert {row.id: row.attempts for row in claimed} == {due: 0, abandoned: 1}
+    assert mailer._claim() == []
+
+
+def test_claim_outlasts_a_full_batch_of_slow_sends(mailer):
+    smtp = outbox.SMTPTransport('localhost', 25)
+    assert outbox.Mailer(mailer.app, smtp).claim_timeout >= timedelta(seconds=outbox.BATCH_SIZE * smtp.timeout)
+
+
+def test_message_that_keeps_stopping_the_sender_fails(mailer):
+    stale = mailer.claim_timeout + timedelta(minutes=1)
+    last = _row('sending', claimed=stale, attempts=mailer.max_attempts - 1)
+    retried = _row('sending', claimed=stale, attempts=mailer.max_attempts - 2)
+
+    assert [row.id for row in mailer._claim()] == [retried]
+    row = db.session.get(EmailOutbox, last)
+    assert (row.status, row.attempts) == ('failed', mailer.max_attempts)
+    assert db.session.get(EmailOutbox, retried).attempts == mailer.max_attempts - 1
+
+
+def test_enqueued_message_is_sent_after_commit(mailer):
+    mailer.enqueue('company@example.test', 'Report', body='Attached.', attachment=b'%PDF', attachment_name='r.pdf',
+                   attachment_type='application/pdf')
+    db.session.commit()
+
+    assert mailer.send_due() == 1
+    assert mailer.send_due() == 0
+    [message] = mailer.sent
+    assert message['To'] == 'company@example.test'
+    assert [part.get_filename() for part in message.iter_attachments()] == ['r.pdf']
+    row = EmailOutbox.query.one()
+    assert (row.status, row.attempts, row.attachment) == ('sent', 1, None)
+
+
+def test_failures_back_off_then_give_up(mailer, monkeypatch):
+    monkeypatch.setattr(mailer, 'transport', FailingTransport())
+    row_id = _row()
+
+    for attempt in range(1, mailer.max_attempts + 1):
+        before = datetime.utcnow()
+        assert mailer.send_due() == 1
+        row = db.session.get(EmailOutbox, row_id)
+        assert row.attempts == attempt
+        assert 'ConnectionRefusedError' in row.last_error
+        if attempt < mailer.max_attempts:
+            delay = min(outbox.BACKOFF_BASE_SECONDS * 2 ** (attempt - 1), outbox.BACKOFF_MAX_SECONDS)
+            assert row.status == 'pending'
+            assert before + timedelta(seconds=delay - 1) <= row.next_attempt_at <= datetime.utcnow() + timedelta(seconds=delay)
+            # Not due until the backoff has passed
+            assert mailer.send_due() == 0
+            row.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+
+    assert row.status == 'failed'
+    assert mailer.send_due() == 0
+    assert mailer.sent == []
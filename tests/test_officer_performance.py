@@ -0,0 +1,22 @@
+"""Officer performance page (routes/admin_routes.py)."""
+import pytest
+
+from models import db, User, OfficerProfile
+
+
+@pytest.mark.parametrize('officer', ['abc', '', '1.5'])
+def test_malformed_officer_is_ignored(admin_client, officer):
+    response = admin_client.get(f'/admin/officer_performance?officer={officer}')
+    assert response.status_code == 200
+
+
+def test_selected_officer_stays_selected(app, admin_client, login):
+    login('301')
+    with app.app_context():
+        user = User.query.filter_by(phone='301').one()
+        if user.officer_profile is None:
+            db.session.add(OfficerProfile(user_id=user.id, full_name='Selected Officer'))
+            db.session.commit()
+        officer_id = user.id
+    page = admin_client.get(f'/admin/officer_performance?officer={officer_id}').get_data(True)
+    assert f'value="{officer_id}" selected' in page
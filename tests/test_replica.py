@@ -0,0 +1,87 @@
+"""Read-replica routing (services/replica.py) without a second database: the replica engine is a stand-in."""
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+from flask import g
+from sqlalchemy import select, update
+
+from models import VehicleLog
+from services import replica
+
+REPLICA = object()
+LagRow = namedtuple('LagRow', 'standby lag')
+
+
+@pytest.fixture
+def router(app, monkeypatch):
+    monkeypatch.setattr(replica, 'db', SimpleNamespace(engines={replica.BIND_KEY: REPLICA}))
+    router = replica.ReplicaRouter(app)
+    monkeypatch.setattr(router, '_probe', lambda: 0.0)
+    with app.test_request_context('/'):
+        g.replica_reads = True
+        yield router
+
+
+def _reads(router):
+    return router.route(None, select(VehicleLog.id))
+
+
+def test_fresh_replica_serves_selects(router):
+    assert _reads(router) is REPLICA
+    assert router.route(None, select(VehicleLog.id).with_for_update()) is None
+
+
+def test_only_replica_views_use_it(router):
+    g.replica_reads = False
+    assert _reads(router) is None
+
+
+def test_lagging_or_unreachable_replica_is_skipped(router, monkeypatch):
+    for lag in (router.max_lag + 1, None):
+        monkeypatch.setattr(router, '_probe', lambda: lag)
+        router._checked = None
+        g.pop('replica_engine', None)
+        assert _reads(router) is None
+
+
+def test_write_moves_the_request_and_the_user_to_the_primary(router):
+    assert router.route(None, update(VehicleLog).values(checkpoint='X')) is None
+    assert _reads(router) is None
+
+    router.pin_after_write(None)
+    assert replica.session[replica.PIN_KEY] > time.time()
+    # The user's next request is pinned too
+    g.pop('replica_wrote')
+    g.pop('replica_engine', None)
+    assert _reads(router) is None
+    assert router._choose() == (None, 'pinned')
+
+
+def test_outside_a_request_reads_stay_on_the_primary(app):
+    with app.app_context():
+        assert replica.ReplicaRouter(app).route(None, select(VehicleLog.id)) is None
+
+
+class FakeEngine:
+    def __init__(self, row):
+        self.row = row
+        self.dialect = SimpleNamespace(name='postgresql')
+
+    @contextmanager
+    def connect(self):
+        yield SimpleNamespace(execute=lambda statement: SimpleNamespace(one=lambda: self.row))
+
+
+@pytest.mark.parametrize('row, lag', [
+    (LagRow(False, None), 0.0),   # not a standby
+    (LagRow(True, 0), 0.0),       # streaming and caught up
+    (LagRow(True, 42.5), 42.5),   # behind, or receiver down since a commit 42.5 s ago
+    (LagRow(True, None), None),   # receiver down and nothing replayed
+])
+def test_probe(app, monkeypatch, row, lag):
+    monkeypatch.setattr(replica, 'db', SimpleNamespace(engines={replica.BIND_KEY: FakeEngine(row)}))
+    assert replica.ReplicaRouter(app)._probe() == lag
+
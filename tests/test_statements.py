@@ -0,0 +1,44 @@
+"""Month-end statements (services/statements.py): the saved ZIP is reused only while it is current."""
+import io
+import json
+import os
+import zipfile
+from datetime import datetime
+
+from models import db, VehicleLog
+
+URL = '/admin/statements?month=2020-02&format=pdf'
+
+
+def _manifest(response):
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as bundle:
+        return json.loads(bundle.read('manifest.json'))
+
+
+def _add_log(app, plate, timestamp):
+    with app.app_context():
+        db.session.add(VehicleLog(number_plate=plate, checkpoint='North', amount_paid=30.0, timestamp=timestamp))
+        db.session.commit()
+
+
+def test_saved_zip_is_rebuilt_when_the_month_changes(app, admin_client):
+    _add_log(app, 'ST 1', datetime(2020, 2, 10, 9))
+    first = _manifest(admin_client.get(URL))
+    assert first['vehicles'] == 1
+
+    # Unchanged month: the same file is served
+    path = os.path.join(app.config['STATEMENTS_DIR'], 'statements_2020-02_pdf.zip')
+    written = os.stat(path).st_mtime_ns
+    assert _manifest(admin_client.get(URL))['generated_at'] == first['generated_at']
+    assert os.stat(path).st_mtime_ns == written
+    # Traffic in another month leaves it current
+    _add_log(app, 'ST OTHER', datetime(2020, 3, 1, 9))
+    assert _manifest(admin_client.get(URL))['data_version'] == first['data_version']
+    assert os.stat(path).st_mtime_ns == written
+
+    # A log back-dated into the month makes it stale
+    _add_log(app, 'ST LATE', datetime(2020, 2, 11, 9))
+    rebuilt = _manifest(admin_client.get(URL))
+    assert rebuilt['vehicles'] == 2
+    assert rebuilt['data_version'] != first['data_version']
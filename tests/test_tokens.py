@@ -0,0 +1,109 @@
+"""Single-use tokens: concurrent scans of one token (services/tokens.py)."""
+import threading
+from datetime import datetime, timedelta
+
+from models import db, Token, VehicleLog
+from services import events, tokens
+
+
+def _together(calls):
+    """Run every call from its own thread at once; returns their results in order."""
+    results = [None] * len(calls)
+    start = threading.Barrier(len(calls))
+
+    def run(i):
+        start.wait()
+        results[i] = calls[i]()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(calls))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    return results
+
+
+def test_consume_succeeds_once(app, make_token):
+    with app.app_context():
+        engine = db.engine
+
+    for _ in range(10):
+        serial, plate = make_token()
+
+        def consume():
+            with engine.begin() as conn:
+                return conn.execute(tokens.consume(serial, plate, datetime.utcnow()).returning(Token.id)).first()
+
+        assert sum(row is not None for row in _together([consume, consume])) == 1
+        with app.app_context():
+            assert Token.query.filter_by(serial=serial).one().status == 'used'
+
+
+def test_consume_rejects_with_reason(app, make_token):
+    now = datetime.utcnow()
+    serial, plate = make_token()
+    lapsed, lapsed_plate = make_token(expires_in=timedelta(hours=-1))
+    with app.app_context():
+        for presented, presented_plate, reason in ((serial, 'OTHER', 'mismatch'), ('NOPE', plate, 'invalid'),
+                                                   (lapsed, lapsed_plate, 'expired')):
+            assert db.session.execute(
+                tokens.consume(presented, presented_plate, now).returning(Token.id)).first() is None
+            token = Token.query.filter_by(serial=presented).first()
+            assert tokens.rejection(token, presented_plate) == reason
+        assert db.session.execute(tokens.consume(serial, plate, now).returning(Token.id)).first() is not None
+        assert tokens.rejection(Token.query.filter_by(serial=serial).first(), plate) == 'used'
+        db.session.rollback()
+
+
+def test_two_officers_verify_one_token(login, make_token):
+    serial, plate = make_token()
+    clients = [login('201'), login('202')]
+
+    def verify(client):
+        return lambda: client.post('/token/verify_token', data={'serial': serial, 'vehicle_plate': plate}).get_data(True)
+
+    pages = _together([verify(client) for client in clients])
+
+    assert sorted('valid and marked as used' in page for page in pages) == [False, True]
+    assert sum('already been used' in page for page in pages) == 1
+
+
+def test_two_officers_scan_one_token(app, login, make_token):
+    serial, plate = make_token()
+    clients = [login('203'), login('204')]
+
+    def scan(client):
+        return lambda: client.post('/token/scan', data={'serial': serial, 'vehicle_plate': plate,
+                                                        'checkpoint': 'North'}).status_code
+
+    assert _together([scan(client) for client in clients]) == [302, 302]
+    with app.app_context():
+        assert VehicleLog.query.filter_by(token_serial=serial).count() == 1
+
+
+def _verify(client, serial, plate):
+    return client.post('/token/verify_token', data={'serial': serial, 'vehicle_plate': plate}).get_data(True)
+
+
+def test_verification_reaches_the_live_feed(login, make_token):
+    serial, plate = make_token()
+    client = login('205')
+    feed = events.bus.subscribe()
+    try:
+        assert 'valid and marked as used' in _verify(client, serial, plate)
+        published = [feed.get_nowait() for _ in range(feed.qsize())]
+    finally:
+        events.bus.unsubscribe(feed)
+    assert [(e['type'], e['serial']) for e in published if e['type'] == 'token_verified'] == \
+        [('token_verified', serial)]
+
+
+def test_verification_notifies_in_its_transaction_on_postgres(login, make_token, monkeypatch):
+    # The UPDATE leaves nothing to flush, so the NOTIFY cannot wait for after_flush
+    notified = []
+    monkeypatch.setattr(events.bus, 'backend', 'postgres')
+    monkeypatch.setattr(events, 'notify_in_transaction', lambda conn, payloads: notified.extend(payloads))
+    serial, plate = make_token()
+
+    assert 'valid and marked as used' in _verify(login('206'), serial, plate)
+    assert [(e['type'], e['serial']) for e in notified] == [('token_verified', serial)]
@@ -0,0 +1,26 @@
+"""Data watermark (services/watermark.py): reference data changes invalidate cached pages."""
+from models import db, CompanyProfile
+from services.watermark import reference_version
+
+
+def test_company_rename_changes_the_reference_version(app, admin_client, company_id):
+    with app.app_context():
+        profile = CompanyProfile.query.filter_by(user_id=company_id).first()
+        if profile is None:
+            profile = CompanyProfile(user_id=company_id, company_name='Watermark Haulage', full_name='Test')
+            db.session.add(profile)
+            db.session.commit()
+        profile_id = profile.id
+    etag = admin_client.get('/api/v1/totals').headers['ETag']
+    with app.app_context():
+        before = reference_version()
+
+    with app.app_context():
+        profile = db.session.get(CompanyProfile, profile_id)
+        profile.company_name += ' Ltd'
+        db.session.commit()
+        assert reference_version() != before
+
+    response = admin_client.get('/api/v1/totals', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
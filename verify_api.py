@@ -0,0 +1,37 @@
+"""ASGI entry point for the async token verification API (services/async_verify.py).
+
+    uvicorn verify_api:app --host 0.0.0.0 --port 8001 --workers 2
+
+Uses the Flask app's SQLALCHEMY_DATABASE_URI and SECRET_KEY, so both processes share the tokens and the login.
+"""
+import os
+from datetime import timedelta
+
+from sqlalchemy.engine import make_url
+
+from services.async_verify import VerifyAPI
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _database_uri():
+    uri = os.getenv('SQLALCHEMY_DATABASE_URI')
+    url = make_url(uri)
+    # Flask-SQLAlchemy resolves relative SQLite paths against the instance folder; do the same
+    if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:' \
+            and not os.path.isabs(url.database):
+        url = url.set(database=os.path.join(ROOT, 'instance', url.database))
+    return url.render_as_string(hide_password=False)
+
+
+app = VerifyAPI(
+    _database_uri(),
+    os.getenv('SECRET_KEY'),
+    # Connections per process; every other in-flight verification waits for one without holding a thread
+    pool_size=int(os.getenv('VERIFY_POOL_SIZE', '20')),
+    max_overflow=int(os.getenv('VERIFY_MAX_OVERFLOW', '10')),
+    pool_timeout=float(os.getenv('VERIFY_POOL_TIMEOUT', '30')),
+    cookie_name=os.getenv('SESSION_COOKIE_NAME', 'session'),
+    session_lifetime=timedelta(days=31),
+    events_backend=os.getenv('EVENTS_BACKEND', 'auto'),
+)